@@ -1,13 +1,21 @@
 import os
+import time
 import dotenv
+import asyncio
+import hashlib
 import logging
+import threading
+import bcrypt
 import models
+import metrics
 from dotenv import load_dotenv
 from database import get_db
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, NamedTuple, Optional, Tuple
 from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
@@ -15,16 +23,112 @@ from fastapi import Depends, HTTPException, status
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# bcrypt cost factor for new hashes; existing hashes with another cost are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Dedicated workers so hashing never occupies the event loop or Starlette's threadpool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a worker; beyond that requests get 503 instead of piling up
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+# Processes sidestep the GIL entirely (bcrypt releases it, so threads are the default)
+PASSWORD_HASH_USE_PROCESSES = os.getenv("PASSWORD_HASH_USE_PROCESSES", "false").lower() in ("1", "true", "yes")
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt only uses the first 72 bytes (and bcrypt>=5 rejects longer input)
+    return password.encode("utf-8")[:72]
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds)).decode("ascii")
+
+def _verify(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(_password_bytes(password), hashed_password.encode("ascii"))
+    except ValueError:
+        # Not a bcrypt hash (e.g. the guest placeholder)
+        return False
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed one."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hashes a password."""
-    return pwd_context.hash(password)
+    return _hash(password, BCRYPT_ROUNDS)
+
+def password_needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True for bcrypt hashes ($2b$12$...) made with a different cost factor."""
+    parts = hashed_password.split("$")
+    return len(parts) > 3 and parts[2].isdigit() and int(parts[2]) != rounds
+
+class PasswordHasherBusy(Exception):
+    pass
+
+class BoundedHashExecutor:
+    """
+    Runs bcrypt hash/verify jobs on a dedicated pool. At most
+    workers + queue_limit jobs are admitted at once; submit() raises
+    PasswordHasherBusy instead of queueing without bound.
+    """
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 use_processes: bool = PASSWORD_HASH_USE_PROCESSES):
+        self.workers = workers
+        self.use_processes = use_processes
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        # Created lazily so importing auth does not spawn workers
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+            return self._executor
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.PASSWORD_HASH_REJECTED.inc()
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        with metrics.PASSWORD_HASH_LATENCY.time():
+            return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+PASSWORD_HASHER = BoundedHashExecutor()
+
+def _busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bounded hashing pool; 503 when it is saturated."""
+    try:
+        return await PASSWORD_HASHER.run(_verify, plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _busy_exception()
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the bounded hashing pool; 503 when it is saturated."""
+    try:
+        return await PASSWORD_HASHER.run(_hash, password, BCRYPT_ROUNDS)
+    except PasswordHasherBusy:
+        raise _busy_exception()
 
 SECRET_KEY = os.getenv("SECRET_KEY")  
 ALGORITHM = "HS256"
@@ -42,37 +146,124 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Decodes JWT token and retrieves the corresponding User from the database."""
+# Verified tokens -> (username, exp); entries never outlive the token's own `exp`
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# User rows by username; dropped on update/delete (in this process) and after the TTL
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+class CachedUser(NamedTuple):
+    """Read-only snapshot of a users row, safe to share across requests and sessions."""
+    id: int
+    username: str
+    email: str
+    created_at: Optional[datetime]
+
+class TTLCache:
+    """Small LRU cache whose entries carry their own expiry (time.time() seconds)."""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+TOKEN_CACHE = TTLCache(TOKEN_CACHE_SIZE)
+USER_CACHE = TTLCache(USER_CACHE_SIZE)
+
+def invalidate_user(username: str) -> None:
+    """Drops a cached user; call after changing or deleting the row outside the ORM."""
+    USER_CACHE.pop(username)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_change(mapper, connection, target) -> None:
+    invalidate_user(target.username)
+    # A rename leaves the old key behind
+    history = inspect(target).attrs.username.history
+    for old_username in history.deleted or ():
+        invalidate_user(old_username)
+
+def decode_token_username(token: str) -> Optional[str]:
+    """Returns the `sub` of a valid token (cached until min(exp, TTL)), or None."""
+    key = hashlib.sha256(token.encode()).digest()
+    username = TOKEN_CACHE.get(key)
+    if username is not None:
+        metrics.AUTH_CACHE.labels("token", "hit").inc()
+        return username
+    metrics.AUTH_CACHE.labels("token", "miss").inc()
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    expires_at = min(float(payload.get("exp", 0)), time.time() + TOKEN_CACHE_TTL_SECONDS)
+    TOKEN_CACHE.set(key, username, expires_at)
+    return username
+
+def get_user_by_username(db: Session, username: str) -> Optional[CachedUser]:
+    """User lookup through USER_CACHE; misses use the indexed username column."""
+    user = USER_CACHE.get(username)
+    if user is not None:
+        metrics.AUTH_CACHE.labels("user", "hit").inc()
+        return user
+    metrics.AUTH_CACHE.labels("user", "miss").inc()
+    row = authenticate_user(db, username)
+    if row is None:
+        return None
+    user = CachedUser(row.id, row.username, row.email, row.created_at)
+    USER_CACHE.set(username, user, time.time() + USER_CACHE_TTL_SECONDS)
+    return user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> CachedUser:
+    """
+    Resolves the token's user. Both the JWT check and the user row are
+    cached, so a repeat request normally does no decoding and no DB query.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    try:
-        # Decode the token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = {"username": username}
-    except JWTError:
+
+    username = decode_token_username(token)
+    if username is None:
         raise credentials_exception
-    
-    # Retrieve user from database
-    user = db.query(models.User).filter(models.User.username == token_data["username"]).first()
-    
+
+    user = get_user_by_username(db, username)
     if user is None:
         raise credentials_exception
-        
-    return user
-
-
 
-from typing import Optional 
+    return user
 
-def get_optional_user(token: Optional[str] = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_optional_user(token: Optional[str] = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[CachedUser]:
     """
     Attempts to get the current authenticated user. Returns None if the token is missing or invalid.
     This is suitable for endpoints that are optionally protected.
@@ -80,28 +271,11 @@ def get_optional_user(token: Optional[str] = Depends(oauth2_scheme), db: Session
     if token is None:
         return None  # No token provided, treat as anonymous/guest
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        # Decode the token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None # Token malformed
-        token_data = {"username": username}
-    except JWTError:
-        return None # Token invalid/expired
-    
-    user = db.query(models.User).filter(models.User.username == token_data["username"]).first()
-    
-    if user is None:
-        return None 
-        
-    return user
+    username = decode_token_username(token)
+    if username is None:
+        return None # Token malformed, invalid or expired
+
+    return get_user_by_username(db, username)
 
 def authenticate_user(db: Session, username: str) -> Optional[models.User]:
     """Retrieves a user from the database by username."""
@@ -110,4 +284,4 @@ def authenticate_user(db: Session, username: str) -> Optional[models.User]:
         models.User.username == username
     ).first()
     
-    return user
\ No newline at end of file
+    return user
@@ -1,18 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from database import get_db
-from auth import get_password_hash, verify_password, create_access_token, authenticate_user
+from auth import (
+    get_password_hash_async, verify_password_async, password_needs_rehash,
+    create_access_token, authenticate_user,
+)
 import models, schemas
 
 auth_router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-@auth_router.post("/signup", response_model=schemas.Token)
-def signup_user(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
-    # Check if user already exists
-    db_user = db.query(models.User).filter(
+# The endpoints are async so bcrypt runs on auth.PASSWORD_HASHER (bounded) instead of
+# holding one of Starlette's threadpool workers; the short DB calls still go to the threadpool.
+
+def _find_existing_user(db: Session, user_data: schemas.UserCreate):
+    return db.query(models.User).filter(
         (models.User.email == user_data.email) | (models.User.username == user_data.username)
     ).first()
+
+def _save(db: Session, obj) -> None:
+    db.add(obj)
+    db.commit()
+    db.refresh(obj)
+
+@auth_router.post("/signup", response_model=schemas.Token)
+async def signup_user(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Check if user already exists
+    db_user = await run_in_threadpool(_find_existing_user, db, user_data)
     
     if db_user:
         raise HTTPException(
@@ -21,28 +36,26 @@ def signup_user(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
         )
 
     # Hash the password and create the new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = models.User(
         email=user_data.email,
         username=user_data.username,
         hashed_password=hashed_password
     )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await run_in_threadpool(_save, db, new_user)
 
     # Create and return an access token for automatic login
     access_token = create_access_token(data={"sub": new_user.username})
     return schemas.Token(access_token=access_token)
 
 @auth_router.post("/login", response_model=schemas.Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     # Look up user by username (form_data.username)
-    db_user = authenticate_user(db, form_data.username)
+    db_user = await run_in_threadpool(authenticate_user, db, form_data.username)
     
     if not db_user:
         raise HTTPException(
@@ -63,13 +76,18 @@ def login_for_access_token(
         )
     
     # CRITICAL: HASH VERIFICATION 
-    if not verify_password(form_data.password, db_user.hashed_password):
+    if not await verify_password_async(form_data.password, db_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # BCRYPT_ROUNDS changed since this hash was made: upgrade it while we have the password
+    if password_needs_rehash(db_user.hashed_password):
+        db_user.hashed_password = await get_password_hash_async(form_data.password)
+        await run_in_threadpool(_save, db, db_user)
+
     # If verification passes, create the token
     access_token = create_access_token(
         data={"sub": db_user.username}
@@ -0,0 +1,6 @@
+"""
+Offline benchmarks for the MoMo chatbot backend.
+
+Run from the `backend/` directory, e.g.:
+    python -m benchmarks.bench_formatting
+"""
@@ -0,0 +1,132 @@
+"""
+Golden checks and speed of the answers given without the LLM (fees.py, procedures.py).
+
+Every GOLDEN_FEES message must resolve to the expected (service, fee in FCFA),
+and every GOLDEN_PROCEDURES message to the expected procedure title, or to
+None when it has to go to the LLM: a wrong deterministic answer is worse than
+no answer. Each KB figure is written out here by hand, so a check fails when
+the parser and the KB text disagree. Rendered procedures must be plain text
+(direct answers skip format_response). Then the lookups are timed.
+Exits 1 on any failed check.
+
+Usage (from backend/):
+    python -m benchmarks.bench_direct_answers --repeat 2000
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fees
+import procedures
+from benchmarks.bench_retrieval import percentile
+
+# (message, (service, fee) or None)
+GOLDEN_FEES: List[Tuple[str, Optional[Tuple[str, int]]]] = [
+    ("Combien coûte un transfert de 20000 FCFA ?", ("p2p", 175)),
+    ("How much does it cost to send 10,000 FCFA?", ("p2p", 50)),
+    ("combien pour envoyer 20000 a un non abonne", ("p2c", 750)),
+    ("frais de retrait de 50 000 chez un agent", ("cash_out", 1750)),
+    ("frais depot de 30000", ("cash_in", 0)),
+    ("frais pour payer 15000 chez un marchand momopay", ("momopay", 0)),
+    ("frais pret xtracash 7 jours de 10000", ("xtracash_7d", 1100)),
+    ("frais transfert international de 100000 vers le gabon", ("remittance_cemac", 3500)),
+    # ATM: 3.5% / 5,000 + 1% with a MoMo account, 3.75% / 5,000 + 1% without one
+    ("frais de retrait de 20000 au GAB", ("atm", 700)),
+    ("frais de retrait au GAB de 20000 avec compte momo", ("atm", 700)),
+    ("Frais de retrait de 20000 au GAB sans compte momo", ("atm_no_account", 750)),
+    ("ATM withdrawal fee for 200000 without a MoMo account", ("atm_no_account", 7000)),
+    ("frais GAB de 50 sans compte", None),  # below the 100 FCFA minimum
+    ("frais pour envoyer 20000 et 50000", None),
+    ("frais de transfert", None),
+    ("frais pret xtracash de 10000", None),
+]
+
+
+# (message, procedure title or None)
+GOLDEN_PROCEDURES: List[Tuple[str, Optional[str]]] = [
+    ("code pour payer une facture", "Bill Payment"),
+    ("code pour payer ma facture electricite", "Bill Payment – E²C Electricity Bill"),
+    # Merchant payments: "payer" alone points at Bill Payment, the merchant at Momopay
+    ("code pour payer chez un marchand", "Momopay"),
+    ("how to pay a merchant", "Momopay"),
+    ("code pour payer avec momopay", "Momopay"),
+    ("code pour retirer au gab", "ATM WITHDRAWALS (BAnkTech Integration)"),
+    ("comment acheter du credit", "AIRTIME PURCHASE (Achat Credit)"),
+    ("comment rembourser xtracash", "Xtra Cash – Repayment Process"),
+    ("code pour souscrire a momo advance", "Momo Advance – How to Subscribe to MoMo Advance"),
+    # The PIN reset steps depend on the balance: no single block answers it
+    ("comment changer mon code pin", None),
+    ("how do I change my PIN", None),
+    ("J'ai oublié mon code PIN, comment le réinitialiser ?", None),
+    ("code pour payer canal", None),
+    ("how do I send money", None),
+]
+
+
+def fee_outcome(message: str) -> Optional[Tuple[str, int]]:
+    query, _ = fees.detect_fee_intent(message)
+    if query is None:
+        return None
+    bracket = fees.TARIFFS[query.service].lookup(query.amount) if fees.TARIFFS.get(query.service) else None
+    return (query.service, fees.fee_for(bracket, query.amount)) if bracket else None
+
+
+def procedure_outcome(message: str) -> Optional[str]:
+    procedure, _ = procedures.PROCEDURE_INDEX.match(message)
+    return procedure.title if procedure else None
+
+
+def plain_text_failures() -> int:
+    failures = 0
+    for procedure in procedures.PROCEDURE_INDEX.procedures:
+        for french in (True, False):
+            text = procedures.render_procedure(procedure, french)
+            if "**" in text or "__" in text or text.lstrip().startswith("#"):
+                failures += 1
+                print(f"  FAIL markdown in the rendered {procedure.title!r}")
+    print(f"procedures: {2 * len(procedures.PROCEDURE_INDEX)} renderings checked for markdown")
+    return failures
+
+
+def check(name: str, cases: list, outcome) -> int:
+    failures = 0
+    for message, expected in cases:
+        got = outcome(message)
+        if got != expected:
+            failures += 1
+            print(f"  FAIL {message!r}: expected {expected}, got {got}")
+    print(f"{name}: {len(cases) - failures}/{len(cases)} golden checks pass")
+    return failures
+
+
+def timed(name: str, messages: List[str], answer, repeat: int) -> None:
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            answer(message)
+        timings.append((time.perf_counter() - start) / repeat)
+    print(f"  {name:<26} p50 {percentile(timings, 50) * 1e6:7.1f} µs  p99 {percentile(timings, 99) * 1e6:7.1f} µs")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="timed calls per message")
+    args = parser.parse_args()
+
+    failures = check("fees", GOLDEN_FEES, fee_outcome)
+    failures += check("procedures", GOLDEN_PROCEDURES, procedure_outcome)
+    failures += plain_text_failures()
+    print("\nLatency per message")
+    timed("answer_fee_question", [m for m, _ in GOLDEN_FEES], fees.answer_fee_question, args.repeat)
+    timed("answer_procedure_question", [m for m, _ in GOLDEN_PROCEDURES],
+          procedures.answer_procedure_question, args.repeat)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Upstream work left behind by clients that give up, as during an Azure incident.
+
+Starts the mock Azure server answering every request with 429 + Retry-After
+(so the backend sits in its retry loop) and the backend, sends a burst of
+/chat and /chat/stream requests whose clients hang up after --client-timeout
+seconds, then counts the Azure attempts the backend still makes over the
+next --watch seconds. With disconnect detection that number drops to zero
+and the abandoned requests show up in /metrics.
+
+Usage (from backend/):
+    python -m benchmarks.bench_disconnect --requests 20 --client-timeout 1 --watch 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.queries import LABELLED_QUERIES
+from benchmarks.run_loadtest import backend_command, start_process, wait_until_up
+
+
+async def hang_up(client: httpx.AsyncClient, path: str, message: str, timeout: float) -> None:
+    """Sends one chat request and drops the connection after `timeout` seconds."""
+    async def send():
+        if path.endswith("stream"):
+            async with client.stream("POST", path, json={"message": message}) as resp:
+                async for _ in resp.aiter_bytes():
+                    pass
+        else:
+            await client.post(path, json={"message": message})
+
+    try:
+        await asyncio.wait_for(send(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def burst(base_url: str, requests: int, timeout: float) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        await asyncio.gather(*(
+            hang_up(client, "/chat/stream" if i % 2 else "/chat", LABELLED_QUERIES[i % len(LABELLED_QUERIES)]["query"],
+                    timeout)
+            for i in range(requests)
+        ))
+
+
+def abandoned_metrics(base_url: str) -> list:
+    text = httpx.get(f"{base_url}/metrics").text
+    return [line for line in text.splitlines()
+            if line.startswith(("momochat_abandoned_requests_total", 'momochat_chat_requests_total{outcome="abandoned"'))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="requests in the burst (half streamed)")
+    parser.add_argument("--client-timeout", type=float, default=1.0, help="seconds before each client hangs up")
+    parser.add_argument("--watch", type=float, default=10.0, help="seconds to count Azure attempts afterwards")
+    parser.add_argument("--retry-after", type=int, default=2)
+    parser.add_argument("--mock-port", type=int, default=9120)
+    parser.add_argument("--backend-port", type=int, default=8785)
+    args = parser.parse_args()
+    args.server, args.workers = "uvicorn", 1
+    base_url = f"http://127.0.0.1:{args.backend_port}"
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+
+    with tempfile.TemporaryDirectory(prefix="momochat-disconnect-") as tmp:
+        env = dict(os.environ)
+        env.update({
+            "AZURE_OPENAI_ENDPOINT": mock_url,
+            "AZURE_OPENAI_API_KEY": "mock-key",
+            "DATABASE_URL": f"sqlite:///{Path(tmp) / 'bench.db'}",
+            "QUICK_ANSWERS_DB": str(Path(tmp) / "quick_answers.db"),
+            "QUICK_ANSWERS_ENABLED": "false",
+            "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+            "RATE_LIMIT_ENABLED": "false",
+            "RESPONSE_CACHE_TTL_SECONDS": "0",
+        })
+        processes = []
+        try:
+            processes.append(start_process([
+                "-m", "benchmarks.mock_azure", "--port", str(args.mock_port), "--latency", "fixed:0.05",
+                "--rate-429", "1", "--retry-after", str(args.retry_after),
+            ], env))
+            processes.append(start_process(backend_command(args), env))
+            wait_until_up(f"{mock_url}/stats")
+            wait_until_up(f"{base_url}/ping")
+
+            asyncio.run(burst(base_url, args.requests, args.client_timeout))
+            after_hangup = httpx.get(f"{mock_url}/stats").json().get("requests", 0)
+            time.sleep(args.watch)
+            after_watch = httpx.get(f"{mock_url}/stats").json().get("requests", 0)
+
+            print(f"{args.requests} requests, clients hung up after {args.client_timeout:.1f}s "
+                  f"(Azure answering 429, Retry-After {args.retry_after}s)")
+            print(f"  Azure attempts while clients waited: {after_hangup}")
+            print(f"  Azure attempts in the {args.watch:.0f}s after they left: {after_watch - after_hangup}")
+            for line in abandoned_metrics(base_url):
+                print(f"  {line}")
+        finally:
+            for proc in reversed(processes):
+                proc.terminate()
+            for proc in processes:
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+if __name__ == "__main__":
+    main()
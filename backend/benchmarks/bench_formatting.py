@@ -0,0 +1,155 @@
+"""
+Benchmarks `formatting.format_response` against the former two-step
+post-processing (`strip_markdown` + `enforce_list_indentation`).
+
+Before timing, every sample (and a chunked replay through StreamingFormatter)
+is checked for byte-identical output against the legacy functions.
+
+Usage (from backend/):
+    python -m benchmarks.bench_formatting --sizes 2000 20000 200000 --repeat 20
+"""
+import re
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from formatting import format_response, StreamingFormatter
+
+
+# --- Legacy implementations (reference output) ---
+def strip_markdown(text: str) -> str:
+    text = text.replace('***', '').replace('**', '')
+    text = text.replace('###', '').replace('##', '')
+    text = text.replace(' ```', '').replace('``', '')
+    text = text.replace('__', '').replace('_', '')
+
+    lines = text.splitlines()
+    new_lines = []
+    for line in lines:
+        line = re.sub(r'^\s*[#=>]\s*', '', line).strip()
+        new_lines.append(line)
+    text = '\n'.join(new_lines)
+
+    return text.strip()
+
+
+def enforce_list_indentation(text: str) -> str:
+    lines = text.splitlines()
+    new_lines = []
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            new_lines.append("")
+            continue
+        if stripped.startswith('❖'):
+            new_lines.append(f"❖ {stripped[1:].strip()}")
+            continue
+        if stripped.startswith('◦'):
+            new_lines.append(f"        ◦ {stripped[1:].strip()}")
+            continue
+        if stripped.startswith('•'):
+            new_lines.append(f"    • {stripped[1:].strip()}")
+            continue
+        new_lines.append(line)
+
+    return '\n'.join(new_lines)
+
+
+def legacy_format(text: str) -> str:
+    return enforce_list_indentation(strip_markdown(text))
+
+
+# --- Sample replies ---
+SAMPLE_REPLY = """### Voici un aperçu des **services MTN MoMo** :
+
+❖ **Transferts P2P**
+  • Composez *105# → option 1.
+    ◦ 251 – 11,000 FCFA → 50 FCFA
+    ◦ 11,001 – 15,000 FCFA → 150 FCFA
+* **MoMoPay** : payez chez les marchands sans frais.
+> Astuce : gardez votre __code PIN__ secret.
+==========
+```
+*105# → 7 → 1
+```
+Don't worry, your funds are safe!
+
+"""
+
+NOISE = list("*#`_ abc=>❖•◦\n\r\t") + ["\r\n", "**", "```", " ```", "###", "__"]
+
+
+def golden_samples(seed: int = 7, count: int = 5000) -> list:
+    rng = random.Random(seed)
+    samples = [SAMPLE_REPLY, "", "\n\n", "   ❖   x  ", "\r###\n", SAMPLE_REPLY.replace("\n", "\r\n")]
+    for _ in range(count):
+        samples.append("".join(rng.choice(NOISE) for _ in range(rng.randint(0, 60))))
+    return samples
+
+
+def streamed(text: str, rng: random.Random) -> str:
+    formatter = StreamingFormatter()
+    out = []
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 12)
+        out.append(formatter.feed(text[pos:pos + step]))
+        pos += step
+    out.append(formatter.finish())
+    return "".join(out)
+
+
+def check_equivalence() -> int:
+    rng = random.Random(11)
+    samples = golden_samples()
+    for text in samples:
+        expected = legacy_format(text)
+        got = format_response(text)
+        if got != expected:
+            raise AssertionError(f"format_response mismatch for {text!r}:\n{expected!r}\n!=\n{got!r}")
+        got = streamed(text, rng)
+        if got != expected:
+            raise AssertionError(f"StreamingFormatter mismatch for {text!r}:\n{expected!r}\n!=\n{got!r}")
+    return len(samples)
+
+
+def make_reply(size: int) -> str:
+    reps = size // len(SAMPLE_REPLY) + 1
+    return (SAMPLE_REPLY * reps)[:size]
+
+
+def bench(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000, 200_000, 2_000_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    checked = check_equivalence()
+    print(f"✓ Output identical to legacy pipeline on {checked} samples (full and streamed)")
+
+    print(f"\n{'chars':>10} | {'legacy ms':>10} | {'single-pass ms':>14} | {'MB/s':>8} | {'speed-up':>8}")
+    print("-" * 62)
+    for size in args.sizes:
+        text = make_reply(size)
+        legacy = bench(legacy_format, text, args.repeat)
+        single = bench(format_response, text, args.repeat)
+        mbps = (len(text.encode()) / 1e6) / single if single else float("inf")
+        print(f"{size:>10} | {legacy * 1e3:>10.3f} | {single * 1e3:>14.3f} | {mbps:>8.1f} | {legacy / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Typo tolerance of the retriever: fuzzy_index.FuzzyTermIndex on noisy queries.
+
+Makes a seeded set of misspellings of the labelled queries (a letter deleted,
+inserted, substituted, or two letters swapped; two edits on words of 8+
+letters) plus a few typos seen in real traffic, and reports:
+  - term level: share of misspelled words mapped back to the right KB term,
+    to a wrong one, or to none, and the lookup latency, next to a brute-force
+    scan of the vocabulary (edit distance to every term);
+  - query level: recall@k of the noisy queries without and with the fuzzy
+    index, and of the clean queries with it (typo tolerance must not cost
+    recall on correctly spelled questions).
+
+Usage (from backend/):
+    python -m benchmarks.bench_fuzzy --k 1 3 5 --seed 7
+"""
+import re
+import sys
+import time
+import random
+import string
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import kb_config
+from kb_config import extract_keywords, normalize_text, rank_chunks
+from fuzzy_index import FuzzyTermIndex, edit_distance, max_distance
+from benchmarks.bench_retrieval import load_kb, percentile
+from benchmarks.queries import LABELLED_QUERIES
+
+# (typo, intended KB term)
+REAL_TYPOS = [
+    ("tranfert", "transfert"),
+    ("retarit", "retrait"),
+    ("transfret", "transfert"),
+    ("abonement", "abonnement"),
+    ("paiment", "paiement"),
+    ("rembourcement", "remboursement"),
+    ("withdrawl", "withdrawal"),
+    ("recieve", "receive"),
+]
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """One random edit (two on long words) that still leaves an alphabetic word."""
+    for _ in range(max_distance(word)):
+        i = rng.randrange(len(word))
+        edit = rng.choice(("delete", "insert", "substitute", "transpose"))
+        letter = rng.choice(string.ascii_lowercase)
+        if edit == "delete":
+            word = word[:i] + word[i + 1:]
+        elif edit == "insert":
+            word = word[:i] + letter + word[i:]
+        elif edit == "substitute":
+            word = word[:i] + letter + word[i + 1:]
+        elif i < len(word) - 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def noisy_query(query: str, inverted_index: Dict, rng: random.Random) -> Tuple[str, List[Tuple[str, str]]]:
+    """The query with every KB word long enough to correct misspelled; returns it and the (typo, term) pairs."""
+    pairs = []
+    query = normalize_text(query)
+    for term in dict.fromkeys(extract_keywords(query)):
+        if term not in inverted_index or max_distance(term) == 0:
+            continue
+        typo = misspell(term, rng)
+        if typo != term and typo not in inverted_index:
+            query = re.sub(rf"\b{term}\b", typo, query)
+            pairs.append((typo, term))
+    return query, pairs
+
+
+def term_level(index: FuzzyTermIndex, pairs: List[Tuple[str, str]], repeat: int) -> None:
+    right = wrong = missed = 0
+    timings = []
+    for typo, term in pairs:
+        found = index.lookup(typo)
+        if found == term:
+            right += 1
+        elif found is None:
+            missed += 1
+        else:
+            wrong += 1
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.lookup(typo)
+        timings.append((time.perf_counter() - start) / repeat)
+
+    vocabulary = list(index.terms())
+    brute = []
+    for typo, _ in pairs[:50]:
+        start = time.perf_counter()
+        min(vocabulary, key=lambda t: edit_distance(typo, t, max(max_distance(typo), 1)))
+        brute.append(time.perf_counter() - start)
+
+    n = len(pairs)
+    print(f"{n} misspelled words, vocabulary of {len(index)} terms")
+    print(f"  corrected {right / n:6.1%}   wrong term {wrong / n:6.1%}   not found {missed / n:6.1%}")
+    print(f"  fuzzy lookup        p50 {percentile(timings, 50) * 1e6:8.1f} µs  p99 {percentile(timings, 99) * 1e6:8.1f} µs")
+    print(f"  brute-force scan    p50 {percentile(brute, 50) * 1e6:8.1f} µs  p99 {percentile(brute, 99) * 1e6:8.1f} µs")
+
+
+def recall(queries: List[Tuple[str, set]], inverted_index: Dict, ks: List[int]) -> Dict[int, float]:
+    totals = {k: 0.0 for k in ks}
+    for query, expected in queries:
+        ranking = [key for key, _ in rank_chunks(query, inverted_index)]
+        for k in ks:
+            totals[k] += len(expected & set(ranking[:k])) / len(expected)
+    return {k: totals[k] / len(queries) for k in ks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--variants", type=int, default=5, help="noisy versions of each labelled query")
+    parser.add_argument("--repeat", type=int, default=200, help="timed lookups per misspelled word")
+    args = parser.parse_args()
+    ks = sorted(args.k)
+    rng = random.Random(args.seed)
+
+    inverted_index = load_kb()
+    fuzzy = kb_config.FUZZY_INDEX
+    start = time.perf_counter()
+    FuzzyTermIndex().build(inverted_index)
+    print(f"Index built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    clean = [(item["query"], set(item["expected"])) for item in LABELLED_QUERIES]
+    noisy, pairs = [], []
+    for query, expected in clean:
+        for _ in range(args.variants):
+            text, query_pairs = noisy_query(query, inverted_index, rng)
+            if query_pairs:
+                noisy.append((text, expected))
+                pairs.extend(query_pairs)
+    pairs.extend((typo, term) for typo, term in REAL_TYPOS if term in inverted_index and typo not in inverted_index)
+
+    print()
+    term_level(fuzzy, pairs, args.repeat)
+
+    print(f"\n{len(noisy)} noisy queries, {len(clean)} clean ones")
+    with_fuzzy = recall(noisy, inverted_index, ks)
+    clean_recall = recall(clean, inverted_index, ks)
+    kb_config.FUZZY_INDEX = FuzzyTermIndex()
+    try:
+        without_fuzzy = recall(noisy, inverted_index, ks)
+        clean_without = recall(clean, inverted_index, ks)
+    finally:
+        kb_config.FUZZY_INDEX = fuzzy
+    for k in ks:
+        print(f"  recall@{k}  noisy {without_fuzzy[k]:.4f} -> {with_fuzzy[k]:.4f}   "
+              f"clean {clean_without[k]:.4f} -> {clean_recall[k]:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+History-fetch latency as chat_messages grows.
+
+Seeds ChatMessage rows in steps up to millions (most of them on the shared
+guest user, as in production), and at every step times the per-user history
+query
+
+    SELECT ... FROM chat_messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT 2
+
+with the (user_id, timestamp) index from migration 0002, and, with
+--compare, after dropping it. The query plan is printed at each step.
+
+Usage (from backend/; defaults to a throwaway SQLite file):
+    python -m benchmarks.bench_history_query --rows 10000 100000 1000000 3000000
+    python -m benchmarks.bench_history_query --database-url postgresql://... --no-compare
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="table sizes to measure at (cumulative)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--guest-share", type=float, default=0.5, help="share of rows owned by the guest user (id 1)")
+    parser.add_argument("--queries", type=int, default=200, help="timed lookups per step and user kind")
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--no-compare", dest="compare", action="store_false",
+                        help="skip the measurement without the index")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="momochat-history-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{Path(tmpdir.name) / 'history.db'}"
+
+    from sqlalchemy import insert, select, text
+    from alembic import command
+    from alembic.config import Config
+    from database import engine, SessionLocal
+    import models
+
+    command.upgrade(Config(str(BACKEND_DIR / "alembic.ini")), "head")
+    index = next(i for i in models.ChatMessage.__table__.indexes if i.name == "ix_chat_messages_user_id_timestamp")
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), [
+            {"id": uid, "username": f"user{uid}", "email": f"user{uid}@momo.test", "hashed_password": "x"}
+            for uid in range(1, args.users + 1)
+        ])
+
+    def history_query(db, user_id):
+        return (
+            db.query(models.ChatMessage)
+            .filter(models.ChatMessage.user_id == user_id)
+            .order_by(models.ChatMessage.timestamp.desc())
+            .limit(2)
+            .all()
+        )
+
+    def query_plan() -> str:
+        stmt = (select(models.ChatMessage.__table__)
+                .where(models.ChatMessage.user_id == 1)
+                .order_by(models.ChatMessage.timestamp.desc()).limit(2))
+        compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        with engine.connect() as conn:
+            rows = conn.execute(text(prefix + str(compiled))).fetchall()
+        return " | ".join(str(r[-1]) for r in rows)
+
+    def measure(rng) -> Dict[str, Dict[str, float]]:
+        result = {}
+        db = SessionLocal()
+        try:
+            for kind in ("guest", "other"):
+                timings = []
+                for _ in range(args.queries):
+                    user_id = 1 if kind == "guest" else rng.randint(2, args.users)
+                    start = time.perf_counter()
+                    history_query(db, user_id)
+                    timings.append(time.perf_counter() - start)
+                    db.expunge_all()
+                result[kind] = {"p50": percentile(timings, 50) * 1000, "p95": percentile(timings, 95) * 1000}
+        finally:
+            db.close()
+        return result
+
+    rng = random.Random(7)
+    seeded = 0
+    clock = datetime(2025, 1, 1)
+    report = []
+    for target in sorted(args.rows):
+        seed_start = time.perf_counter()
+        while seeded < target:
+            n = min(args.batch, target - seeded)
+            rows = []
+            for _ in range(n):
+                clock += timedelta(seconds=rng.randint(1, 30))
+                user_id = 1 if rng.random() < args.guest_share else rng.randint(2, args.users)
+                rows.append({"user_id": user_id, "user_query": "Combien coûte un transfert ?",
+                             "ai_response": "Les frais dépendent du montant.", "timestamp": clock})
+            with engine.begin() as conn:
+                conn.execute(insert(models.ChatMessage.__table__), rows)
+            seeded += n
+        if engine.dialect.name == "postgresql":
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("ANALYZE chat_messages"))
+        print(f"\n[{target:,} rows] seeded in {time.perf_counter() - seed_start:.1f}s")
+
+        print(f"  plan (indexed):   {query_plan()}")
+        step = {"rows": target, "indexed": measure(rng)}
+        if args.compare:
+            index.drop(engine)
+            # Pooled SQLite connections keep statements prepared against the old schema
+            engine.dispose()
+            print(f"  plan (no index):  {query_plan()}")
+            step["no_index"] = measure(rng)
+            index.create(engine)
+            engine.dispose()
+        report.append(step)
+
+        for label in ("indexed", "no_index"):
+            if label in step:
+                g, o = step[label]["guest"], step[label]["other"]
+                print(f"  {label:<9} guest p50/p95 {g['p50']:8.3f} / {g['p95']:8.3f} ms   "
+                      f"other user p50/p95 {o['p50']:8.3f} / {o['p95']:8.3f} ms")
+
+    print("\nSummary (guest p95 ms):")
+    for step in report:
+        line = f"  {step['rows']:>12,} rows  indexed {step['indexed']['guest']['p95']:8.3f}"
+        if "no_index" in step:
+            line += f"   no index {step['no_index']['guest']['p95']:10.3f}"
+        print(line)
+
+    engine.dispose()
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
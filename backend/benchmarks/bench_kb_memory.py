@@ -0,0 +1,125 @@
+"""
+Memory held by the KB index and chunk metadata, old layout vs kb_index.py.
+
+Builds INVERTED_INDEX + CHUNK_METADATA both ways for the real KB and for
+synthetic KBs of --sizes chunks (the real chunks repeated, with a share of
+their words swapped for made-up ones so the vocabulary keeps growing as a
+larger KB's would) and reports the Python heap each layout retains, i.e. what
+every worker carries once the copy-on-write pages inherited from the gunicorn
+master have been touched. The chunk texts themselves are shared by both
+layouts and not counted; FUZZY_INDEX is shown separately.
+
+Usage (from backend/):
+    python -m benchmarks.bench_kb_memory --sizes 17 1000 10000
+"""
+import re
+import gc
+import sys
+import time
+import random
+import string
+import argparse
+import tracemalloc
+from pathlib import Path
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from kb_config import (
+    INITIAL_KB_CHUNKS, STOP_WORDS, build_inverted_index, normalize_text, preprocess_chunks,
+)
+from fuzzy_index import FuzzyTermIndex
+from token_count import count_tokens, load_encoding
+
+
+def synthetic_kb(size: int, rng: random.Random, new_word_rate: float) -> Dict[str, str]:
+    chunks = dict(INITIAL_KB_CHUNKS)
+    base = list(INITIAL_KB_CHUNKS.items())
+    made_up = lambda m: (  # noqa: E731
+        "".join(rng.choice(string.ascii_lowercase) for _ in m.group(0)) if rng.random() < new_word_rate
+        else m.group(0)
+    )
+    while len(chunks) < size:
+        key, text = base[len(chunks) % len(base)]
+        chunks[f"{key}_{len(chunks)}"] = re.sub(r"[A-Za-z]{5,}", made_up, text)
+    return dict(list(chunks.items())[:size])
+
+
+def legacy_layout(kb_chunks: Dict[str, str]) -> Tuple[Dict, Dict]:
+    """INVERTED_INDEX and CHUNK_METADATA as built before kb_index.py."""
+    index = defaultdict(list)
+    for key, text in kb_chunks.items():
+        for t in set(re.findall(r"\b[a-z0-9]{3,}\b", normalize_text(text))):
+            index[t].append(key)
+    metadata = {}
+    for key, text in kb_chunks.items():
+        norm_text = normalize_text(text)
+        tokens = re.findall(r"\b[a-z0-9]{3,}\b", norm_text)
+        metadata[key] = {
+            "text": text,
+            "norm_text": norm_text,
+            "token_count": count_tokens(text),
+            "keywords": set(t for t in tokens if t not in STOP_WORDS),
+            "length": len(text),
+        }
+    return index, metadata
+
+
+def compact_layout(kb_chunks: Dict[str, str]) -> Tuple:
+    return build_inverted_index(kb_chunks), preprocess_chunks(kb_chunks)
+
+
+def fuzzy_index(inverted_index) -> FuzzyTermIndex:
+    fuzzy = FuzzyTermIndex()
+    fuzzy.build(inverted_index)
+    return fuzzy
+
+
+def retained(build: Callable[[], object]) -> Tuple[object, int]:
+    """(result, bytes it still holds once built)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def build_seconds(build: Callable[[], object]) -> float:
+    """Timed apart: tracemalloc slows small allocations down several times over."""
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def mb(size: int) -> str:
+    return f"{size / 1e6:8.2f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[len(INITIAL_KB_CHUNKS), 1000, 10000])
+    parser.add_argument("--new-word-rate", type=float, default=0.1,
+                        help="share of the words of 5+ letters replaced in each synthetic chunk")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    load_encoding()
+
+    print(f"{'chunks':>7} {'terms':>8} {'old layout':>12} {'kb_index':>12} {'saved':>7}   "
+          f"{'build old / new':>15} {'fuzzy index':>12}")
+    for size in args.sizes:
+        kb_chunks = synthetic_kb(size, random.Random(args.seed), args.new_word_rate)
+        legacy, legacy_size = retained(lambda: legacy_layout(kb_chunks))
+        del legacy
+        compact, compact_size = retained(lambda: compact_layout(kb_chunks))
+        _, fuzzy_size = retained(lambda: fuzzy_index(compact[0]))
+        legacy_s = build_seconds(lambda: legacy_layout(kb_chunks))
+        compact_s = build_seconds(lambda: compact_layout(kb_chunks))
+        print(f"{len(kb_chunks):>7} {len(compact[0]):>8} {mb(legacy_size):>12} {mb(compact_size):>12} "
+              f"{1 - compact_size / legacy_size:>7.0%}   {legacy_s:>6.2f}s / {compact_s:>5.2f}s {mb(fuzzy_size):>12}")
+
+
+if __name__ == "__main__":
+    main()
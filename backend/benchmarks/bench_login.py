@@ -0,0 +1,151 @@
+"""
+Login throughput under concurrency: legacy inline bcrypt vs the bounded hashing pool.
+
+Runs in-process (ASGI transport, throwaway SQLite) with two login routes:
+  - legacy:   sync endpoint verifying bcrypt inline, i.e. on Starlette's
+              threadpool (40 threads) like auth_router did before
+  - executor: auth_router's /auth/login on auth.PASSWORD_HASHER
+While N clients log in back to back, a probe calls a sync /ping endpoint every
+50 ms; its latency shows whether other sync endpoints are starved.
+
+Usage (from backend/):
+    python -m benchmarks.bench_login --concurrency 64 --duration 10 --rounds 10
+    python -m benchmarks.bench_login --workers 4 --queue-limit 16 --processes
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def run_phase(app, path: str, users: int, concurrency: int, duration: float) -> Dict:
+    import httpx
+
+    statuses: Dict[int, int] = {}
+    latencies: List[float] = []
+    ping_latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        deadline = time.perf_counter() + duration
+
+        async def login_loop(i: int):
+            n = 0
+            while time.perf_counter() < deadline:
+                username = f"user{(i + n * concurrency) % users}"
+                n += 1
+                start = time.perf_counter()
+                resp = await client.post(path, data={"username": username, "password": "correct horse"})
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if resp.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                elif resp.status_code == 503:
+                    await asyncio.sleep(float(resp.headers.get("Retry-After", "1")))
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *[login_loop(i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "logins_per_s": len(latencies) / elapsed,
+        "login_p50_ms": percentile(latencies, 50) * 1000,
+        "login_p95_ms": percentile(latencies, 95) * 1000,
+        "ping_p50_ms": percentile(ping_latencies, 50) * 1000,
+        "ping_p95_ms": percentile(ping_latencies, 95) * 1000,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=None, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--queue-limit", type=int, default=None, help="PASSWORD_HASH_QUEUE_LIMIT")
+    parser.add_argument("--processes", action="store_true", help="PASSWORD_HASH_USE_PROCESSES")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="momochat-login-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir.name) / 'login.db'}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.workers is not None:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    if args.queue_limit is not None:
+        os.environ["PASSWORD_HASH_QUEUE_LIMIT"] = str(args.queue_limit)
+    if args.processes:
+        os.environ["PASSWORD_HASH_USE_PROCESSES"] = "true"
+
+    from fastapi import Depends, FastAPI, HTTPException
+    from fastapi.security import OAuth2PasswordRequestForm
+    from sqlalchemy.orm import Session
+    from database import engine, Base, SessionLocal, get_db
+    import models
+    import auth
+    from auth_router import auth_router
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hashed = auth.get_password_hash("correct horse")
+    db.add_all([models.User(username=f"user{i}", email=f"user{i}@momo.test", hashed_password=hashed)
+                for i in range(args.users)])
+    db.commit()
+    db.close()
+
+    app = FastAPI()
+    app.include_router(auth_router)
+
+    @app.get("/ping")
+    def ping():
+        return {"status": "ok"}
+
+    @app.post("/legacy/login")
+    def legacy_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+        user = auth.authenticate_user(db, form_data.username)
+        if not user or not auth.verify_password(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=401)
+        return {"access_token": auth.create_access_token({"sub": user.username}), "token_type": "bearer"}
+
+    pool = auth.PASSWORD_HASHER
+    print(f"bcrypt rounds={args.rounds}, concurrency={args.concurrency}, "
+          f"hash workers={pool.workers} ({'processes' if pool.use_processes else 'threads'}), "
+          f"queue limit={os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', auth.PASSWORD_HASH_QUEUE_LIMIT)}")
+    header = f"{'mode':<10} {'logins/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'ping p50':>9} {'ping p95':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    for mode, path in (("legacy", "/legacy/login"), ("executor", "/auth/login")):
+        r = asyncio.run(run_phase(app, path, args.users, args.concurrency, args.duration))
+        print(f"{mode:<10} {r['logins_per_s']:>9.1f} {r['login_p50_ms']:>9.1f} {r['login_p95_ms']:>9.1f} "
+              f"{r['ping_p50_ms']:>9.1f} {r['ping_p95_ms']:>9.1f}  {r['statuses']}")
+
+    pool.shutdown()
+    engine.dispose()
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
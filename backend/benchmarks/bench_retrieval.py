@@ -0,0 +1,170 @@
+"""
+Retrieval quality and latency benchmark for `get_keyword_filtered_context`.
+
+Runs the labelled FR/EN/Lingala queries in benchmarks/queries.py (each
+mapped to its expected INITIAL_KB_CHUNKS keys) through the keyword retriever
+and reports, overall and per language:
+  - recall@k for each --k (share of expected chunks ranked in the top k)
+  - MRR (reciprocal rank of the first expected chunk in the full ranking)
+  - context tokens actually injected into the prompt
+  - per-query latency percentiles (QUERY_CACHE bypassed)
+
+Save a run with --json-out and compare later runs with --baseline to see
+whether a tweak to MOMO_DOMAIN_TERMS, SYNONYMS or the scoring weights helped.
+
+Usage (from backend/):
+    python -m benchmarks.bench_retrieval --k 1 3 5 --repeat 50 --json-out retrieval.json
+    python -m benchmarks.bench_retrieval --baseline retrieval.json --verbose
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from statistics import mean
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import kb_config
+from kb_config import (
+    INITIAL_KB_CHUNKS, build_inverted_index, preprocess_chunks,
+    rank_chunks, get_keyword_filtered_context,
+)
+from benchmarks.queries import LABELLED_QUERIES
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def load_kb() -> Dict:
+    """Builds the same index and metadata as main.startup_event."""
+    inverted_index = build_inverted_index(INITIAL_KB_CHUNKS)
+    kb_config.FUZZY_INDEX.build(inverted_index)
+    kb_config.CHUNK_METADATA.clear()
+    kb_config.CHUNK_METADATA.update(preprocess_chunks(INITIAL_KB_CHUNKS))
+    return inverted_index
+
+
+def selected_keys(context: str) -> List[str]:
+    """Chunk keys from the `[KEY]` headers (chunk bodies can contain bracketed lines too)."""
+    return [line[1:-1] for line in context.splitlines()
+            if line.startswith("[") and line.endswith("]") and line[1:-1] in kb_config.CHUNK_METADATA]
+
+
+def evaluate(inverted_index, ks: List[int], repeat: int, max_chunks: int, max_kb_tokens: int) -> Dict:
+    per_query = []
+    for item in LABELLED_QUERIES:
+        query, expected = item["query"], set(item["expected"])
+
+        ranking = [key for key, _ in rank_chunks(query, inverted_index)]
+        recall = {k: len(expected & set(ranking[:k])) / len(expected) for k in ks}
+        rr = next((1.0 / (i + 1) for i, key in enumerate(ranking) if key in expected), 0.0)
+
+        context = get_keyword_filtered_context(
+            query, INITIAL_KB_CHUNKS, inverted_index,
+            max_chunks=max_chunks, max_kb_tokens=max_kb_tokens, use_cache=False,
+        )
+        keys = selected_keys(context)
+        context_tokens = sum(kb_config.CHUNK_METADATA[k].token_count for k in keys)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            get_keyword_filtered_context(
+                query, INITIAL_KB_CHUNKS, inverted_index,
+                max_chunks=max_chunks, max_kb_tokens=max_kb_tokens, use_cache=False,
+            )
+            timings.append(time.perf_counter() - start)
+
+        per_query.append({
+            "query": query,
+            "lang": item["lang"],
+            "expected": sorted(expected),
+            "ranking": ranking[:max(ks)],
+            "recall": recall,
+            "rr": rr,
+            "context_chunks": keys,
+            "context_tokens": context_tokens,
+            "latency_ms": percentile(timings, 50) * 1000,
+            "timings": timings,
+        })
+    return aggregate(per_query, ks)
+
+
+def aggregate(per_query: List[Dict], ks: List[int]) -> Dict:
+    groups: Dict[str, List[Dict]] = {"all": per_query}
+    for q in per_query:
+        groups.setdefault(q["lang"], []).append(q)
+
+    summary = {}
+    for name, items in groups.items():
+        timings = [t for q in items for t in q["timings"]]
+        summary[name] = {
+            "queries": len(items),
+            **{f"recall@{k}": round(mean(q["recall"][k] for q in items), 4) for k in ks},
+            "mrr": round(mean(q["rr"] for q in items), 4),
+            "context_tokens_mean": round(mean(q["context_tokens"] for q in items), 1),
+            "context_tokens_max": max(q["context_tokens"] for q in items),
+            "latency_ms": {p: round(percentile(timings, v) * 1000, 3)
+                           for p, v in (("p50", 50), ("p95", 95), ("p99", 99))},
+        }
+    for q in per_query:
+        del q["timings"]
+    return {"summary": summary, "queries": per_query}
+
+
+def print_summary(report: Dict, baseline: Dict = None) -> None:
+    for name, s in report["summary"].items():
+        metrics = {k: v for k, v in s.items() if k not in ("queries", "latency_ms")}
+        print(f"\n[{name}] {s['queries']} queries")
+        for key, value in metrics.items():
+            line = f"  {key:<22} {value}"
+            if baseline and name in baseline["summary"] and key in baseline["summary"][name]:
+                before = baseline["summary"][name][key]
+                line += f"   (baseline {before}, Δ {value - before:+.4g})"
+            print(line)
+        lat = s["latency_ms"]
+        line = f"  {'latency ms p50/95/99':<22} {lat['p50']} / {lat['p95']} / {lat['p99']}"
+        if baseline and name in baseline["summary"]:
+            b = baseline["summary"][name]["latency_ms"]
+            line += f"   (baseline {b['p50']} / {b['p95']} / {b['p99']})"
+        print(line)
+
+
+def print_misses(report: Dict, k: int) -> None:
+    misses = [q for q in report["queries"] if q["recall"][k] < 1.0]
+    print(f"\nQueries with recall@{k} < 1 ({len(misses)}):")
+    for q in misses:
+        print(f"  [{q['lang']}] {q['query']!r}: expected {q['expected']}, got {q['ranking'][:k]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--max-chunks", type=int, default=5)
+    parser.add_argument("--max-kb-tokens", type=int, default=3000)
+    parser.add_argument("--json-out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="list queries that miss their expected chunks")
+    args = parser.parse_args()
+
+    inverted_index = load_kb()
+    report = evaluate(inverted_index, sorted(args.k), args.repeat, args.max_chunks, args.max_kb_tokens)
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_summary(report, baseline)
+    if args.verbose:
+        print_misses(report, max(args.k))
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"\nReport written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Accuracy and speed of token_count.estimate_tokens against tiktoken.
+
+Compares the estimate with the exact count on the texts it was calibrated on
+(KB paragraphs, the system prompt, the benchmark queries) and on every whole
+KB chunk, then times both. Re-run it after editing the KB; if the errors
+drift, refit the coefficients with --fit and copy them into estimate_tokens().
+
+Needs the real encoding (`python token_count.py --prefetch` first).
+
+Usage (from backend/):
+    python -m benchmarks.bench_token_estimate
+    python -m benchmarks.bench_token_estimate --fit
+"""
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import token_count
+from token_count import estimate_tokens, load_encoding
+from kb_config import INITIAL_KB_CHUNKS, SYSTEM_PROMPT
+from benchmarks.queries import GREETINGS, LABELLED_QUERIES, OVERVIEW_QUERIES
+
+
+def calibration_texts() -> List[str]:
+    texts = []
+    for text in INITIAL_KB_CHUNKS.values():
+        texts.extend(p for p in re.split(r"\n\s*\n", text) if p.strip())
+    texts.extend(q["query"] for q in LABELLED_QUERIES)
+    texts.extend(OVERVIEW_QUERIES)
+    texts.extend(GREETINGS)
+    texts.append(SYSTEM_PROMPT)
+    return texts
+
+
+def features(text: str) -> List[float]:
+    """The inputs of estimate_tokens(), in the order of its coefficients."""
+    data = text.encode("utf-8")
+    size = len(data)
+    return [
+        len(text),
+        data.count(b" ") + data.count(b"\n"),
+        size - len(data.translate(None, token_count._DIGITS)),
+        size - len(data.translate(None, token_count._PUNCTUATION)),
+        size - len(text),
+        1.0,
+    ]
+
+
+def error_summary(label: str, exact: List[int], estimated: List[int]) -> None:
+    errors = sorted(abs(e - x) / x for x, e in zip(exact, estimated) if x)
+    total = (sum(estimated) - sum(exact)) / sum(exact)
+    print(f"{label:<28} n={len(errors):<4} median {100 * errors[len(errors) // 2]:5.1f}%  "
+          f"p95 {100 * errors[int(len(errors) * 0.95)]:5.1f}%  max {100 * errors[-1]:5.1f}%  total {100 * total:+.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fit", action="store_true", help="print least-squares coefficients (needs numpy)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    encoding = load_encoding()
+    if encoding is None:
+        sys.exit("tiktoken encoding unavailable: run `python token_count.py --prefetch` first")
+
+    texts = calibration_texts()
+    exact = [len(encoding.encode_ordinary(t)) for t in texts]
+    estimated = [estimate_tokens(t) for t in texts]
+    print(f"{encoding.name}, {len(texts)} texts, {sum(exact)} tokens")
+    error_summary("all texts", exact, estimated)
+    long_pairs = [(x, e) for x, e in zip(exact, estimated) if x >= 50]
+    error_summary("texts of 50+ tokens", [x for x, _ in long_pairs], [e for _, e in long_pairs])
+    chunks = list(INITIAL_KB_CHUNKS.values())
+    error_summary("whole KB chunks", [len(encoding.encode_ordinary(t)) for t in chunks],
+                  [estimate_tokens(t) for t in chunks])
+
+    for label, sample in (("short message", LABELLED_QUERIES[0]["query"]), ("whole KB", "\n".join(chunks))):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            encoding.encode_ordinary(sample)
+        exact_s = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            estimate_tokens(sample)
+        estimate_s = (time.perf_counter() - start) / args.repeat
+        print(f"{label:<28} tiktoken {exact_s * 1e6:9.1f} µs  estimate {estimate_s * 1e6:8.1f} µs  "
+              f"({exact_s / estimate_s:.0f}x)")
+
+    if args.fit:
+        import numpy as np
+        coefficients, *_ = np.linalg.lstsq(np.array([features(t) for t in texts]), np.array(exact), rcond=None)
+        print("coefficients:", ", ".join(f"{c:.3f}" for c in coefficients))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Throughput and memory as the backend scales across worker processes.
+
+For each worker count, starts the mock Azure server and the backend (gunicorn
+production mode by default, see gunicorn.conf.py), drives it with the load
+generator and reports throughput, latency and memory. Mock Azure latency is
+kept low so the backend's own CPU work (retrieval, token counting,
+formatting) is what limits throughput.
+
+Memory is read from /proc (Linux): RSS counts shared pages once per process,
+PSS splits them between the processes sharing them, so total PSS well below
+total RSS means the preloaded KB is shared copy-on-write.
+
+Usage (from backend/):
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --requests 2000 --concurrency 64
+    python -m benchmarks.bench_workers --server uvicorn --shared-cache
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks import loadgen
+from benchmarks.run_loadtest import backend_command, start_process, wait_until_up
+
+
+def process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return pids
+    for child in children:
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """Summed RSS and PSS (MB) of a process and its children; zeros where /proc is unavailable."""
+    totals = {"rss": 0.0, "pss": 0.0}
+    for p in process_tree(pid):
+        try:
+            lines = Path(f"/proc/{p}/smaps_rollup").read_text().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            field, _, value = line.partition(":")
+            if field in ("Rss", "Pss"):
+                totals[field.lower()] += int(value.split()[0]) / 1024
+    return totals
+
+
+def run_phase(args, workers: int, database_url: str, shared_cache_url: str) -> Dict:
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{args.mock_port}",
+        "AZURE_OPENAI_API_KEY": "mock-key",
+        "DATABASE_URL": database_url,
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "RATE_LIMIT_ENABLED": "false",
+        "SHARED_CACHE_URL": shared_cache_url,
+        "QUICK_ANSWERS_DB": str(Path(database_url[len("sqlite:///"):]).with_name("quick_answers.db")),
+        # Every reply would be served from the response cache otherwise
+        "RESPONSE_CACHE_TTL_SECONDS": "0",
+    })
+    args.workers = workers
+    processes = []
+    try:
+        processes.append(start_process([
+            "-m", "benchmarks.mock_azure", "--port", str(args.mock_port),
+            "--latency", args.latency, "--token-delay", "0.001",
+        ], env))
+        backend = start_process(backend_command(args), env)
+        processes.append(backend)
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/stats")
+        wait_until_up(f"{args.base_url}/ping")
+
+        idle = memory_mb(backend.pid)
+        results = asyncio.run(loadgen.run_load(args.base_url, args.concurrency, args.duration, args.requests,
+                                               args.stream_ratio, args.timeout, args.seed))
+        loaded = memory_mb(backend.pid)
+        report = loadgen.summarize(results)["endpoints"]["all"]
+        report.update({"idle_memory_mb": idle, "loaded_memory_mb": loaded})
+        return report
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+        for proc in processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="gunicorn")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per worker count")
+    parser.add_argument("--duration", type=float, default=120.0, help="upper bound per worker count (s)")
+    parser.add_argument("--stream-ratio", type=float, default=0.5)
+    parser.add_argument("--latency", default="fixed:0.02", help="mock Azure latency distribution")
+    parser.add_argument("--shared-cache", action="store_true", help="share caches through a SQLite file")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mock-port", type=int, default=9110)
+    parser.add_argument("--backend-port", type=int, default=8775)
+    args = parser.parse_args()
+    args.base_url = f"http://127.0.0.1:{args.backend_port}"
+
+    print(f"{os.cpu_count()} CPUs, server={args.server}, concurrency={args.concurrency}, "
+          f"{args.requests} requests per step, mock latency {args.latency}")
+    header = (f"{'workers':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'err%':>6} "
+              f"{'RSS MB':>8} {'PSS MB':>8} {'PSS/worker':>10}")
+    rows = []
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory(prefix="momochat-workers-") as tmp:
+            shared = f"sqlite:///{Path(tmp) / 'shared_cache.db'}" if args.shared_cache else ""
+            r = run_phase(args, workers, f"sqlite:///{Path(tmp) / 'bench.db'}", shared)
+        mem = r["loaded_memory_mb"]
+        rows.append(
+            f"{workers:>7} {r['throughput_rps']:>8.1f} {r['latency_ms']['p50']:>8.1f} {r['latency_ms']['p95']:>8.1f} "
+            f"{r['error_rate'] * 100:>6.2f} {mem['rss']:>8.1f} {mem['pss']:>8.1f} {mem['pss'] / workers:>10.1f}"
+        )
+        print(f"  {workers} worker(s) done: {r['throughput_rps']:.1f} rps")
+
+    print()
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Closed-loop load generator for /chat and /chat/stream.
+
+N concurrent virtual users send queries from the weighted KB query mix
+(benchmarks/queries.py) for a fixed duration or request count, then report
+throughput, p50/p95/p99 latency, time-to-first-token and error rates.
+
+A JSON report can be saved and later used as a baseline: the run exits with
+status 1 when throughput drops or p95 latency grows by more than
+--max-regression percent, so it can gate a deploy.
+
+Usage (from backend/, against a running backend):
+    python -m benchmarks.loadgen --base-url http://127.0.0.1:8000 \
+        --concurrency 20 --duration 60 --stream-ratio 0.5 --json-out report.json
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.queries import query_mix
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    ok: bool
+    status: int
+    latency: float
+    ttft: Optional[float] = None
+
+
+@dataclass
+class Results:
+    samples: List[Sample] = field(default_factory=list)
+    started: float = 0.0
+    finished: float = 0.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def send_chat(client: httpx.AsyncClient, query: str, session: dict) -> Sample:
+    start = time.perf_counter()
+    try:
+        resp = await client.post("/chat", json={"message": query, "session_id": session.get("id")})
+        latency = time.perf_counter() - start
+        if resp.status_code == 200:
+            session["id"] = resp.json().get("session_id")
+        # A non-streaming reply arrives in one piece: first token == full latency
+        return Sample("/chat", resp.status_code == 200, resp.status_code, latency, latency)
+    except httpx.HTTPError:
+        return Sample("/chat", False, 0, time.perf_counter() - start)
+
+
+async def send_chat_stream(client: httpx.AsyncClient, query: str, session: dict) -> Sample:
+    start = time.perf_counter()
+    ttft = None
+    ok = False
+    status = 0
+    try:
+        async with client.stream("POST", "/chat/stream", json={"message": query, "session_id": session.get("id")}) as resp:
+            status = resp.status_code
+            if status != 200:
+                await resp.aread()
+                return Sample("/chat/stream", False, status, time.perf_counter() - start)
+            event = None
+            async for line in resp.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "error":
+                        status = int(data.get("status", 500))
+                        break
+                    if ttft is None and data.get("delta"):
+                        ttft = time.perf_counter() - start
+                    if data.get("done"):
+                        ok = True
+                        session["id"] = data.get("session_id")
+                elif not line:
+                    event = None
+    except httpx.HTTPError:
+        pass
+    return Sample("/chat/stream", ok, status, time.perf_counter() - start, ttft)
+
+
+async def virtual_user(client, queries, deadline, remaining, stream_ratio, results, rng):
+    # Each virtual user is one conversation, so history is carried across its turns
+    session: dict = {}
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        query = next(queries)
+        use_stream = rng.random() < stream_ratio
+        sample = await (send_chat_stream if use_stream else send_chat)(client, query, session)
+        results.samples.append(sample)
+
+
+async def run_load(base_url: str, concurrency: int, duration: float, requests: Optional[int],
+                   stream_ratio: float, timeout: float, seed: int) -> Results:
+    results = Results()
+    queries = query_mix(seed)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        results.started = time.perf_counter()
+        deadline = results.started + duration
+        remaining = [requests] if requests else None
+        await asyncio.gather(*[
+            virtual_user(client, queries, deadline, remaining, stream_ratio, results, random.Random(seed + i))
+            for i in range(concurrency)
+        ])
+        results.finished = time.perf_counter()
+    return results
+
+
+def summarize(results: Results) -> Dict:
+    elapsed = max(results.finished - results.started, 1e-9)
+    report: Dict = {"elapsed_s": round(elapsed, 3), "endpoints": {}}
+    by_endpoint: Dict[str, List[Sample]] = {}
+    for s in results.samples:
+        by_endpoint.setdefault(s.endpoint, []).append(s)
+    by_endpoint["all"] = results.samples
+
+    for name, samples in by_endpoint.items():
+        ok = [s for s in samples if s.ok]
+        latencies = [s.latency for s in ok]
+        ttfts = [s.ttft for s in ok if s.ttft is not None]
+        errors = Counter(str(s.status) for s in samples if not s.ok)
+        report["endpoints"][name] = {
+            "requests": len(samples),
+            "ok": len(ok),
+            "throughput_rps": round(len(ok) / elapsed, 3),
+            "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+            "errors_by_status": dict(errors),
+            "latency_ms": {p: round(percentile(latencies, q) * 1000, 1)
+                           for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+            "ttft_ms": {p: round(percentile(ttfts, q) * 1000, 1)
+                        for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        }
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f"\nElapsed: {report['elapsed_s']}s")
+    header = f"{'endpoint':<14} {'reqs':>6} {'rps':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft50':>8} {'ttft95':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report["endpoints"].items():
+        lat, ttft = r["latency_ms"], r["ttft_ms"]
+        print(f"{name:<14} {r['requests']:>6} {r['throughput_rps']:>8.2f} {r['error_rate'] * 100:>6.2f} "
+              f"{lat['p50']:>8.1f} {lat['p95']:>8.1f} {lat['p99']:>8.1f} {ttft['p50']:>8.1f} {ttft['p95']:>8.1f}")
+        if r["errors_by_status"]:
+            print(f"{'':<14} errors: {r['errors_by_status']}")
+
+
+def check_regression(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Compares the 'all' aggregate against a baseline report; returns failures."""
+    failures = []
+    cur, base = report["endpoints"].get("all", {}), baseline["endpoints"].get("all", {})
+    if not cur or not base:
+        return ["baseline or current report has no 'all' aggregate"]
+    limit = max_regression / 100
+    if base["throughput_rps"] and cur["throughput_rps"] < base["throughput_rps"] * (1 - limit):
+        failures.append(f"throughput {cur['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+    if cur["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + limit):
+        failures.append(f"p95 {cur['latency_ms']['p95']} ms > baseline {base['latency_ms']['p95']} ms")
+    if cur["error_rate"] > base["error_rate"] + limit:
+        failures.append(f"error rate {cur['error_rate']} > baseline {base['error_rate']}")
+    return failures
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds (upper bound)")
+    parser.add_argument("--requests", type=int, default=None, help="stop after N requests")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="share of requests sent to /chat/stream")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json-out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed regression in percent")
+    return parser
+
+
+def run(args) -> int:
+    results = asyncio.run(run_load(args.base_url, args.concurrency, args.duration, args.requests,
+                                   args.stream_ratio, args.timeout, args.seed))
+    report = summarize(results)
+    print_report(report)
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.json_out}")
+
+    if args.baseline:
+        failures = check_regression(report, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        if failures:
+            print("\n❌ Regression against baseline:")
+            for f in failures:
+                print(f"  - {f}")
+            return 1
+        print("\n✅ Within regression budget of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(build_parser().parse_args()))
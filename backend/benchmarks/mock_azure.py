@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Azure OpenAI chat-completions API.
+
+Serves POST /openai/deployments/{deployment}/chat/completions with:
+  - configurable latency distribution (fixed, uniform, normal, lognormal)
+  - random 429 injection with a Retry-After header
+  - `stream: true` responses as SSE chunks, with a per-token delay
+  - replies cut at the request's `max_tokens` (one word = one token), per-deployment counts in /stats
+
+Usage (from backend/):
+    python -m benchmarks.mock_azure --port 9100 --latency lognormal:0.8,0.5 \
+        --rate-429 0.05 --retry-after 1 --token-delay 0.01
+
+Point the backend at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:9100.
+"""
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Callable
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_TEMPLATE = """Voici les informations demandées sur les services MTN MoMo :
+
+❖ **{topic}**
+  • Composez *105# puis suivez les options du menu.
+  • Les frais dépendent du montant de la transaction.
+    ◦ 251 – 11,000 FCFA → 50 FCFA
+    ◦ 11,001 – 15,000 FCFA → 150 FCFA
+❖ **Besoin d'aide ?**
+  • Appelez le 123 depuis votre ligne MTN.
+
+Don't worry, your funds are safe!"""
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Parses a latency spec into a sampler returning seconds:
+      fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MEDIAN,SIGMA
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+def create_app(latency: str = "lognormal:0.8,0.5", rate_429: float = 0.0, retry_after: int = 1,
+               token_delay: float = 0.01, reply_tokens: int = 0) -> FastAPI:
+    app = FastAPI(title="Mock Azure OpenAI")
+    sample_latency = parse_latency(latency)
+    stats: Counter = Counter()
+
+    def build_reply(body: dict) -> str:
+        user_turns = [m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user"]
+        topic = (user_turns[-1] if user_turns else "MoMo")[:60]
+        reply = REPLY_TEMPLATE.format(topic=topic)
+        if reply_tokens:
+            words = reply.split(" ")
+            reply = " ".join((words * (reply_tokens // len(words) + 1))[:reply_tokens])
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(reply.split(" ")) > max_tokens:
+            stats["truncated"] += 1
+            reply = " ".join(reply.split(" ")[:max_tokens])
+        return reply
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        stats[f"deployment:{deployment}"] += 1
+
+        if rate_429 and random.random() < rate_429:
+            stats["429"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                headers={"Retry-After": str(retry_after)},
+            )
+
+        await asyncio.sleep(sample_latency())
+        reply = build_reply(body)
+        created = int(time.time())
+
+        if not body.get("stream"):
+            stats["completions"] += 1
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": created,
+                "model": deployment,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": 0},
+            }
+
+        async def events():
+            stats["streams"] += 1
+            for i, word in enumerate(reply.split(" ")):
+                delta = word if i == 0 else " " + word
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="time to first byte distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="delay between streamed tokens")
+    parser.add_argument("--reply-tokens", type=int, default=0, help="pad/trim replies to N words (0 = template)")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.rate_429, args.retry_after, args.token_delay, args.reply_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Labelled queries drawn from the KB topics (French, English, Lingala).
+
+Each entry maps a realistic user question to the INITIAL_KB_CHUNKS keys that
+should be retrieved for it. `weight` approximates how often the question
+shape shows up in production traffic and drives the load-test query mix.
+"""
+import random
+from typing import Dict, List, Optional
+
+LABELLED_QUERIES: List[Dict] = [
+    # --- BASIC_SERVICES ---
+    {"query": "Comment acheter du crédit avec MoMo ?", "lang": "fr", "expected": ["BASIC_SERVICES"], "weight": 6},
+    {"query": "Comment acheter un forfait internet via MoMo ?", "lang": "fr", "expected": ["BASIC_SERVICES"], "weight": 5},
+    {"query": "How do I buy airtime with my MoMo wallet?", "lang": "en", "expected": ["BASIC_SERVICES"], "weight": 3},
+    {"query": "How can I buy a data bundle?", "lang": "en", "expected": ["BASIC_SERVICES"], "weight": 2},
+    {"query": "Ndenge nini nakoki kosomba crédit na MoMo ?", "lang": "ln", "expected": ["BASIC_SERVICES"], "weight": 2},
+    # --- TRANSFERS ---
+    {"query": "Combien coûte un transfert de 20000 FCFA ?", "lang": "fr", "expected": ["TRANSFERS"], "weight": 10},
+    {"query": "Quels sont les frais de retrait chez un agent ?", "lang": "fr", "expected": ["TRANSFERS"], "weight": 7},
+    {"query": "Comment envoyer de l'argent à quelqu'un qui n'a pas MoMo ?", "lang": "fr", "expected": ["TRANSFERS"], "weight": 4},
+    {"query": "How much does it cost to send 50000 FCFA?", "lang": "en", "expected": ["TRANSFERS"], "weight": 4},
+    {"query": "How do I withdraw cash at an ATM with MoMo?", "lang": "en", "expected": ["TRANSFERS", "BANKTECH"], "weight": 2},
+    {"query": "Ndenge nini natinda mbongo na MoMo ?", "lang": "ln", "expected": ["TRANSFERS"], "weight": 3},
+    {"query": "Frais ya kobimisa mbongo ezali boni ?", "lang": "ln", "expected": ["TRANSFERS"], "weight": 2},
+    # --- MOMOPAY ---
+    {"query": "C'est quoi MoMoPay et comment payer un marchand ?", "lang": "fr", "expected": ["MOMOPAY"], "weight": 3},
+    {"query": "Are there fees for merchant payments with MoMoPay?", "lang": "en", "expected": ["MOMOPAY"], "weight": 2},
+    # --- MOMOAPP ---
+    {"query": "Où télécharger l'application MoMo ?", "lang": "fr", "expected": ["MOMOAPP"], "weight": 2},
+    {"query": "Where can I download the MoMo app?", "lang": "en", "expected": ["MOMOAPP"], "weight": 1},
+    # --- BANKTECH ---
+    {"query": "Comment transférer de l'argent de ma banque BGFI vers MoMo ?", "lang": "fr", "expected": ["BANKTECH"], "weight": 3},
+    {"query": "Can I move money from my MUCODEC account to my wallet?", "lang": "en", "expected": ["BANKTECH"], "weight": 1},
+    # --- MOMO_ADVANCE ---
+    {"query": "Comment fonctionne l'avance avec MoMo quand mon solde est zéro ?", "lang": "fr", "expected": ["MOMO_ADVANCE"], "weight": 3},
+    {"query": "Am I eligible for MoMo Advance?", "lang": "en", "expected": ["MOMO_ADVANCE"], "weight": 2},
+    # --- ECW_DETAILS ---
+    {"query": "Comment consulter l'historique de mes transactions ?", "lang": "fr", "expected": ["ECW_DETAILS"], "weight": 3},
+    {"query": "How do I check my wallet balance and transaction limit?", "lang": "en", "expected": ["ECW_DETAILS"], "weight": 2},
+    # --- XTRA_CASH ---
+    {"query": "Comment obtenir un prêt XtraCash ?", "lang": "fr", "expected": ["XTRA_CASH"], "weight": 6},
+    {"query": "Quel est le taux d'intérêt du prêt de 28 jours ?", "lang": "fr", "expected": ["XTRA_CASH"], "weight": 3},
+    {"query": "How much can I borrow with XtraCash?", "lang": "en", "expected": ["XTRA_CASH"], "weight": 3},
+    {"query": "Nakoki kozwa niongo na XtraCash ?", "lang": "ln", "expected": ["XTRA_CASH"], "weight": 2},
+    # --- REMITTANCE ---
+    {"query": "Puis-je recevoir de l'argent de l'étranger par MoneyGram ?", "lang": "fr", "expected": ["REMITTANCE"], "weight": 2},
+    {"query": "How do I send money to Gabon or Cameroon?", "lang": "en", "expected": ["REMITTANCE"], "weight": 2},
+    # --- BILL_PAYMENT ---
+    {"query": "Comment payer mon abonnement Canal+ avec MoMo ?", "lang": "fr", "expected": ["BILL_PAYMENT"], "weight": 4},
+    {"query": "Can I pay my E2C electricity bill with MoMo?", "lang": "en", "expected": ["BILL_PAYMENT"], "weight": 2},
+    {"query": "Ndenge nini kofuta facture ya Canal+ na MoMo ?", "lang": "ln", "expected": ["BILL_PAYMENT"], "weight": 1},
+    # --- SELF_REVERSAL ---
+    {"query": "J'ai envoyé de l'argent au mauvais numéro, comment annuler ?", "lang": "fr", "expected": ["SELF_REVERSAL"], "weight": 5},
+    {"query": "How do I cancel a transfer sent by mistake?", "lang": "en", "expected": ["SELF_REVERSAL"], "weight": 2},
+    {"query": "Natindaki mbongo na numéro ya mabe, ndenge nini koannuler ?", "lang": "ln", "expected": ["SELF_REVERSAL"], "weight": 1},
+    # --- SELF_PIN_RESET ---
+    {"query": "J'ai oublié mon code PIN, comment le réinitialiser ?", "lang": "fr", "expected": ["SELF_PIN_RESET"], "weight": 5},
+    {"query": "I forgot my PIN, how do I reset it?", "lang": "en", "expected": ["SELF_PIN_RESET"], "weight": 2},
+    {"query": "Nabosani code PIN na ngai, nasala nini ?", "lang": "ln", "expected": ["SELF_PIN_RESET"], "weight": 2},
+    # --- OPEN_API ---
+    {"query": "Comment intégrer l'API MoMo dans mon entreprise ?", "lang": "fr", "expected": ["OPEN_API"], "weight": 1},
+    {"query": "Is there a developer API for collections?", "lang": "en", "expected": ["OPEN_API"], "weight": 1},
+    # --- RESERVATION ---
+    {"query": "Puis-je payer un billet d'avion RwandAir avec MoMo ?", "lang": "fr", "expected": ["RESERVATION"], "weight": 1},
+    {"query": "Can I book an ECAir flight and pay with MoMo?", "lang": "en", "expected": ["RESERVATION"], "weight": 1},
+    # --- ASSURANCE ---
+    {"query": "Combien coûte l'assurance vie AGC-VIE ?", "lang": "fr", "expected": ["ASSURANCE"], "weight": 1},
+    {"query": "What does the savings insurance cover?", "lang": "en", "expected": ["ASSURANCE"], "weight": 1},
+    # --- MAMBOPAY ---
+    {"query": "Comment créer un coupon Mambopay pour quelqu'un ?", "lang": "fr", "expected": ["MAMBOPAY"], "weight": 1},
+    {"query": "How do I gift a digital voucher with Mambopay?", "lang": "en", "expected": ["MAMBOPAY"], "weight": 1},
+    # --- SUPPORT ---
+    {"query": "Quel est le numéro du service client MoMo ?", "lang": "fr", "expected": ["SUPPORT"], "weight": 3},
+    {"query": "How can I contact MoMo customer support on WhatsApp?", "lang": "en", "expected": ["SUPPORT"], "weight": 1},
+]
+
+# Quick-action style prompts that trigger the full-KB overview path
+OVERVIEW_QUERIES: List[str] = [
+    " Donne-moi un aperçu général des produits et services offerts par MTN MoMo. ",
+    "What does MoMo offer?",
+]
+OVERVIEW_WEIGHT = 4
+
+GREETINGS: List[str] = ["Bonjour", "Hello", "Mbote", "Merci beaucoup !"]
+GREETING_WEIGHT = 3
+
+
+def query_mix(seed: Optional[int] = None):
+    """Infinite weighted stream of realistic queries (topics, overview prompts, greetings)."""
+    rng = random.Random(seed)
+    population = [q["query"] for q in LABELLED_QUERIES] + OVERVIEW_QUERIES + GREETINGS
+    weights = (
+        [q["weight"] for q in LABELLED_QUERIES]
+        + [OVERVIEW_WEIGHT] * len(OVERVIEW_QUERIES)
+        + [GREETING_WEIGHT] * len(GREETINGS)
+    )
+    while True:
+        yield rng.choices(population, weights)[0]
@@ -0,0 +1,118 @@
+"""
+Fully offline load test: starts the mock Azure server and the backend
+(SQLite by default), drives them with the load generator, then shuts both down.
+
+Usage (from backend/):
+    python -m benchmarks.run_loadtest --concurrency 20 --duration 60 \
+        --latency lognormal:0.8,0.5 --rate-429 0.02 --json-out report.json
+
+    # Gate a change against a stored baseline (exit status 1 on regression)
+    python -m benchmarks.run_loadtest --baseline report.json --max-regression 10
+
+Use --database-url postgresql://... to run against a local Postgres instead.
+Any loadgen option (--stream-ratio, --requests, --seed, ...) is accepted.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks import loadgen
+
+
+def wait_until_up(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env)
+
+
+def backend_command(args) -> list:
+    if args.server == "gunicorn":
+        return ["-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app",
+                "--bind", f"127.0.0.1:{args.backend_port}", "--workers", str(args.workers),
+                "--log-level", "warning"]
+    return ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.backend_port),
+            "--workers", str(args.workers), "--log-level", "warning"]
+
+
+def main() -> int:
+    parser = loadgen.build_parser()
+    parser.description = __doc__
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="mock Azure latency distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--reply-tokens", type=int, default=0)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the backend")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn",
+                        help="gunicorn = production mode (gunicorn.conf.py, KB preloaded before fork)")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="momochat-loadtest-")
+    database_url = args.database_url or f"sqlite:///{Path(tmpdir.name) / 'loadtest.db'}"
+    args.base_url = f"http://127.0.0.1:{args.backend_port}"
+
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{args.mock_port}",
+        "AZURE_OPENAI_API_KEY": "mock-key",
+        "DATABASE_URL": database_url,
+        "QUICK_ANSWERS_DB": str(Path(tmpdir.name) / "quick_answers.db"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        # Every virtual user shares one IP; set RATE_LIMIT_ENABLED=true to load-test the limiter itself
+        "RATE_LIMIT_ENABLED": env.get("RATE_LIMIT_ENABLED", "false"),
+    })
+
+    processes = []
+    try:
+        processes.append(start_process([
+            "-m", "benchmarks.mock_azure", "--port", str(args.mock_port),
+            "--latency", args.latency, "--rate-429", str(args.rate_429),
+            "--retry-after", str(args.retry_after), "--token-delay", str(args.token_delay),
+            "--reply-tokens", str(args.reply_tokens),
+        ], env))
+        processes.append(start_process(backend_command(args), env))
+
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/stats")
+        wait_until_up(f"{args.base_url}/ping")
+        print(f"Mock Azure on :{args.mock_port}, backend on :{args.backend_port}, DB {database_url}")
+
+        status = loadgen.run(args)
+
+        mock_stats = httpx.get(f"http://127.0.0.1:{args.mock_port}/stats").json()
+        print(f"\nMock Azure stats: {mock_stats}")
+        return status
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+        for proc in processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
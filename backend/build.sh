@@ -8,5 +8,8 @@ python -m pip install --upgrade pip
 # Install dependencies
 pip install -r requirements.txt
 
+# Token encoding into backend/tiktoken_cache, so the app never fetches it at runtime
+python token_count.py --prefetch
+
 echo "=== build.sh: finished ==="
 
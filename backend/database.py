@@ -10,8 +10,12 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise EnvironmentError("DATABASE_URL must be set in the environment.")
 
+# SQLite (local benchmarks / offline runs) must allow use from FastAPI's threadpool
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
     echo=False,
     future=True,
     pool_pre_ping=True,
@@ -23,6 +27,21 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replica for heavy reads (exports); falls back to the primary
+READ_REPLICA_DATABASE_URL = os.getenv("READ_REPLICA_DATABASE_URL")
+if READ_REPLICA_DATABASE_URL:
+    replica_engine = create_engine(
+        READ_REPLICA_DATABASE_URL,
+        connect_args={"check_same_thread": False} if READ_REPLICA_DATABASE_URL.startswith("sqlite") else {},
+        future=True,
+        pool_pre_ping=True,
+        pool_size=2,
+        max_overflow=2,
+        pool_recycle=300
+    )
+else:
+    replica_engine = engine
+
 Base = declarative_base()
 
 def get_db():
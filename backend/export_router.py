@@ -0,0 +1,200 @@
+import io
+import os
+import csv
+import hmac
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Iterator, Literal, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select, tuple_
+
+import models
+import metrics
+from database import replica_engine
+
+logger = logging.getLogger(__name__)
+
+# Export is disabled unless an admin key is configured
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+# Read throttle so an export cannot starve live traffic on the database
+EXPORT_MAX_ROWS_PER_SECOND = float(os.getenv("EXPORT_MAX_ROWS_PER_SECOND", "5000"))
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+
+# Rows per response chunk: each chunk costs a threadpool hop and a socket write
+CHUNK_ROWS = 200
+
+EXPORT_COLUMNS = ("id", "user_id", "timestamp", "user_query", "ai_response")
+TABLE = models.ChatMessage.__table__
+
+_active_exports = 0
+_active_lock = threading.Lock()
+
+export_router = APIRouter(prefix="/admin/export", tags=["Admin"])
+
+
+def require_admin_key(x_admin_key: Optional[str]) -> None:
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin key")
+
+
+def iter_chat_messages(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    after: Optional[tuple] = None,
+    max_rows: Optional[int] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+    max_rows_per_second: float = EXPORT_MAX_ROWS_PER_SECOND,
+) -> Iterator[dict]:
+    """
+    Yields chat_messages rows ordered by (timestamp, id), one keyset page at a
+    time. Each page is a short read on its own connection (server-side cursor
+    on Postgres), so memory stays constant and no transaction spans the export.
+    """
+    started = time.perf_counter()
+    sent = 0
+    while max_rows is None or sent < max_rows:
+        limit = page_size if max_rows is None else min(page_size, max_rows - sent)
+        query = select(*(TABLE.c[name] for name in EXPORT_COLUMNS)).order_by(TABLE.c.timestamp, TABLE.c.id).limit(limit)
+        if since is not None:
+            query = query.where(TABLE.c.timestamp >= since)
+        if until is not None:
+            query = query.where(TABLE.c.timestamp < until)
+        if user_id is not None:
+            query = query.where(TABLE.c.user_id == user_id)
+        if after is not None:
+            query = query.where(tuple_(TABLE.c.timestamp, TABLE.c.id) > after)
+
+        count = 0
+        with replica_engine.connect().execution_options(stream_results=True, yield_per=limit) as conn:
+            for row in conn.execute(query):
+                count += 1
+                after = (row.timestamp, row.id)
+                yield row._asdict()
+        sent += count
+        metrics.EXPORT_ROWS.inc(count)
+        if count < limit:
+            return
+
+        # Throttle: stay under max_rows_per_second on average
+        ahead = sent / max_rows_per_second - (time.perf_counter() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _ndjson(rows: Iterator[dict]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _csv(rows: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        writer.writerow(row[name] for name in EXPORT_COLUMNS)
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+class _ExportSlot:
+    """One of the EXPORT_MAX_CONCURRENT export slots. release() may be called more than once."""
+
+    def __init__(self):
+        self._released = False
+
+    def release(self) -> None:
+        global _active_exports
+        with _active_lock:
+            if not self._released:
+                self._released = True
+                _active_exports -= 1
+
+
+def _reserve_slot() -> Optional[_ExportSlot]:
+    """Checks and takes a slot in one step, so simultaneous requests cannot all get past the limit."""
+    global _active_exports
+    with _active_lock:
+        if _active_exports >= EXPORT_MAX_CONCURRENT:
+            return None
+        _active_exports += 1
+    return _ExportSlot()
+
+
+def _tracked(chunks: Iterator[str], slot: _ExportSlot) -> Iterator[str]:
+    """Holds the export slot while the body is being produced."""
+    start = time.perf_counter()
+    try:
+        yield from chunks
+    finally:
+        slot.release()
+        logger.info("Chat export finished", extra={"duration_s": round(time.perf_counter() - start, 2)})
+
+
+@export_router.get("/chat-messages")
+def export_chat_messages(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = Query(None, description="inclusive lower bound on timestamp"),
+    until: Optional[datetime] = Query(None, description="exclusive upper bound on timestamp"),
+    user_id: Optional[int] = None,
+    after_timestamp: Optional[datetime] = Query(None, description="resume after this row (with after_id)"),
+    after_id: Optional[int] = None,
+    max_rows: Optional[int] = Query(None, ge=1),
+    x_admin_key: Optional[str] = Header(None),
+):
+    """
+    Streams chat_messages as NDJSON or CSV, ordered by (timestamp, id).
+    An interrupted export resumes with after_timestamp/after_id set to the
+    last row received. Reads go to READ_REPLICA_DATABASE_URL when configured.
+    """
+    require_admin_key(x_admin_key)
+    if (after_timestamp is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_timestamp and after_id must be given together")
+    slot = _reserve_slot()
+    if slot is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many exports in progress, retry later.",
+            headers={"Retry-After": "30"},
+        )
+
+    try:
+        logger.info("Chat export started", extra={"format": format, "since": str(since), "until": str(until)})
+        after = (after_timestamp, after_id) if after_id is not None else None
+        rows = iter_chat_messages(since, until, user_id, after, max_rows)
+        body = _ndjson(rows) if format == "ndjson" else _csv(rows)
+        media_type = "application/x-ndjson" if format == "ndjson" else "text/csv; charset=utf-8"
+        filename = f"chat_messages-{datetime.utcnow():%Y%m%dT%H%M%S}.{'ndjson' if format == 'ndjson' else 'csv'}"
+        return StreamingResponse(
+            _tracked(body, slot),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            # Runs after the response even when the body never started (client gone before the first chunk)
+            background=BackgroundTask(slot.release),
+        )
+    except BaseException:
+        slot.release()
+        raise
@@ -0,0 +1,315 @@
+"""
+Deterministic answers to "how much does it cost to send 20,000 FCFA?" questions.
+
+The fee grids in knowledge_base.py (P2P brackets, P2C / cash-out rates, ATM
+withdrawals with and without a MoMo account, CEMAC and national GIMACPAY
+remittances, MUCODEC Push/Pull, XtraCash access fees) are parsed once at
+import into interval tables searched with bisect.
+answer_fee_question() extracts the service and the amount from the message
+and fills a French or English template, in a few microseconds, with no Azure
+call. Anything it is not sure about (no or several amounts, unknown or
+ambiguous service, amount outside the published grid, extra questions in the
+same message) returns None and the message goes to the LLM as before.
+
+If a grid can no longer be parsed after a KB edit, that service simply stops
+being answered here (a warning is logged at import).
+"""
+import re
+import logging
+import unicodedata
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from knowledge_base import TRANSFERS, BANKTECH, REMITTANCE, XTRACASH, MOMOPAY
+from metrics import FEE_INTENTS
+
+logger = logging.getLogger(__name__)
+
+# Longer messages usually ask more than the fee; leave those to the LLM
+MAX_QUESTION_WORDS = 25
+
+
+class Bracket(NamedTuple):
+    low: int
+    high: int
+    fixed: int = 0
+    percent: float = 0.0
+
+
+class Tariff:
+    """Non-overlapping amount brackets, sorted by lower bound; lookup is a bisect."""
+    def __init__(self, brackets: List[Bracket]):
+        self.brackets = sorted(brackets)
+        self.lows = [b.low for b in self.brackets]
+
+    def lookup(self, amount: int) -> Optional[Bracket]:
+        i = bisect_right(self.lows, amount) - 1
+        if i >= 0 and amount <= self.brackets[i].high:
+            return self.brackets[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.brackets)
+
+
+def fee_for(bracket: Bracket, amount: int) -> int:
+    # Percentages are truncated to the franc, as in the KB's XtraCash example (12.5% of 2,500 -> 312)
+    return bracket.fixed + int(amount * bracket.percent / 100)
+
+
+# ---- Parsing the KB text ----
+_NUM = r"\d{1,3}(?:,\d{3})+|\d+"
+# "251 – 11,000 FCFA → 50 FCFA", "From 1 to 5,000 FCFA: 125 FCFA",
+# "1–200,000 FCFA → 3.5%", "From 125,001 to 250,000 FCFA → 3,389 FCFA plus 1% of the amount"
+_BRACKET_RE = re.compile(
+    rf"(?:from|between)?\s*({_NUM})\s*(?:–|-|to|and)\s*({_NUM})\s*FCFA\s*(?:→|:)\s*"
+    rf"(?:({_NUM})\s*FCFA)?\s*(?:\+|plus)?\s*(?:(\d+(?:\.\d+)?)%)?",
+    re.IGNORECASE,
+)
+
+
+def _int(value: str) -> int:
+    return int(value.replace(",", ""))
+
+
+def section(text: str, start: str, end: str) -> str:
+    """The part of `text` between the `start` and `end` markers ("" if either is missing)."""
+    i = text.find(start)
+    j = text.find(end, i + len(start)) if i >= 0 else -1
+    return text[i + len(start):j] if j >= 0 else ""
+
+
+def parse_brackets(text: str) -> Tariff:
+    brackets = []
+    for line in text.splitlines():
+        m = _BRACKET_RE.search(line)
+        if not m or (m.group(3) is None and m.group(4) is None):
+            continue
+        low, high, fixed, percent = m.groups()
+        brackets.append(Bracket(_int(low), _int(high), _int(fixed) if fixed else 0,
+                                float(percent) if percent else 0.0))
+    return Tariff(brackets)
+
+
+def parse_flat_rate(text: str, pattern: str) -> Tariff:
+    """A single rate such as "charged at 3.75%" applied to any amount."""
+    m = re.search(pattern + r"\s*(\d+(?:\.\d+)?)%", text, re.IGNORECASE)
+    return Tariff([Bracket(1, 10**9, 0, float(m.group(1)))] if m else [])
+
+
+# service -> (French label, English label)
+SERVICE_LABELS: Dict[str, Tuple[str, str]] = {
+    "p2p": ("un transfert MoMo vers MoMo (P2P)", "a MoMo to MoMo transfer (P2P)"),
+    "p2c": ("un transfert vers un non-abonné MoMo (P2C)", "a transfer to a non-MoMo customer (P2C)"),
+    "cash_out": ("un retrait chez un agent (Cash-Out)", "a withdrawal at an agent (Cash-Out)"),
+    "cash_in": ("un dépôt chez un agent (Cash-In)", "a deposit at an agent (Cash-In)"),
+    "atm": ("un retrait au GAB avec compte MoMo", "an ATM withdrawal with a MoMo account"),
+    "atm_no_account": ("un retrait au GAB sans compte MoMo", "an ATM withdrawal without a MoMo account"),
+    "remittance_cemac": ("un transfert international (zone CEMAC, GIMACPAY)",
+                         "an international transfer (CEMAC zone, GIMACPAY)"),
+    "remittance_national": ("un transfert national GIMACPAY", "a national GIMACPAY transfer"),
+    "bank": ("une opération Push/Pull MUCODEC", "a MUCODEC Push/Pull operation"),
+    "momopay": ("un paiement marchand MoMoPay", "a MoMoPay merchant payment"),
+    "xtracash_7d": ("un prêt XtraCash 7 jours", "a 7-day XtraCash loan"),
+    "xtracash_28d": ("un prêt XtraCash 28 jours", "a 28-day XtraCash loan"),
+    "xtracash_daily": ("un prêt XtraCash journalier", "a daily XtraCash loan"),
+}
+
+
+def build_tariffs() -> Dict[str, Tariff]:
+    p2p = section(TRANSFERS, "For transfers between:", "2. P2C")
+    tariffs = {
+        "p2p": parse_brackets(p2p),
+        "p2c": parse_flat_rate(section(TRANSFERS, "2. P2C", "3. Cash-In"), r"charged at"),
+        "cash_out": parse_flat_rate(section(TRANSFERS, "4. Cash-Out", "5. Cash-Out"), r"Customer is charged"),
+        "cash_in": (Tariff([Bracket(1, 10**9)])
+                    if "customer is not charged" in section(TRANSFERS, "3. Cash-In", "4. Cash-Out").lower()
+                    else Tariff([])),
+        "atm": parse_brackets(section(BANKTECH, "Fees With MoMo Account:", "Fees Without MoMo Account:")),
+        "atm_no_account": parse_brackets(section(BANKTECH, "Fees Without MoMo Account:", "CORPORATE SERVI")),
+        "remittance_cemac": parse_brackets(section(REMITTANCE, "International Transfer Fees", "National Transfer Fees")),
+        "remittance_national": parse_brackets(section(REMITTANCE, "National Transfer Fees", "Key Features")),
+        "bank": parse_brackets(section(REMITTANCE, "Fees (Frais Brut TTC)", "Additional Fee Grid")),
+        "momopay": (Tariff([Bracket(1, 10**9)])
+                    if "no fees are charged to the customer" in MOMOPAY.lower() else Tariff([])),
+        "xtracash_7d": parse_flat_rate(section(XTRACASH, "1. 7-Day Loan", "2. 28-Day"), r"Access fee:"),
+        "xtracash_28d": parse_flat_rate(section(XTRACASH, "2. 28-Day Loan", "3. Daily"), r"Access fee:"),
+        "xtracash_daily": parse_flat_rate(section(XTRACASH, "3. Daily Loan", "USSD Code"), r"Access fee:"),
+    }
+    # Loans are only granted within the advertised range
+    loan_range = re.search(rf"borrow between ({_NUM}) and ({_NUM}) FCFA", XTRACASH)
+    for name in ("xtracash_7d", "xtracash_28d", "xtracash_daily"):
+        if loan_range and tariffs[name]:
+            rate = tariffs[name].brackets[0].percent
+            tariffs[name] = Tariff([Bracket(_int(loan_range.group(1)), _int(loan_range.group(2)), 0, rate)])
+        else:
+            tariffs[name] = Tariff([])
+
+    for name, tariff in tariffs.items():
+        if not tariff:
+            logger.warning("Fee grid %r could not be parsed from the KB; those questions go to the LLM", name)
+    return tariffs
+
+
+TARIFFS = build_tariffs()
+
+
+# ---- Intent detection ----
+def fold(text: str) -> str:
+    """Lowercase without accents; unlike normalize_text, keeps digits' separators and symbols."""
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+FEE_WORDS_RE = re.compile(
+    r"\b(frais|cout|coute|couter|combien|tarif|tarifs|prix|commission|charge|charges"
+    r"|fee|fees|cost|costs|charged|how much|price)\b"
+)
+# Checked in order: the first service whose pattern matches wins, generic "transfer" last
+SERVICE_PATTERNS: List[Tuple[str, re.Pattern]] = [(name, re.compile(p)) for name, p in (
+    ("xtracash", r"\b(xtracash|xtra cash|pret|prets|loan|loans|emprunt|emprunter|borrow)\b"),
+    ("remittance_cemac", r"\b(cemac|international|internationale?s?|gabon|cameroun|cameroon|tchad|chad|rca"
+                         r"|centrafrique|guinee|equatorial)\b"),
+    ("remittance_national", r"\bgimac ?pay\b.*\bnational|\bnational\w*\b.*\bgimac ?pay\b"),
+    ("bank", r"\b(push|pull|mucodec|banque|bank|bancaire)\b"),
+    ("atm", r"\b(atm|gab|distributeur|guichet automatique)\b"),
+    ("momopay", r"\b(momopay|momo pay|marchand|merchant)\b"),
+    ("p2c", r"\b(p2c|non[- ]momo|non[- ]abonne|sans compte|without (a )?momo|pas de compte|n'a pas de momo)\b"),
+    ("cash_in", r"\b(depot|deposer|deposit|cash[- ]?in)\b"),
+    ("cash_out", r"\b(retrait|retirer|withdraw|withdrawal|cash[- ]?out|cashout)\b"),
+    ("p2p", r"\b(transfert|transferts|transferer|transfer|transfers|envoi|envoyer|envoie|send|sending|p2p)\b"),
+)]
+# ATM withdrawals have a second grid for people without a MoMo account
+NO_ACCOUNT_RE = re.compile(
+    r"\b(sans (un )?compte|sans momo|without (a )?(momo )?account|without momo|pas de compte"
+    r"|n'a pas de (compte )?momo|non[- ]abonne|non[- ]momo)\b"
+)
+LOAN_TERMS = [
+    ("xtracash_28d", re.compile(r"\b28\s*(j|jours?|days?|-day)\b")),
+    ("xtracash_7d", re.compile(r"\b7\s*(j|jours?|days?|-day)\b|\b(semaine|week)\b")),
+    ("xtracash_daily", re.compile(r"\b(journalier|daily|1\s*(jour|day)|un jour|one day)\b")),
+]
+# Amounts: 20000, 20 000, 20,000, 20.000, 20k, 20 mille, 1 million; not 3.5%, *105# or "7 jours"
+AMOUNT_RE = re.compile(
+    r"(?<![\d*#.,])(\d{1,3}(?:[ \u00a0\u202f.,]\d{3})+|\d+)\s*(k\b|mille\b|millions?\b)?(?![\d%#*]|[.,]\d|\s*%)"
+    r"(?!\s*(?:j\b|jours?\b|days?\b|-day|semaines?\b|weeks?\b|mois\b|months?\b|ans?\b|years?\b))"
+)
+FRENCH_HINTS_RE = re.compile(r"\b(combien|frais|cout|coute|envoyer|transfert|retrait|pour|je|de|le|la|un|une|quel|quels)\b")
+ENGLISH_HINTS_RE = re.compile(r"\b(how|much|fee|fees|cost|send|the|to|what|is|for|withdraw)\b")
+
+
+class FeeQuery(NamedTuple):
+    service: str
+    amount: int
+    lang: str  # "fr" or "en"
+
+
+def extract_amounts(folded: str) -> List[int]:
+    amounts = []
+    for digits, unit in AMOUNT_RE.findall(folded):
+        value = int(re.sub(r"\D", "", digits))
+        if unit == "k" or unit == "mille":
+            value *= 1000
+        elif unit.startswith("million"):
+            value *= 1_000_000
+        if value and value not in amounts:
+            amounts.append(value)
+    return amounts
+
+
+def detect_language(folded: str) -> str:
+    return "en" if len(ENGLISH_HINTS_RE.findall(folded)) > len(FRENCH_HINTS_RE.findall(folded)) else "fr"
+
+
+def detect_fee_intent(message: str) -> Tuple[Optional[FeeQuery], str]:
+    """
+    Returns (FeeQuery, "answered") for an unambiguous fee question, otherwise
+    (None, reason) where reason is "not_fee", "no_amount", "ambiguous_amount", "no_service",
+    "ambiguous_loan" or "too_long".
+    """
+    folded = fold(message)
+    if not FEE_WORDS_RE.search(folded):
+        return None, "not_fee"
+    if len(folded.split()) > MAX_QUESTION_WORDS or folded.count("?") > 1:
+        return None, "too_long"
+    amounts = extract_amounts(folded)
+    if not amounts:
+        return None, "no_amount"
+    if len(amounts) > 1:
+        return None, "ambiguous_amount"
+    service = next((name for name, pattern in SERVICE_PATTERNS if pattern.search(folded)), None)
+    if service is None:
+        return None, "no_service"
+    if service == "xtracash":
+        service = next((name for name, pattern in LOAN_TERMS if pattern.search(folded)), None)
+        if service is None:
+            return None, "ambiguous_loan"
+    elif service == "atm" and NO_ACCOUNT_RE.search(folded):
+        service = "atm_no_account"
+    return FeeQuery(service, amounts[0], detect_language(folded)), "answered"
+
+
+# ---- Answer templates ----
+def format_amount(value: float, lang: str) -> str:
+    text = f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+    # French: space as thousands separator and a decimal comma
+    return text.replace(",", " ").replace(".", ",") if lang == "fr" else text
+
+
+def format_percent(value: float, lang: str) -> str:
+    text = f"{value:g}"
+    return f"{text.replace('.', ',')} %" if lang == "fr" else f"{text}%"
+
+
+def render_answer(query: FeeQuery, bracket: Bracket) -> str:
+    fr = query.lang == "fr"
+    label = SERVICE_LABELS[query.service][0 if fr else 1]
+    amount = format_amount(query.amount, query.lang)
+    fee = fee_for(bracket, query.amount)
+
+    if fee == 0:
+        return (f"Pour {label} de {amount} FCFA, aucun frais n'est facturé au client."
+                if fr else f"For {label} of {amount} FCFA, the customer is not charged any fee.")
+
+    if bracket.percent and bracket.fixed:
+        rule = (f"{format_amount(bracket.fixed, 'fr')} FCFA + {format_percent(bracket.percent, 'fr')} du montant"
+                if fr else f"{format_amount(bracket.fixed, 'en')} FCFA + {format_percent(bracket.percent, 'en')} of the amount")
+    elif bracket.percent:
+        rule = (f"{format_percent(bracket.percent, 'fr')} du montant"
+                if fr else f"{format_percent(bracket.percent, 'en')} of the amount")
+    else:
+        rule = None
+    if bracket.high < 10**9:
+        grid = (f"tranche {format_amount(bracket.low, 'fr')} – {format_amount(bracket.high, 'fr')} FCFA"
+                if fr else f"bracket {format_amount(bracket.low, 'en')} – {format_amount(bracket.high, 'en')} FCFA")
+        detail = f"{grid}, {rule}" if rule else grid
+    else:
+        detail = rule
+
+    fee_text = format_amount(fee, query.lang)
+    if query.service.startswith("xtracash"):
+        return (f"Pour {label} de {amount} FCFA, les frais d'accès sont de {fee_text} FCFA ({detail}), "
+                f"hors intérêts et pénalités de retard."
+                if fr else f"For {label} of {amount} FCFA, the access fee is {fee_text} FCFA ({detail}), "
+                f"excluding interest and late penalties.")
+    return (f"Pour {label} de {amount} FCFA, les frais sont de {fee_text} FCFA ({detail})."
+            if fr else f"For {label} of {amount} FCFA, the fee is {fee_text} FCFA ({detail}).")
+
+
+def answer_fee_question(message: str) -> Optional[str]:
+    """Templated answer for a clear fee question, or None to let the LLM answer."""
+    query, outcome = detect_fee_intent(message)
+    if query is not None:
+        tariff = TARIFFS.get(query.service)
+        if not tariff:
+            outcome = "unavailable"
+        else:
+            bracket = tariff.lookup(query.amount)
+            if bracket is None:
+                outcome = "out_of_range"
+            else:
+                FEE_INTENTS.labels("answered").inc()
+                return render_answer(query, bracket)
+    if outcome != "not_fee":
+        FEE_INTENTS.labels(outcome).inc()
+    return None
@@ -0,0 +1,128 @@
+from typing import List
+
+# Same boundaries as str.splitlines()
+_LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+# Heading / quote / rule markers dropped from the start of a line
+_LINE_PREFIX_CHARS = "#=>"
+
+# ❖ main items (no indent), • sub-items (4 spaces), ◦ details (8 spaces)
+_BULLET_PREFIXES = {
+    "❖": "❖ ",
+    "•": "    • ",
+    "◦": "        ◦ ",
+}
+
+
+def _strip_markdown(text: str) -> str:
+    """
+    Removes non-essential Markdown characters, preserving list markers and codes.
+
+    The removals run in C (`str.replace`) and are skipped entirely when the
+    character they target is absent, which is the common case for most lines.
+    """
+    if "*" in text:
+        text = text.replace('***', '').replace('**', '')
+    if "#" in text:
+        text = text.replace('###', '').replace('##', '')
+    if "`" in text:
+        text = text.replace(' ```', '').replace('``', '')
+    if "_" in text:
+        text = text.replace('_', '')
+    return text
+
+
+def _format_line(line: str) -> str:
+    """
+    Formats an already cleaned line:
+      - drops a leading heading / quote / rule marker (#, =, >)
+      - enforces ❖ / • / ◦ indentation
+    """
+    line = line.strip()
+    if not line:
+        return ""
+
+    head = line[0]
+    if head in _LINE_PREFIX_CHARS:
+        line = line[1:].lstrip()
+        if not line:
+            return ""
+        head = line[0]
+
+    prefix = _BULLET_PREFIXES.get(head)
+    if prefix is not None:
+        return prefix + line[1:].strip()
+    return line
+
+
+def format_response(text: str) -> str:
+    """
+    Cleans an Azure reply in a single pass over its lines.
+
+    Output is identical to the former `strip_markdown` followed by
+    `enforce_list_indentation`.
+    """
+    if not text:
+        return ""
+    lines = _strip_markdown(text).splitlines()
+    return "\n".join([_format_line(line) for line in lines]).strip("\n")
+
+
+class StreamingFormatter:
+    """
+    Incremental version of `format_response` for streamed replies.
+
+    Feed chunks as they arrive; each call returns the formatted text that is
+    safe to emit so far. Only complete lines are formatted, and blank lines
+    are held back until the next non-empty line, so the concatenation of
+    every `feed()` result plus `finish()` equals `format_response(full_text)`.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._started = False
+        self._pending_blank = 0
+        self._after_cr = False
+
+    def _emit(self, pieces: List[str]) -> str:
+        """Formats complete lines (with their line terminators kept)."""
+        out: List[str] = []
+        for piece in pieces:
+            content = piece.rstrip(_LINE_BREAKS)
+            terminator = piece[len(content):]
+            content = _strip_markdown(content)
+
+            # "\r" + <markup that vanishes> + "\n" collapses into a single
+            # "\r\n" break, exactly as it does when cleaning the whole text.
+            if self._after_cr and terminator == "\n" and not content:
+                self._after_cr = False
+                continue
+            self._after_cr = terminator == "\r"
+
+            line = _format_line(content)
+            if not line:
+                if self._started:
+                    self._pending_blank += 1
+                continue
+            if self._started:
+                out.append("\n" * (self._pending_blank + 1))
+            self._started = True
+            self._pending_blank = 0
+            out.append(line)
+        return "".join(out)
+
+    def feed(self, chunk: str) -> str:
+        """Buffers `chunk` and returns the formatted text of any completed lines."""
+        if not chunk:
+            return ""
+        pieces = (self._partial + chunk).splitlines(keepends=True)
+        if pieces[-1][-1] in _LINE_BREAKS:
+            self._partial = ""
+        else:
+            self._partial = pieces.pop()
+        return self._emit(pieces)
+
+    def finish(self) -> str:
+        """Flushes the buffered partial line. Trailing blank lines are dropped."""
+        rest, self._partial = self._partial, ""
+        return self._emit([rest]) if rest else ""
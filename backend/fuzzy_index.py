@@ -0,0 +1,123 @@
+"""
+Typo-tolerant lookup of query words in the KB vocabulary (SymSpell-style).
+
+A query word missing from INVERTED_INDEX ("tranfert", "retarit") is mapped to
+the closest KB term within a small edit distance. At build time every term is
+stored under each of its deletion variants, up to MAX_EDIT_DISTANCE deleted
+letters ("retrait" -> "etrait", "rtrait", ..., "retrat", ...). A lookup makes
+the same variants of the query word, so candidates come from a few binary
+searches instead of a scan of the vocabulary, and only those are checked with
+the real distance (Damerau-Levenshtein with adjacent transpositions).
+
+A big KB has tens of variants per term, so they are not kept as strings: the
+index is a sorted array of variant hashes next to an array of term ids
+(~12 bytes a variant). A hash collision only adds a candidate that the distance
+check then rejects. hash() is salted per process; the index is built and read
+in the same one (or in workers forked from it).
+
+The allowed distance grows with the word: none below FUZZY_MIN_LENGTH letters,
+1 up to 7 letters, 2 from 8 (short words have too many close neighbours).
+Ties go to the term found in more chunks.
+"""
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Mapping, Optional, Sequence, Set
+
+_HASH_MASK = (1 << 64) - 1
+
+MAX_EDIT_DISTANCE = 2
+FUZZY_MIN_LENGTH = 5
+TWO_EDITS_MIN_LENGTH = 8
+
+
+def max_distance(word: str) -> int:
+    if len(word) < FUZZY_MIN_LENGTH or not word.isalpha():
+        return 0
+    return 1 if len(word) < TWO_EDITS_MIN_LENGTH else 2
+
+
+def deletes(word: str, distance: int) -> Set[str]:
+    """`word` and every string obtained by deleting up to `distance` letters from it."""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 as soon as it is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyTermIndex:
+    def __init__(self):
+        self._terms: List[str] = []
+        self._frequency = array("I")
+        # Sorted hashes of the deletion variants, and the id of the term each comes from
+        self._hashes = array("Q")
+        self._term_ids = array("I")
+
+    def build(self, inverted_index: Mapping[str, Sequence[int]]) -> None:
+        """Indexes the alphabetic terms of INVERTED_INDEX (term -> chunk ids)."""
+        terms, frequency, entries = [], array("I"), []
+        for term, chunk_ids in inverted_index.items():
+            # Shorter terms can still be the correction of a 5-letter word with a letter too many
+            if not term.isalpha() or len(term) < FUZZY_MIN_LENGTH - 1:
+                continue
+            term_id = len(terms)
+            terms.append(term)
+            frequency.append(len(chunk_ids))
+            entries.extend((hash(variant) & _HASH_MASK) << 32 | term_id
+                           for variant in deletes(term, MAX_EDIT_DISTANCE))
+        entries.sort()
+        self._hashes = array("Q", (entry >> 32 for entry in entries))
+        self._term_ids = array("I", (entry & 0xFFFFFFFF for entry in entries))
+        self._terms, self._frequency = terms, frequency
+
+    def lookup(self, word: str) -> Optional[str]:
+        """The KB term closest to `word` within its allowed distance, or None."""
+        distance = max_distance(word)
+        if distance == 0 or not self._terms:
+            return None
+        hashes, size = self._hashes, len(self._hashes)
+        best, best_rank = None, None
+        seen: Set[int] = set()
+        for variant in deletes(word, distance):
+            h = hash(variant) & _HASH_MASK
+            i = bisect_left(hashes, h)
+            while i < size and hashes[i] == h:
+                term_id = self._term_ids[i]
+                i += 1
+                if term_id in seen:
+                    continue
+                seen.add(term_id)
+                term = self._terms[term_id]
+                d = edit_distance(word, term, distance)
+                if d > distance:
+                    continue
+                rank = (d, -self._frequency[term_id], term)
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = term, rank
+        return best
+
+    def terms(self) -> Iterable[str]:
+        return self._terms
+
+    def __len__(self) -> int:
+        return len(self._terms)
@@ -0,0 +1,74 @@
+"""
+Generation profiles: how much the LLM may write for a request, and on which deployment.
+
+A rule-based classifier over signals the prompt builder already has (overview
+intent, whether any KB chunk matched, message length and wording) picks one of:
+
+  - smalltalk: greetings, thanks, off-topic one-liners (no KB match)
+  - brief:     a short lookup question (a fee, a rate, a code, a phone number, eligibility)
+  - standard:  everything else, as before
+  - overview:  the full-KB overview prompt
+
+Each profile has its own max_tokens ceiling (GENERATION_<PROFILE>_MAX_TOKENS) and
+deployment (GENERATION_<PROFILE>_DEPLOYMENT). smalltalk and brief default to
+AZURE_FAST_DEPLOYMENT_NAME when it is set, the others to AZURE_DEPLOYMENT_NAME.
+"""
+import os
+import re
+from typing import Dict, NamedTuple
+
+from kb_config import normalize_text
+
+AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4o-mini-deployment")
+# Smaller / faster deployment for the simple profiles; unset: everything on AZURE_DEPLOYMENT_NAME
+AZURE_FAST_DEPLOYMENT_NAME = os.getenv("AZURE_FAST_DEPLOYMENT_NAME") or AZURE_DEPLOYMENT_NAME
+
+# Messages up to this many words without any KB match are small talk
+SMALLTALK_MAX_WORDS = 8
+# Lookup questions up to this many words that do not ask for an explanation are brief
+BRIEF_MAX_WORDS = 14
+# Wording (folded) of questions whose answer is a figure, a code or a yes/no
+LOOKUP_RE = re.compile(
+    r"\b(combien|how much|cost\w*|coute\w*|frais|fees?|prix|price|taux|rate|interet|interest|plafond|limit"
+    r"|numero|number|where|eligible|eligibilite|puis-je|can i|est-ce que|is there|are there)\b"
+)
+# Wording (folded) that asks for an explanation or a procedure, whatever the length of the question
+DETAIL_RE = re.compile(
+    r"\b(explique\w*|explain\w*|detail\w*|difference\w*|compar\w*|tous|toutes|all|list\w*"
+    r"|etapes|steps|pourquoi|why|avantages|advantages|conditions|comment|how do|how can i|how to|ndenge)\b"
+)
+
+
+class GenerationProfile(NamedTuple):
+    name: str
+    deployment: str
+    max_tokens: int
+
+
+def _profile(name: str, deployment: str, max_tokens: int) -> GenerationProfile:
+    env = name.upper()
+    return GenerationProfile(
+        name,
+        os.getenv(f"GENERATION_{env}_DEPLOYMENT", deployment),
+        int(os.getenv(f"GENERATION_{env}_MAX_TOKENS", str(max_tokens))),
+    )
+
+
+PROFILES: Dict[str, GenerationProfile] = {
+    "smalltalk": _profile("smalltalk", AZURE_FAST_DEPLOYMENT_NAME, 200),
+    "brief": _profile("brief", AZURE_FAST_DEPLOYMENT_NAME, 500),
+    "standard": _profile("standard", AZURE_DEPLOYMENT_NAME, 1200),
+    "overview": _profile("overview", AZURE_DEPLOYMENT_NAME, 1200),
+}
+
+
+def choose_profile(user_message: str, is_overview: bool, has_kb_context: bool) -> GenerationProfile:
+    if is_overview:
+        return PROFILES["overview"]
+    folded = normalize_text(user_message)
+    words = len(folded.split())
+    if not has_kb_context and words <= SMALLTALK_MAX_WORDS:
+        return PROFILES["smalltalk"]
+    if words <= BRIEF_MAX_WORDS and LOOKUP_RE.search(folded) and not DETAIL_RE.search(folded):
+        return PROFILES["brief"]
+    return PROFILES["standard"]
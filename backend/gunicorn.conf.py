@@ -0,0 +1,76 @@
+"""
+Production server config: gunicorn master + N uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app        (or: python run.py)
+
+The app is imported once in the master (preload_app), which also applies the
+database migrations, so workers starting together don't race on the same DDL,
+and then empties its connection pool: a worker must not inherit a socket.
+The KB index and chunk metadata are built there too, before any worker is
+forked, so all workers share those pages copy-on-write. gc.freeze() moves everything allocated so far
+out of the collector's reach, otherwise the first GC pass in each worker
+would touch (and so copy) every object header.
+
+Per-worker state stays per worker: AZURE_SEMAPHORE, QUERY_CACHE, the session
+history and the memory rate-limit store. Set SHARED_CACHE_URL (see
+shared_cache.py) and RATE_LIMIT_STORE=sqlite:///... to share them. Metrics
+are summed over the workers through METRICS_MULTIPROC_DIR (see metrics.py),
+a fresh temporary directory unless set.
+"""
+import gc
+import os
+import glob
+import shutil
+import tempfile
+
+# Read by metrics.py at import, so set before the app is loaded
+_OWN_METRICS_DIR = None
+if not os.getenv("METRICS_MULTIPROC_DIR"):
+    _OWN_METRICS_DIR = os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="momochat-metrics-")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Streaming replies can legitimately take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None
+
+
+def on_starting(server):
+    """Runs in the master once the app is imported, before the sockets are bound and the workers forked."""
+    # A directory given through the environment may hold the files of a previous run
+    for path in glob.glob(os.path.join(os.environ["METRICS_MULTIPROC_DIR"], "*.json")):
+        os.remove(path)
+    import main
+    import database
+    main.create_database_tables()
+    # The migration left a connection in the pool; a forked worker must not reuse its socket
+    database.engine.dispose()
+    database.replica_engine.dispose()
+    server.log.info("Database migrations applied")
+
+
+def when_ready(server):
+    """Runs in the master after the app import, right before the workers are forked."""
+    import kb_config
+    kb_config.load_knowledge_base()
+    gc.freeze()
+    server.log.info("KB preloaded (%d index terms), %d objects frozen before fork",
+                    len(kb_config.INVERTED_INDEX), gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after the fork."""
+    import database
+    # Drops, without closing them, pooled connections the master opened after on_starting:
+    # closing would end the master's session on the shared socket
+    database.engine.dispose(close=False)
+    database.replica_engine.dispose(close=False)
+
+
+def on_exit(server):
+    if _OWN_METRICS_DIR:
+        shutil.rmtree(_OWN_METRICS_DIR, ignore_errors=True)
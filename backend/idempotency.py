@@ -0,0 +1,126 @@
+"""
+Idempotency-Key support for /chat.
+
+A client (the browser, or chat-proxy.js on a retry) that resubmits a message
+with the same Idempotency-Key gets the answer of the first submission instead
+of a second Azure completion and a second chat_messages row:
+
+  - while the first submission is still being answered, the duplicate waits for it;
+  - once it is answered, the response is replayed for IDEMPOTENCY_TTL_SECONDS.
+
+Keys live in the worker process, in an LRU bounded to IDEMPOTENCY_MAX_KEYS.
+Failures are not kept: a duplicate waiting on a failed submission gets the same
+error, and a later retry is answered anew.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+from metrics import IDEMPOTENCY_KEYS
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class _Abandoned(Exception):
+    """The first submission was cancelled before it had an answer."""
+
+
+def request_fingerprint(*parts: Optional[str]) -> str:
+    return hashlib.sha256("\x1f".join(p or "" for p in parts).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "expires_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.future = future
+        # Set once the answer is stored
+        self.expires_at: Optional[float] = None
+
+
+class IdempotencyStore:
+    """
+    `run(key, fingerprint, compute)` awaits `compute()` once per key. A waiting
+    duplicate whose original fails with one of `retry_on` (e.g. its client
+    disconnected) computes the answer itself instead of sharing the failure.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS,
+                 retry_on: Tuple[Type[Exception], ...] = ()):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.retry_on = (_Abandoned,) + tuple(retry_on)
+        # Completed entries are moved to the end, so the oldest answers sit at the front
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        """Makes room for one more key: expired answers first, then the oldest keys."""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) < self.max_keys and (entry.expires_at is None or entry.expires_at > now):
+                break
+            del self._entries[key]
+            IDEMPOTENCY_KEYS.labels("evicted" if entry.expires_at is None or entry.expires_at > now
+                                    else "expired").inc()
+
+    def _lookup(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None and entry.expires_at <= now:
+            del self._entries[key]
+            IDEMPOTENCY_KEYS.labels("expired").inc()
+            return None
+        return entry
+
+    async def run(self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, replayed): replayed is True when the result comes from an earlier submission."""
+        while True:
+            entry = self._lookup(key, time.monotonic())
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                IDEMPOTENCY_KEYS.labels("conflict").inc()
+                raise IdempotencyKeyReused(key)
+            if entry.future.done():
+                IDEMPOTENCY_KEYS.labels("replayed").inc()
+                return entry.future.result(), True
+            IDEMPOTENCY_KEYS.labels("joined").inc()
+            try:
+                # Shielded: a duplicate that goes away must not cancel the original
+                return await asyncio.shield(entry.future), True
+            except self.retry_on:
+                continue
+
+        IDEMPOTENCY_KEYS.labels("new").inc()
+        self._evict(time.monotonic())
+        entry = _Entry(fingerprint, asyncio.get_running_loop().create_future())
+        self._entries[key] = entry
+        try:
+            result = await compute()
+        except BaseException as e:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            entry.future.set_exception(e if isinstance(e, Exception) else _Abandoned())
+            # Marks the exception as retrieved: nobody may be waiting on it
+            entry.future.exception()
+            raise
+        entry.future.set_result(result)
+        if self._entries.get(key) is entry:
+            entry.expires_at = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+        return result, False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -2,8 +2,8 @@ import re
 import os
 import logging
 import asyncio
+import threading
 import unicodedata
-import tiktoken
 import hashlib
 from functools import lru_cache
 from datetime import datetime
@@ -11,6 +11,11 @@ from collections import defaultdict, Counter
 from dotenv import load_dotenv
 from typing import Dict, List, Any, Tuple, Optional
 from knowledge_base import *
+from metrics import KB_CACHE_HITS, KB_CACHE_MISSES
+from shared_cache import cache_get, cache_set
+from fuzzy_index import FuzzyTermIndex
+from kb_index import ChunkRecord, KBIndex
+from token_count import MODEL_FOR_TOKEN_COUNT, count_tokens, load_encoding
 
 logger = logging.getLogger(__name__)
 load_dotenv()
@@ -43,7 +48,11 @@ STRUCTURED_KB: dict = {}
 KB_INIT_TASK: Optional[asyncio.Task] = None
 KB_STATUS = {"ready": False, "last_error": None, "keys": []}
 
-CHUNK_METADATA = {}  # Filled at startup
+CHUNK_METADATA: Dict[str, ChunkRecord] = {}  # Filled at startup
+INVERTED_INDEX = KBIndex()  # Filled at startup
+FUZZY_INDEX = FuzzyTermIndex()  # Misspelled query word -> INVERTED_INDEX term, filled at startup
+# Content hash of INITIAL_KB_CHUNKS; namespaces shared cache entries so a KB edit invalidates them
+KB_VERSION = ""
 
 INITIAL_KB_CHUNKS = {
     'BASIC_SERVICES': BASIC_SERVICES.strip(),
@@ -172,20 +181,16 @@ def extract_keywords(query: str, top_n: int = 12) -> List[str]:
     return [k for k in result if not (k in seen or seen.add(k))]
 
 # ---- Inverted index builder (called once at startup) ----
-def build_inverted_index(kb_chunks: Dict[str, str]) -> Dict[str, List[str]]:
+def build_inverted_index(kb_chunks: Dict[str, str]) -> KBIndex:
     """
     kb_chunks: {key: text}
-    returns: dict token -> list of chunk_keys that contain it
+    returns: KBIndex, token -> ids of the chunks that contain it (see kb_index.py)
     """
-    index = defaultdict(list)
+    index = KBIndex()
     for key, text in kb_chunks.items():
         norm = normalize_text(text)
-        tokens = set(re.findall(r"\b[a-z0-9]{3,}\b", norm))
-        for t in tokens:
-            index[t].append(key)
-    return index
-
-MODEL_FOR_TOKEN_COUNT = "gpt-4o-mini"
+        index.add_chunk(key, norm, set(re.findall(r"\b[a-z0-9]{3,}\b", norm)))
+    return index.freeze()
 
 def count_number_of_tokens(text: str, model:str = MODEL_FOR_TOKEN_COUNT) -> tuple[int, int, int]:
     """
@@ -200,14 +205,8 @@ def count_number_of_tokens(text: str, model:str = MODEL_FOR_TOKEN_COUNT) -> tupl
     num_chars = len(text)
     num_words = len(text.split())
 
-    try:
-        enc = tiktoken.encoding_for_model(MODEL_FOR_TOKEN_COUNT)
-    except Exception:
-        # fallback to a generic encoding if model-specific one isn't available
-        enc = tiktoken.get_encoding("cl100k_base")
-    
-    tokens = enc.encode(text)
-    num_tokens = len(tokens)
+    # Encoding loaded once at startup, see token_count.py
+    num_tokens = count_tokens(text)
 
     return num_tokens, num_words, num_tokens
 
@@ -216,43 +215,55 @@ class QueryCache:
     """
     LRU cache for query → KB context mapping.
     Dramatically reduces redundant filtering on repeated queries.
+    Thread-safe: retrieval runs in the threadpool (main.OFFLOAD_RETRIEVAL, or
+    whenever the shared cache behind it is configured, since that lookup blocks).
     """
     def __init__(self, max_size: int = 500):
         self.cache = {}
         self.access_order = []
         self.max_size = max_size
+        self._lock = threading.Lock()
     
     def _hash_query(self, query: str) -> str:
         """Create stable hash of normalized query."""
         return hashlib.md5(normalize_text(query).encode()).hexdigest()
     
     def get(self, query: str) -> Optional[str]:
-        """Returns cached KB context or None."""
+        """Returns cached KB context or None (falls back to the cross-worker cache, if any)."""
         h = self._hash_query(query)
-        if h in self.cache:
-            # Move to end (LRU)
-            self.access_order.remove(h)
-            self.access_order.append(h)
-            return self.cache[h]
-        return None
+        with self._lock:
+            if h in self.cache:
+                # Move to end (LRU)
+                self.access_order.remove(h)
+                self.access_order.append(h)
+                return self.cache[h]
+        shared = cache_get("kb", f"{KB_VERSION}:{h}")
+        if shared is not None:
+            self._store(h, shared)
+        return shared
     
     def set(self, query: str, context: str):
         """Cache KB context for a query."""
         h = self._hash_query(query)
-        
-        if h in self.cache:
-            self.access_order.remove(h)
-        elif len(self.cache) >= self.max_size:
-            # Evict oldest
-            oldest = self.access_order.pop(0)
-            del self.cache[oldest]
-        
-        self.cache[h] = context
-        self.access_order.append(h)
-    
+        self._store(h, context)
+        cache_set("kb", f"{KB_VERSION}:{h}", context)
+
+    def _store(self, h: str, context: str):
+        with self._lock:
+            if h in self.cache:
+                self.access_order.remove(h)
+            elif len(self.cache) >= self.max_size:
+                # Evict oldest
+                oldest = self.access_order.pop(0)
+                del self.cache[oldest]
+
+            self.cache[h] = context
+            self.access_order.append(h)
+
     def clear(self):
-        self.cache.clear()
-        self.access_order.clear()
+        with self._lock:
+            self.cache.clear()
+            self.access_order.clear()
 
 QUERY_CACHE = QueryCache(max_size=500)
 
@@ -278,39 +289,84 @@ def compute_text_similarity(text1: str, text2: str) -> float:
     return intersection / union  # Jaccard similarity
 
 # ---- Pre-compute chunk metadata at startup ----
-def preprocess_chunks(kb_chunks: Dict[str, str]) -> Dict[str, dict]:
+def preprocess_chunks(kb_chunks: Dict[str, str]) -> Dict[str, ChunkRecord]:
     """
-    Pre-compute metadata for all chunks (done once at startup).
-    Includes: normalized text, token count, keywords, length.
+    Pre-compute metadata for all chunks (done once at startup): the token count.
+    The normalized text and keywords live in the inverted index (bigram bitsets, term ids).
     """
     metadata = {}
     for key, text in kb_chunks.items():
-        norm_text = normalize_text(text)
         _, _, token_count = count_number_of_tokens(text)
-        
-        # Extract top keywords from chunk itself
-        tokens = re.findall(r"\b[a-z0-9]{3,}\b", norm_text)
-        chunk_keywords = set(t for t in tokens if t not in STOP_WORDS)
-        
-        metadata[key] = {
-            "text": text,
-            "norm_text": norm_text,
-            "token_count": token_count,
-            "keywords": chunk_keywords,
-            "length": len(text),
-        }
+        metadata[key] = ChunkRecord(key, text, token_count)
     return metadata
 
+def load_knowledge_base() -> KBIndex:
+    """
+    Builds INVERTED_INDEX, FUZZY_INDEX and CHUNK_METADATA once per process. Under gunicorn
+    (preload_app) this runs in the master, so the workers share the pages
+    copy-on-write instead of each building their own copy; later calls are no-ops.
+    """
+    global INVERTED_INDEX, KB_VERSION
+    if INVERTED_INDEX:
+        return INVERTED_INDEX
+    # Before the chunk token counts, and before the fork under gunicorn
+    load_encoding()
+    INVERTED_INDEX = build_inverted_index(INITIAL_KB_CHUNKS)
+    FUZZY_INDEX.build(INVERTED_INDEX)
+    CHUNK_METADATA.update(preprocess_chunks(INITIAL_KB_CHUNKS))
+    KB_VERSION = hashlib.sha1(
+        "\0".join(f"{k}\0{v}" for k, v in INITIAL_KB_CHUNKS.items()).encode("utf-8")
+    ).hexdigest()[:12]
+    return INVERTED_INDEX
+
 # Tuning
 MAX_KB_TOKENS = 2000
 MAX_CHUNKS = 5
 MIN_TOKEN_KEEP = 150  
 
+# ---- Scoring ----
+def rank_chunks(user_query: str, inverted_index: KBIndex) -> List[Tuple[str, float]]:
+    """
+    Scores every KB chunk matching the query's keywords.
+    Returns [(chunk_key, score)] sorted best first (empty if nothing matches).
+    """
+    # 1. --- KEYWORD EXTRACTION ---
+    keywords = extract_keywords(user_query)
+    if not keywords:
+        return []
+    
+    # 2. --- SCORING ---
+    score = defaultdict(float)
+    for kw in keywords:
+        # Exact matches get high priority
+        if kw in inverted_index:
+            for k in inverted_index[kw]:
+                score[k] += 3.0
+        # Misspelled word ("tranfert", "retarit"): the closest KB term, weaker than an exact match
+        else:
+            term = FUZZY_INDEX.lookup(kw)
+            if term is not None:
+                for k in inverted_index.get(term, ()):
+                    score[k] += 1.0
+    
+    if not score:
+        return []
+    
+    # Boost by semantic similarity (compute_text_similarity on the precomputed chunk bigrams)
+    query_signature = inverted_index.query_signature(normalize_text(user_query))
+    for k in score:
+        sim = inverted_index.similarity(query_signature, k)
+        score[k] += 1.5 * sim 
+
+    # 3. --- RANKING ---
+    chunk_keys = inverted_index.chunk_keys
+    return [(chunk_keys[k], sc) for k, sc in sorted(score.items(), key=lambda x: -x[1])]
+
 # ---- Main filter with caching + pre-computation ----
 def get_keyword_filtered_context(
     user_query: str,
     kb_chunks: Dict[str, str],
-    inverted_index: Dict[str, List[str]],
+    inverted_index: KBIndex,
     max_chunks: int = 5,           
     max_kb_tokens: int = 3000,
     use_cache: bool = True
@@ -327,39 +383,16 @@ def get_keyword_filtered_context(
         cached = QUERY_CACHE.get(user_query)
         if cached is not None:
             logger.debug("✓ Cache hit")
+            KB_CACHE_HITS.inc()
             return cached
+        KB_CACHE_MISSES.inc()
     
-    # 2. --- KEYWORD EXTRACTION ---
-    keywords = extract_keywords(user_query)
-    if not keywords:
+    # 2. --- KEYWORD SCORING & RANKING ---
+    ranked = rank_chunks(user_query, inverted_index)
+    if not ranked:
         return ""
     
-    # 3. --- SCORING ---
-    score = defaultdict(float)
-    for kw in keywords:
-        # Exact matches get high priority
-        if kw in inverted_index:
-            for k in inverted_index[kw]:
-                score[k] += 3.0
-        # Fuzzy/Keyword metadata matches
-        else:
-            for k, meta in CHUNK_METADATA.items():
-                if kw in meta["keywords"]:
-                    score[k] += 1.0
-    
-    if not score:
-        return ""
-    
-    # Boost by semantic similarity
-    norm_query = normalize_text(user_query)
-    for k in score:
-        sim = compute_text_similarity(norm_query, CHUNK_METADATA[k]["norm_text"])
-        score[k] += 1.5 * sim 
-
-    # 4. --- RANKING ---
-    ranked = sorted(score.items(), key=lambda x: -x[1])
-    
-    # 5. --- SELECTION  ---
+    # 3. --- SELECTION  ---
     selected_parts = []
     tokens_used = 0
     
@@ -368,24 +401,24 @@ def get_keyword_filtered_context(
             break
             
         meta = CHUNK_METADATA[key]
-        tcount = meta["token_count"]
+        tcount = meta.token_count
         
         # We take the WHOLE chunk if it fits in the budget.
         if tokens_used + tcount <= max_kb_tokens:
-            selected_parts.append(f"[{key}]\n{meta['text'].strip()}")
+            selected_parts.append(f"[{key}]\n{meta.text.strip()}")
             tokens_used += tcount
             logger.debug(f"✓ Included {key} ({tcount} tokens)")
         elif not selected_parts:
             # SAFETY: If even the first chunk is too big, take it anyway.
-            selected_parts.append(f"[{key}]\n{meta['text'].strip()}")
+            selected_parts.append(f"[{key}]\n{meta.text.strip()}")
             tokens_used += tcount
             break
 
-    # 6. --- FINAL FORMAT ---
+    # 4. --- FINAL FORMAT ---
     result = "\n\n".join(selected_parts)
     
     if use_cache:
         QUERY_CACHE.set(user_query, result)
         
-    print(f"Final Context: {tokens_used} tokens from {len(selected_parts)} chunks.")
+    logger.info("Final context", extra={"kb_tokens": tokens_used, "chunks": len(selected_parts)})
     return result
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Compact in-memory form of the knowledge base (INVERTED_INDEX, CHUNK_METADATA).
+
+They used to be a dict of term -> list of chunk-key strings, and a dict per
+chunk holding the text, a normalized copy of it (only read for the bigram
+similarity), a set of its keyword strings and two ints. Every worker carries
+all of it, and it grows with the KB. Now:
+
+  - KBIndex: terms are interned and numbered; the postings of all terms are a
+    single array of chunk ids (array('H'), 'I' past 65535 chunks) sliced by an
+    offsets array. The character bigrams of each chunk, all the normalized
+    copy was kept for, are a bitset (an int) over the bigram vocabulary, so the
+    similarity is an AND and a popcount instead of re-normalizing the chunk.
+  - ChunkRecord: slotted key / text / token_count, the text being the string
+    of INITIAL_KB_CHUNKS rather than a copy.
+
+A handful of large arrays also means few objects whose refcounts a worker
+touches, so fewer pages copied after the gunicorn fork.
+benchmarks/bench_kb_memory.py compares both layouts at 17, 1,000 and 10,000 chunks.
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+
+def bigrams(norm_text: str) -> Set[str]:
+    return {norm_text[i:i + 2] for i in range(len(norm_text) - 1)}
+
+
+class ChunkRecord:
+    __slots__ = ("key", "text", "token_count")
+
+    def __init__(self, key: str, text: str, token_count: int):
+        self.key = key
+        self.text = text
+        self.token_count = token_count
+
+
+class KBIndex(Mapping):
+    """
+    term -> ids of the chunks containing it, in KB order (chunk_keys[id] is the
+    key). Filled with add_chunk(), then freeze() packs it; read-only afterwards.
+    """
+
+    def __init__(self):
+        self.chunk_keys: List[str] = []
+        self._term_ids: Dict[str, int] = {}
+        self._offsets = array("I", [0])
+        self._postings = array("H")
+        self._view = memoryview(self._postings)
+        self._bigram_ids: Dict[str, int] = {}
+        self._signatures: List[int] = []
+        self._pending: Dict[str, List[int]] = {}
+
+    def add_chunk(self, key: str, norm_text: str, terms: Iterable[str]) -> None:
+        chunk_id = len(self.chunk_keys)
+        self.chunk_keys.append(sys.intern(key))
+        for term in terms:
+            self._pending.setdefault(term, []).append(chunk_id)
+        signature = 0
+        for bigram in bigrams(norm_text):
+            signature |= 1 << self._bigram_ids.setdefault(bigram, len(self._bigram_ids))
+        self._signatures.append(signature)
+
+    def freeze(self) -> "KBIndex":
+        postings = array("H" if len(self.chunk_keys) < 1 << 16 else "I")
+        offsets = array("I", [0])
+        for term, chunk_ids in self._pending.items():
+            self._term_ids[sys.intern(term)] = len(self._term_ids)
+            postings.extend(chunk_ids)
+            offsets.append(len(postings))
+        self._pending = {}
+        self._postings, self._offsets = postings, offsets
+        self._view = memoryview(postings)
+        return self
+
+    def __getitem__(self, term: str) -> memoryview:
+        term_id = self._term_ids[term]
+        return self._view[self._offsets[term_id]:self._offsets[term_id + 1]]
+
+    def __contains__(self, term) -> bool:
+        return term in self._term_ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._term_ids)
+
+    def __len__(self) -> int:
+        return len(self._term_ids)
+
+    def query_signature(self, norm_query: str) -> Tuple[int, int]:
+        """(bitset of the query's bigrams known to the KB, number of distinct query bigrams)."""
+        query_bigrams = bigrams(norm_query)
+        signature = 0
+        for bigram in query_bigrams:
+            bigram_id = self._bigram_ids.get(bigram)
+            if bigram_id is not None:
+                signature |= 1 << bigram_id
+        return signature, len(query_bigrams)
+
+    def similarity(self, query_signature: Tuple[int, int], chunk_id: int) -> float:
+        """Jaccard similarity of the query and chunk bigrams, as kb_config.compute_text_similarity."""
+        signature, size = query_signature
+        chunk_signature = self._signatures[chunk_id]
+        if not size or not chunk_signature:
+            return 0.0
+        intersection = (signature & chunk_signature).bit_count()
+        return intersection / (size + chunk_signature.bit_count() - intersection)
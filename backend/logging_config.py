@@ -0,0 +1,138 @@
+import os
+import copy
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# Correlation id of the request currently being handled (set by middleware in main.py)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+# Share of DEBUG records kept (1.0 = all, 0.0 = none); INFO and above are never sampled
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps each record with the current request's correlation id."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a random share of DEBUG records so verbose logs stay cheap."""
+
+    def __init__(self, rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via `extra=` are included as-is."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        elif record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DropWhenFullQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the event loop: records are dropped if the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render tracebacks now, but leave JSON formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a QueueHandler; a QueueListener thread does the
+    actual (possibly slow) stdout writes off the event loop. Safe to call twice.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+        )
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _DropWhenFullQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter())
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def _restart_after_fork() -> None:
+    """The listener thread does not survive fork(); give the child (e.g. a gunicorn worker) its own."""
+    global _listener
+    if _listener is not None:
+        _listener = None
+        setup_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
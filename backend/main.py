@@ -3,30 +3,50 @@ import re
 import json
 import time
 import httpx
+import hashlib
 import asyncio
 import logging
-import tiktoken
 import random
 import models, schemas
+import metrics
 from schemas import ChatRequest, ChatResponse
-from typing import Optional, Union, List, Dict, Any
+from typing import Optional, Union, List, Dict, Any, AsyncIterator
 from datetime import datetime
+from pathlib import Path
+from alembic import command as alembic_command
+from alembic.config import Config as AlembicConfig
 from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 from uuid import uuid4
-from fastapi import FastAPI, APIRouter, HTTPException, status, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
-from kb_config import INITIAL_KB_CHUNKS, SYSTEM_PROMPT, CHUNK_METADATA, preprocess_chunks, get_keyword_filtered_context, build_inverted_index
+from database import engine, Base, SessionLocal, get_db
+from formatting import format_response, StreamingFormatter
+from logging_config import setup_logging, shutdown_logging, request_id_var
+from session_store import SessionHistoryStore, SESSION_IDLE_TTL_SECONDS, new_session_id, is_issued_session_id
+from shared_cache import SHARED, cache_get, cache_set
+from fees import answer_fee_question
+from idempotency import MAX_KEY_LENGTH, IdempotencyKeyReused, IdempotencyStore, request_fingerprint
+from token_count import MODEL_FOR_TOKEN_COUNT, count_tokens, estimate_tokens, load_encoding
+from generation import AZURE_DEPLOYMENT_NAME, PROFILES, GenerationProfile, choose_profile
+from procedures import answer_procedure_question
+from quick_answers import QUICK_ANSWERS_ENABLED, QuickAnswers
+from retention import RETENTION_ENABLED, retention_loop
+from kb_config import INITIAL_KB_CHUNKS, SYSTEM_PROMPT, CHUNK_METADATA, get_keyword_filtered_context, load_knowledge_base
 # from auth import get_password_hash, verify_password, create_access_token
 # from auth import get_current_user, get_optional_user
 # from auth_router import auth_router
+from export_router import export_router
+from rate_limit import RATE_LIMIT_ENABLED, RateLimiter
 
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="MMC Chatbot API")
 # app.include_router(auth_router)
+app.include_router(export_router)
 
 load_dotenv()
 
@@ -34,7 +54,6 @@ AZURE_SEMAPHORE = asyncio.Semaphore(50)
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4o-mini-deployment") 
 
 if not all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY]):
     raise EnvironmentError("AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY must be set in the environment.")
@@ -59,38 +78,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-guest_sessions: dict[str, list[dict]] = {}
+if RATE_LIMIT_ENABLED:
+    # Registered before assign_request_id, so it runs inside it and 429s still carry X-Request-ID
+    app.middleware("http")(RateLimiter())
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """Tags every log record of a request with a correlation id (X-Request-ID)."""
+    request_id = request.headers.get("X-Request-ID") or str(uuid4())[:8]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# True once the migrations ran in this process, or in the gunicorn master before the fork
+SCHEMA_READY = False
 
 def create_database_tables():
-    """Creates all database tables defined in models.py."""
-    Base.metadata.create_all(bind=engine)
+    """
+    Brings the database schema up to date (`alembic upgrade head`, see migrations/).
+    Under gunicorn the master runs it once (gunicorn.conf.py on_starting) and the
+    workers inherit SCHEMA_READY, so they don't race on the same DDL (SQLite has no
+    advisory lock, see migrations/env.py).
+    """
+    global SCHEMA_READY
+    if SCHEMA_READY:
+        return
+    alembic_command.upgrade(AlembicConfig(str(Path(__file__).with_name("alembic.ini"))), "head")
+    SCHEMA_READY = True
    
 @app.on_event("startup")
 async def startup_event():
     print("======================================")
-    print("🔧 Initializing database tables...")
-    create_database_tables()
+    if SCHEMA_READY:
+        print("✓ Database migrations applied by the gunicorn master")
+    else:
+        print("🔧 Applying database migrations...")
+        create_database_tables()
     db = next(get_db())
     ensure_guest_user(db)
     print("✓ Database ready")
+
+    if RETENTION_ENABLED:
+        task = asyncio.create_task(retention_loop(engine))
+        BACKGROUND_TASKS.add(task)
+        print("✓ Retention job scheduled")
     
-    print("🔧 Building KB inverted index...")
+    # Already done in the gunicorn master when preloaded (see gunicorn.conf.py)
+    encoding = load_encoding()
+    print(f"✓ Tokenizer {encoding.name} loaded" if encoding else "⚠️ Tokenizer unavailable, token counts are estimates")
+    print("🔧 Loading KB index and chunk metadata...")
     global INVERTED_INDEX
-    INVERTED_INDEX = build_inverted_index(INITIAL_KB_CHUNKS)
+    INVERTED_INDEX = load_knowledge_base()
     print(f"✓ Inverted index ready ({len(INVERTED_INDEX)} unique tokens)")
-    
-    print("🔧 Pre-computing chunk metadata...")
-    global CHUNK_METADATA
-    chunk_meta = preprocess_chunks(INITIAL_KB_CHUNKS)
-    
-    import kb_config
-    kb_config.CHUNK_METADATA.update(chunk_meta)  
     print(f"✓ Metadata cached for {len(CHUNK_METADATA)} chunks")
-    print(f"✓ Chunk keys: {list(kb_config.CHUNK_METADATA.keys())}")
+    print(f"✓ Chunk keys: {list(CHUNK_METADATA.keys())}")
+    log_kb_chunk_token_usage(INITIAL_KB_CHUNKS)
+
+    if QUICK_ANSWERS_ENABLED:
+        # Generated for this KB version in the background; stale ones are served meanwhile
+        task = asyncio.create_task(QUICK_ANSWERS.run())
+        BACKGROUND_TASKS.add(task)
+        print("✓ Quick-action answers scheduled")
     
     print("✅ All systems ready!")
     print("======================================")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_logging()
+
 @app.get("/")
 async def root():
     return {"message": "Backend API is running"}
@@ -100,6 +160,16 @@ def check_health():
     """Simple health check endpoint."""
     return {"status": "ok", "message": "Chatbot API is running!"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+# User ids whose row is known to exist (filled at startup and on successful inserts).
+# A row deleted behind our back surfaces as a FK IntegrityError in persist_chat_turn,
+# which drops the id and re-creates the user.
+VERIFIED_USER_IDS: set[int] = set()
+
 def ensure_guest_user(db: Session, guest_id: int = 1, 
     guest_username: str = "Guest", guest_email: str = "guest@momo.mtn.cg", guest_password="guest-user-access"
 ):
@@ -111,6 +181,7 @@ def ensure_guest_user(db: Session, guest_id: int = 1,
 
     if user:
         logger.debug(f"Guest user {guest_id} already exists")
+        VERIFIED_USER_IDS.add(guest_id)
         return user
 
     # create guest user
@@ -126,6 +197,7 @@ def ensure_guest_user(db: Session, guest_id: int = 1,
         db.commit()
         db.refresh(user)
         logger.info(f"✓ Guest user created (ID: {guest_id})")
+        VERIFIED_USER_IDS.add(guest_id)
         return user
     except IntegrityError:
         db.rollback()
@@ -133,6 +205,7 @@ def ensure_guest_user(db: Session, guest_id: int = 1,
         try:
             user = db.query(models.User).filter_by(id=guest_id).first()
             if user:
+                VERIFIED_USER_IDS.add(guest_id)
                 return user
         except Exception:
             pass
@@ -143,8 +216,6 @@ def ensure_guest_user(db: Session, guest_id: int = 1,
         logger.exception(f"Unexpected error ensuring guest user: {e}")
         raise
 
-MODEL_FOR_TOKEN_COUNT = "gpt-4o-mini"
-
 def count_number_of_tokens(text: str, model:str = MODEL_FOR_TOKEN_COUNT) -> tuple[int, int, int]:
     """
     Returns token count and prints basic stats:
@@ -161,14 +232,8 @@ def count_number_of_tokens(text: str, model:str = MODEL_FOR_TOKEN_COUNT) -> tupl
     num_chars = len(text)
     num_words = len(text.split())
 
-    try:
-        enc = tiktoken.encoding_for_model(MODEL_FOR_TOKEN_COUNT)
-    except Exception:
-        # fallback to a generic encoding if model-specific one isn't available
-        enc = tiktoken.get_encoding("cl100k_base")
-    
-    tokens = enc.encode(text)
-    num_tokens = len(tokens)
+    # Encoding loaded once at startup, see token_count.py
+    num_tokens = count_tokens(text)
 
     return num_tokens, num_words, num_tokens
 
@@ -192,88 +257,28 @@ def log_context_selection(query: str, context: str, is_overview: bool):
     # Rough estimate of tokens (1 token ≈ 4 chars)
     est_tokens = char_count // 4 
 
-    log_msg = (
-        f"\n{'='*40}\n"
-        f"🔍 CONTEXT LOG | Query: '{query}'\n"
-        f"📝 Mode: {'GLOBAL OVERVIEW' if is_overview else 'KEYWORD FILTERED'}\n"
-        f"📦 Chunks Included ({len(sections)}): {', '.join(sections)}\n"
-        f"📊 Size: ~{est_tokens} tokens ({char_count} chars)\n"
-        f"{'='*40}"
+    logger.info(
+        "Context selected",
+        extra={
+            "query": query,
+            "mode": "GLOBAL_OVERVIEW" if is_overview else "KEYWORD_FILTERED",
+            "chunks": sections,
+            "est_tokens": est_tokens,
+            "chars": char_count,
+        },
     )
-    print(log_msg)
-    
-def strip_markdown(text: str) -> str:
-    """Removes non-essential Markdown characters from a string, preserving list markers and codes."""
-    text = text.replace('***', '').replace('**', '')
-    text = text.replace('###', '').replace('##', '')
-    text = text.replace(' ```', '').replace('``', '')
-    text = text.replace('__', '').replace('_', '')
-    
-    lines = text.splitlines()
-    new_lines = []
-    for line in lines:
-        line = re.sub(r'^\s*[#=>]\s*', '', line).strip()
-        new_lines.append(line)
-    text = '\n'.join(new_lines)    
-    
-    return text.strip()
     
-def enforce_list_indentation(text: str) -> str:
-    """
-    Enforces three-level list indentation:
-    ❖ Main items (no indent)
-      • Sub-items (2-space indent)
-        ◦ Second-level sub-items (4-space indent)
-    """
-    lines = text.splitlines()
-    new_lines = []
-    
-    for line in lines:
-        stripped = line.strip()
-        
-        # preserve mpty lines
-        if not stripped:
-            new_lines.append("")
-            continue
-        
-        # Main items (❖)
-        if stripped.startswith('❖'):
-            content = stripped[1:].strip()
-            new_lines.append(f"❖ {content}")
-            continue
-        
-        # Second-level sub-items (◦)
-        if stripped.startswith('◦'):
-            content = stripped[1:].strip()
-            new_lines.append(f"        ◦ {content}")
-            continue
-        
-        # First-level sub-items (•)
-        if stripped.startswith('•'):
-            content = stripped[1:].strip()
-            new_lines.append(f"    • {content}")
-            continue
-        
-        # Regular text or other content
-        new_lines.append(line)
-    
-    return '\n'.join(new_lines)
-
-
 # --- Utility Functions ---
-async def call_azure_openai_with_backoff(
-    messages_or_message: Union[List[dict], str],
-    max_retries: int = 7,
-    initial_backoff: float = 1.0,
-    max_backoff: float = 45.0,
-    timeout_seconds: float = 30.0
-) -> str:
+AZURE_API_VERSION = "2025-01-01-preview"
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def build_azure_request(messages_or_message: Union[List[dict], str], stream: bool = False,
+                        max_tokens: int = 1200, deployment: Optional[str] = None) -> tuple[str, dict, dict]:
     """
-    Calls the Azure OpenAI chat completions endpoint with exponential backoff + jitter.
+    Builds (url, headers, payload) for an Azure OpenAI chat completion.
     Accepts either:
       - a list of messages (each a dict with 'role' and 'content'), OR
       - a single user message string (will be wrapped into messages with system prompt if needed).
-    Returns the assistant message content (string) or raises HTTPException.
     """
     # Normalize input into messages list
     if isinstance(messages_or_message, str):
@@ -289,10 +294,9 @@ async def call_azure_openai_with_backoff(
     else:
         raise ValueError("messages_or_message must be a list or str")
 
-    api_version = "2025-01-01-preview"
     url = (
         f"{AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments/"
-        f"{AZURE_DEPLOYMENT_NAME}/chat/completions?api-version={api_version}"
+        f"{deployment or AZURE_DEPLOYMENT_NAME}/chat/completions?api-version={AZURE_API_VERSION}"
     )
     headers = {
         "Content-Type": "application/json",
@@ -301,9 +305,35 @@ async def call_azure_openai_with_backoff(
     payload = {
         "messages": messages,
         "temperature": 0.3,
-        "max_tokens": 1200,
-        "stream": False
+        "max_tokens": max_tokens,
+        "stream": stream
     }
+    return url, headers, payload
+
+def retry_delay(response: httpx.Response, attempt: int, initial_backoff: float, max_backoff: float) -> float:
+    """Seconds to wait before retrying: Azure's Retry-After if given, else exponential backoff + jitter."""
+    # 1. Try to get wait time from Azure's header
+    retry_header = response.headers.get("Retry-After")
+    if retry_header and retry_header.isdigit():
+        return float(retry_header) + random.uniform(0, 1)
+    # 2. Fallback to our own exponential backoff
+    backoff = min(max_backoff, initial_backoff * (2 ** (attempt - 1)))
+    return random.uniform(0, backoff)
+
+async def call_azure_openai_with_backoff(
+    messages_or_message: Union[List[dict], str],
+    max_retries: int = 7,
+    initial_backoff: float = 1.0,
+    max_backoff: float = 45.0,
+    timeout_seconds: float = 30.0,
+    max_tokens: int = 1200,
+    deployment: Optional[str] = None,
+) -> str:
+    """
+    Calls the Azure OpenAI chat completions endpoint with exponential backoff + jitter.
+    Returns the assistant message content (string) or raises HTTPException.
+    """
+    url, headers, payload = build_azure_request(messages_or_message, max_tokens=max_tokens, deployment=deployment)
     
     # Tracking varilables
     total_wait_time = 0.0
@@ -321,6 +351,7 @@ async def call_azure_openai_with_backoff(
                 
                 resp = await client.post(url, headers=headers, json=payload)
                 resp.raise_for_status()
+                metrics.AZURE_ATTEMPT_LATENCY.labels("success").observe(time.perf_counter() - attempt_start)
                 
                 # SUCCESS: Log the total journey time
                 total_duration = time.perf_counter() - start_time
@@ -335,18 +366,14 @@ async def call_azure_openai_with_backoff(
             except httpx.HTTPStatusError as e:
                 status = e.response.status_code
                 last_exc = e
+                retryable = status in RETRYABLE_STATUS_CODES
+                metrics.AZURE_ATTEMPT_LATENCY.labels("retryable" if retryable else "error").observe(
+                    time.perf_counter() - attempt_start
+                )
                 
                 # Check for "Wait and Retry" status codes
-                if status in (429, 500, 502, 503, 504):
-                    # 1. Try to get wait time from Azure's header
-                    retry_header = e.response.headers.get("Retry-After")
-                    if retry_header and retry_header.isdigit():
-                        sleep_for = float(retry_header) + random.uniform(0, 1)
-                    else:
-                        # 2. Fallback to our own exponential backoff
-                        backoff = min(max_backoff, initial_backoff * (2 ** (attempt - 1)))
-                        sleep_for = random.uniform(0, backoff)
-
+                if retryable:
+                    sleep_for = retry_delay(e.response, attempt, initial_backoff, max_backoff)
                     total_wait_time += sleep_for
                     logger.warning(
                         "⚠️ Azure %d (Attempt %d/%d) | Wait: %.2fs | Total Wait: %.2fs",
@@ -354,6 +381,7 @@ async def call_azure_openai_with_backoff(
                     )
                     
                     if attempt < max_retries:
+                        metrics.AZURE_RETRIES.labels(str(status)).inc()
                         await asyncio.sleep(sleep_for)
                         continue
                 
@@ -362,61 +390,185 @@ async def call_azure_openai_with_backoff(
 
             except (httpx.RequestError, ValueError) as e:
                 last_exc = e
+                metrics.AZURE_ATTEMPT_LATENCY.labels("request_error").observe(time.perf_counter() - attempt_start)
                 logger.error("❌ Request Error: %s", str(e))
                 if attempt == max_retries:
                     raise HTTPException(status_code=503, detail="Max retries reached.")
+                metrics.AZURE_RETRIES.labels("request_error").inc()
                 await asyncio.sleep(initial_backoff)
 
     raise HTTPException(status_code=500, detail="Unexpected error loop.")
 
-MAX_HISTORY_TURNS = 2
+async def stream_azure_openai_with_backoff(
+    messages_or_message: Union[List[dict], str],
+    max_retries: int = 7,
+    initial_backoff: float = 1.0,
+    max_backoff: float = 45.0,
+    timeout_seconds: float = 30.0,
+    max_tokens: int = 1200,
+    deployment: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Streams the assistant reply as content deltas (Azure `stream: true`, SSE).
+    Retries with the same policy as `call_azure_openai_with_backoff`, but only
+    until the first byte of a successful response; after that errors propagate.
+    """
+    url, headers, payload = build_azure_request(messages_or_message, stream=True, max_tokens=max_tokens,
+                                                deployment=deployment)
+    total_wait_time = 0.0
+    streamed = False
+    timeout = httpx.Timeout(timeout_seconds, read=timeout_seconds, connect=10.0)
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        for attempt in range(1, max_retries + 1):
+            attempt_start = time.perf_counter()
+            try:
+                async with client.stream("POST", url, headers=headers, json=payload) as resp:
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                        resp.raise_for_status()
+                    metrics.AZURE_ATTEMPT_LATENCY.labels("success").observe(time.perf_counter() - attempt_start)
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_bot(
-    request: ChatRequest,
-    db: Session = Depends(get_db),
-):
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            return
+                        choices = json.loads(data).get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            streamed = True
+                            yield delta
+                    return
+
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                retryable = status in RETRYABLE_STATUS_CODES
+                metrics.AZURE_ATTEMPT_LATENCY.labels("retryable" if retryable else "error").observe(
+                    time.perf_counter() - attempt_start
+                )
+                if retryable and attempt < max_retries:
+                    sleep_for = retry_delay(e.response, attempt, initial_backoff, max_backoff)
+                    total_wait_time += sleep_for
+                    logger.warning(
+                        "⚠️ Azure stream %d (Attempt %d/%d) | Wait: %.2fs | Total Wait: %.2fs",
+                        status, attempt, max_retries, sleep_for, total_wait_time
+                    )
+                    metrics.AZURE_RETRIES.labels(str(status)).inc()
+                    await asyncio.sleep(sleep_for)
+                    continue
+                raise HTTPException(status_code=status, detail=f"Azure error: {e.response.text}")
+
+            except httpx.RequestError as e:
+                metrics.AZURE_ATTEMPT_LATENCY.labels("request_error").observe(time.perf_counter() - attempt_start)
+                logger.error("❌ Stream Request Error: %s", str(e))
+                # Never replay a reply the client has already partly received
+                if streamed or attempt == max_retries:
+                    raise HTTPException(status_code=503, detail="Max retries reached.")
+                metrics.AZURE_RETRIES.labels("request_error").inc()
+                await asyncio.sleep(initial_backoff)
+
+# Rolling summaries of turns that left the history window (one extra Azure call, off the request path)
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "false").lower() in ("1", "true", "yes")
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "150"))
+SUMMARY_SEMAPHORE = asyncio.Semaphore(4)
+SUMMARY_PROMPT = (
+    "Summarize this MTN MoMo customer conversation in at most 3 short sentences, "
+    "in the language the user writes in. Keep the services, amounts and any open "
+    "question; drop greetings and formatting."
+)
+
+# Recent exchanges per chat session; Postgres is only written to, off the request path
+SESSION_HISTORY = SessionHistoryStore(keep_overflow=HISTORY_SUMMARY_ENABLED)
+
+# Whole replies for byte-identical prompts (same KB context, history and message),
+# shared across workers; only active with SHARED_CACHE_URL. 0 disables.
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+
+def response_cache_key(messages: list[dict], profile: GenerationProfile) -> Optional[str]:
+    if SHARED is None or RESPONSE_CACHE_TTL_SECONDS <= 0:
+        return None
+    payload = json.dumps([profile.deployment, profile.max_tokens, messages],
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# USSD procedure answers are sent as extracted from the KB; with rephrasing (per
+# request via ChatRequest.rephrase, or this default) a short Azure call rewords them
+PROCEDURE_REPHRASE = os.getenv("PROCEDURE_REPHRASE", "false").lower() in ("1", "true", "yes")
+PROCEDURE_REPHRASE_MAX_TOKENS = int(os.getenv("PROCEDURE_REPHRASE_MAX_TOKENS", "300"))
+REPHRASE_PROMPT = (
+    "You are MoMo Chat, the MTN MoMo Congo assistant. Answer the user's question using only "
+    "the procedure below, in the language the user writes in. Keep every step and every USSD "
+    "code exactly as given; add nothing else."
+)
+# Share of chat traffic answered without the LLM is logged every this many direct answers
+DIRECT_SHARE_LOG_EVERY = int(os.getenv("DIRECT_SHARE_LOG_EVERY", "100"))
+
+def load_shared_session(session_id: str) -> None:
+    """Picks up turns another worker added to this session since we last saw it. Blocking: run it in a thread."""
+    snapshot = cache_get("session", session_id)
+    if snapshot is not None:
+        SESSION_HISTORY.restore(session_id, json.loads(snapshot))
+
+async def publish_session(session_id: str) -> None:
     """
-    Handles an incoming user message and returns a response from Azure OpenAI.
-    Injects relevant knowledge base data and maintains a short chat history
-    for context. Supports guest users without breaking if the user is unauthenticated.
-    """    
-    class GuestUser:
-        id = 1
-        username = "Guest"  
-        email = "guest@momo.mtn.cg"
-        hashed_password="guest-user-access"  
-    
-    request_id = str(uuid4())[:8]
-    print(f"[{request_id}] Starting request for user...{GuestUser.id}")
-    
+    Writes the session to the shared cache, off the event loop. Awaited before the
+    reply goes out, so a next turn served by another worker sees this one.
+    """
+    if SHARED is None:
+        return
+    snapshot = SESSION_HISTORY.snapshot(session_id)
+    if snapshot is not None:
+        await asyncio.to_thread(cache_set, "session", session_id, json.dumps(snapshot, ensure_ascii=False),
+                                SESSION_IDLE_TTL_SECONDS)
 
-    current_user = GuestUser()
-    ensure_guest_user(db, guest_id=current_user.id, guest_username=current_user.username, guest_email=current_user.email, guest_password=current_user.hashed_password)
-    
-    logger.info("Chat request from public user (ID: %s, Username: %s)",
-                current_user.id, current_user.username)
+# Per-stage limits on the chat path (seconds). Slow retrieval or history degrades the
+# answer (no KB context / no history) instead of failing it; a slow Azure stage is a 504.
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "2"))
+HISTORY_TIMEOUT_SECONDS = float(os.getenv("HISTORY_TIMEOUT_SECONDS", "1"))
+AZURE_TIMEOUT_SECONDS = float(os.getenv("AZURE_TIMEOUT_SECONDS", "90"))
+# Retrieval (CPU, ~5 ms) in the threadpool so the event loop keeps serving other requests
+# meanwhile. Off by default: on one core the thread hops cost more than they give back.
+OFFLOAD_RETRIEVAL = os.getenv("OFFLOAD_RETRIEVAL", "false").lower() in ("1", "true", "yes")
 
-    user_message = getattr(request, "message", None)
-    if not user_message or not isinstance(user_message, str):
-        raise HTTPException(
-            status_code=400,
-            detail="`message` must be a non-empty string in the request body."
-        )
-    
-    # These cover the common ways users ask for the overview quick action
-    OVERVIEW_INTENTS = [
-        " Donne-moi un aperçu général des produits et services offerts par MTN MoMo. ",
-        "apercu general", "tous les services", "overview of services", 
-        "liste des produits", "que propose momo", "what does momo offer",
-        "services offerts", "all services", "tout"
-    ]
-    
-    compare_msg = user_message.lower().strip()
-    compare_msg = compare_msg.replace("é", "e").replace("è", "e").replace("ç", "c")
-    
-    is_overview_requested = any(intent in compare_msg for intent in OVERVIEW_INTENTS)
+# Strong references so fire-and-forget tasks are not garbage collected mid-flight
+BACKGROUND_TASKS: set = set()
+
+# These cover the common ways users ask for the overview quick action
+OVERVIEW_INTENTS = [
+    " Donne-moi un aperçu général des produits et services offerts par MTN MoMo. ",
+    "apercu general", "tous les services", "overview of services", 
+    "liste des produits", "que propose momo", "what does momo offer",
+    "services offerts", "all services", "tout"
+]
+
+class GuestUser:
+    id = 1
+    username = "Guest"  
+    email = "guest@momo.mtn.cg"
+    hashed_password="guest-user-access"  
+
+def personalize_system_prompt(current_user) -> str:
+    return (
+        SYSTEM_PROMPT
+        + f"""\nThe current user's username is {current_user.username}.
+        Guest is not a name, it's the status of the user. 
+        Occasionally respond using this name if appropriate."""
+    )
+
+def build_system_message(current_user, user_message: str) -> tuple[str, GenerationProfile]:
+    """
+    System prompt for a user message (the whole KB for overview requests, else
+    the relevant chunks) and the generation profile chosen from the same signals.
+    """
+    with metrics.STAGE_INTENT.time():
+        compare_msg = user_message.lower().strip()
+        compare_msg = compare_msg.replace("é", "e").replace("è", "e").replace("ç", "c")
+        
+        is_overview_requested = any(intent in compare_msg for intent in OVERVIEW_INTENTS)
     
+    retrieval_start = time.perf_counter()
     try:
         if is_overview_requested:
             all_chunks = []
@@ -436,6 +588,7 @@ async def chat_with_bot(
     except Exception as e:
         logger.exception("Error retrieving KB context: %s", e)
         relevant_context = ""
+    metrics.STAGE_RETRIEVAL.observe(time.perf_counter() - retrieval_start)
 
     log_context_selection(user_message, relevant_context, is_overview_requested)
     
@@ -447,13 +600,8 @@ async def chat_with_bot(
     ):
         include_kb = True
 
-    personalized_system_prompt = (
-        SYSTEM_PROMPT
-        + f"""\nThe current user's username is {current_user.username}.
-        Guest is not a name, it's the status of the user. 
-        Occasionally respond using this name if appropriate."""
-    )
-    
+    personalized_system_prompt = personalize_system_prompt(current_user)
+
     if is_overview_requested:
         system_message_content = (
             f"""{personalized_system_prompt}\n\n
@@ -470,21 +618,61 @@ async def chat_with_bot(
             if include_kb else personalized_system_prompt
         )
 
-    history_rows = (
-        db.query(models.ChatMessage)
-        .filter(models.ChatMessage.user_id == current_user.id)
-        .order_by(models.ChatMessage.timestamp.desc())
-        .limit(MAX_HISTORY_TURNS)
-        .all()
+    profile = choose_profile(user_message, is_overview_requested, include_kb)
+    metrics.GENERATION_PROFILES.labels(profile.name).inc()
+    return system_message_content, profile
+
+async def run_stage(stage: str, awaitable, timeout: float, fallback):
+    """Awaits one pipeline stage; past `timeout` seconds the request goes on with `fallback()`."""
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        logger.warning("⏱️ %s stage took over %.1fs, continuing without it", stage, timeout)
+        metrics.STAGE_TIMEOUTS.labels(stage).inc()
+        return fallback()
+
+def read_history(session_id: str) -> tuple[Optional[str], list]:
+    with metrics.STAGE_HISTORY.time():
+        load_shared_session(session_id)
+        return SESSION_HISTORY.get_context(session_id)
+
+async def fetch_history(session_id: str) -> tuple[Optional[str], list]:
+    if SHARED is None:
+        # In-process store only: microseconds, not worth a thread hop
+        return read_history(session_id)
+    return await asyncio.to_thread(read_history, session_id)
+
+async def fetch_system_message(current_user, user_message: str) -> tuple[str, GenerationProfile]:
+    # With a shared cache, QUERY_CACHE misses go to SQLite/Redis: that round trip must not block the loop
+    if OFFLOAD_RETRIEVAL or SHARED is not None:
+        return await asyncio.to_thread(build_system_message, current_user, user_message)
+    return build_system_message(current_user, user_message)
+
+async def build_chat_prompt(current_user, session_id: str, user_message: str) -> tuple[list[dict], str, list[str], GenerationProfile]:
+    """
+    Builds the Azure messages for a user turn: system prompt with the relevant
+    KB context, the session history fitted into HISTORY_TOKEN_BUDGET (plus its
+    rolling summary, if any), then the user message.
+    Retrieval and the history fetch run concurrently, each under its own timeout:
+    a slow retrieval answers without KB context, a slow history without history.
+    Returns (messages, system_message_content, history_plain_text_parts, profile).
+    """
+    (system_message_content, profile), (history_summary, history_turns) = await asyncio.gather(
+        run_stage("retrieval", fetch_system_message(current_user, user_message), RETRIEVAL_TIMEOUT_SECONDS,
+                  lambda: (personalize_system_prompt(current_user), PROFILES["standard"])),
+        run_stage("history", fetch_history(session_id), HISTORY_TIMEOUT_SECONDS, lambda: (None, [])),
     )
-    history_rows.reverse()
 
     conversation_messages = []
     history_plain_text_parts = []
 
-    for row in history_rows:
-        user_q = row.user_query or ""
-        ai_r = row.ai_response or ""
+    if history_summary:
+        conversation_messages.append(
+            {"role": "system", "content": f"Summary of the earlier conversation: {history_summary}"}
+        )
+        history_plain_text_parts.append(history_summary)
+
+    for user_q, ai_r in history_turns:
         conversation_messages.append({"role": "user", "content": user_q})
         conversation_messages.append({"role": "assistant", "content": ai_r})
         history_plain_text_parts.extend([user_q, ai_r])
@@ -492,62 +680,500 @@ async def chat_with_bot(
     messages = [{"role": "system", "content": system_message_content}]
     messages.extend(conversation_messages)
     messages.append({"role": "user", "content": user_message})
+    return messages, system_message_content, history_plain_text_parts, profile
 
-    async with AZURE_SEMAPHORE:
+async def record_chat_turn(session_id: str, user_message: str, ai_response: str) -> None:
+    """
+    Adds a completed exchange to the session history. Stays on the request
+    path (the next turn needs it); the counts only feed the history token
+    budget, so they are estimated (token_count.estimate_tokens).
+    """
+    with metrics.STAGE_TOKEN_COUNT.time():
+        user_tokens = estimate_tokens(user_message)
+        output_tokens = estimate_tokens(ai_response)
+    needs_summary = SESSION_HISTORY.append(session_id, user_message, ai_response, user_tokens, output_tokens)
+    await publish_session(session_id)
+    if needs_summary:
+        task = asyncio.get_running_loop().create_task(summarize_history(session_id))
+        BACKGROUND_TASKS.add(task)
+        task.add_done_callback(BACKGROUND_TASKS.discard)
+
+def account_chat_turn(
+    user_message: str,
+    ai_response: str,
+    system_message_content: str,
+    history_plain_text_parts: list[str],
+    profile: Optional[str] = None,
+) -> None:
+    """Token accounting (metrics and log) for a completed exchange; runs after the reply is sent."""
+    combined_input_for_count = " ".join(
+        [system_message_content, " ".join(history_plain_text_parts), user_message]
+    )
+
+    with metrics.STAGE_ACCOUNTING.time():
+        input_chars, input_words, input_tokens = count_number_of_tokens(combined_input_for_count)
+        output_chars, output_words, output_tokens = count_number_of_tokens(ai_response)
+        hist_chars, hist_words, hist_tokens = count_number_of_tokens(" ".join(history_plain_text_parts))
+    metrics.TOKENS.labels("input").inc(input_tokens)
+    metrics.TOKENS.labels("output").inc(output_tokens)
+    metrics.TOKENS.labels("history").inc(hist_tokens)
+    if profile:
+        metrics.GENERATION_OUTPUT_TOKENS.labels(profile).observe(output_tokens)
+
+    logger.info(
+        "Token counts summary",
+        extra={
+            "model": MODEL_FOR_TOKEN_COUNT,
+            "input_tokens": input_tokens, "input_words": input_words,
+            "output_tokens": output_tokens, "output_words": output_words,
+            "history_tokens": hist_tokens, "history_words": hist_words,
+        },
+    )
+
+async def summarize_history(session_id: str) -> None:
+    """Folds the turns that left the session window into its rolling summary."""
+    claimed = SESSION_HISTORY.take_overflow(session_id)
+    if claimed is None:
+        return
+    previous_summary, turns = claimed
+
+    lines = [f"Previous summary: {previous_summary}"] if previous_summary else []
+    for turn in turns:
+        lines.append(f"User: {turn.user_query}")
+        lines.append(f"Assistant: {turn.ai_response}")
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n".join(lines)},
+    ]
+    try:
+        async with SUMMARY_SEMAPHORE:
+            summary = await call_azure_openai_with_backoff(
+                messages, max_retries=2, max_tokens=HISTORY_SUMMARY_MAX_TOKENS
+            )
+        SESSION_HISTORY.set_summary(session_id, summary, estimate_tokens(summary))
+        await publish_session(session_id)
+        metrics.HISTORY_SUMMARIES.labels("success").inc()
+    except Exception as e:
+        logger.warning("History summary failed, keeping previous one: %s", getattr(e, "detail", e))
+        SESSION_HISTORY.set_summary(session_id, None, unsummarized=turns)
+        metrics.HISTORY_SUMMARIES.labels("error").inc()
+
+def persist_chat_turn(current_user, user_message: str, ai_response: str) -> None:
+    """
+    Writes a completed exchange to the database. Runs after the reply has been
+    sent (FastAPI background task / threadpool) with its own session.
+    """
+    persistence_start = time.perf_counter()
+    db = SessionLocal()
+    chat_log = models.ChatMessage(
+        user_id=current_user.id,
+        user_query=user_message,
+        ai_response=ai_response,
+    )
+    db.add(chat_log)
+    try:
+        db.commit()
+        db.refresh(chat_log)
+    except IntegrityError as e:
+        db.rollback()
+        VERIFIED_USER_IDS.discard(current_user.id)
+        logger.warning("Chat log insert failed (%s); re-checking user %s", e.orig, current_user.id)
+        ensure_guest_user(db, guest_id=current_user.id, guest_username=current_user.username,
+                          guest_email=current_user.email, guest_password=current_user.hashed_password)
+        db.add(chat_log)
         try:
-            ai_response = await call_azure_openai_with_backoff(messages)
-            ai_response = strip_markdown(ai_response)
-            ai_response = enforce_list_indentation(ai_response)
-            print(f"\nBot Response: {ai_response}")
+            db.commit()
+            db.refresh(chat_log)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to save chat log even after creating guest user.")
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to save chat log.")
+    finally:
+        db.close()
+    metrics.STAGE_PERSISTENCE.observe(time.perf_counter() - persistence_start)
+
+async def rephrase_procedure(user_message: str, procedure: str) -> str:
+    """LLM rewording of a structured procedure answer; the structured answer if that fails."""
+    messages = [
+        {"role": "system", "content": f"{REPHRASE_PROMPT}\n\nProcedure:\n{procedure}"},
+        {"role": "user", "content": user_message},
+    ]
+    try:
+        async with AZURE_SEMAPHORE:
+            with metrics.STAGE_AZURE.time():
+                reply = await call_azure_openai_with_backoff(
+                    messages, max_retries=1, max_tokens=PROCEDURE_REPHRASE_MAX_TOKENS
+                )
+        return format_response(reply)
+    except Exception as e:
+        logger.warning("Procedure rephrase failed, sending the structured answer: %s", getattr(e, "detail", e))
+        return procedure
 
-            combined_input_for_count = " ".join(
-                [system_message_content, " ".join(history_plain_text_parts), user_message]
+async def generate_quick_answer(prompt: str) -> str:
+    """Answer to a quick-action prompt as a new guest conversation would get it."""
+    system_message_content, profile = build_system_message(GuestUser, prompt)
+    messages = [
+        {"role": "system", "content": system_message_content},
+        {"role": "user", "content": prompt},
+    ]
+    async with AZURE_SEMAPHORE:
+        with metrics.STAGE_AZURE.time():
+            reply = await call_azure_openai_with_backoff(
+                messages, max_retries=3, max_tokens=profile.max_tokens, deployment=profile.deployment
             )
+    return format_response(reply)
 
-            log_kb_chunk_token_usage(INITIAL_KB_CHUNKS)
+QUICK_ANSWERS = QuickAnswers(generate_quick_answer)
 
-            input_chars, input_words, input_tokens = count_number_of_tokens(combined_input_for_count)
-            output_chars, output_words, output_tokens = count_number_of_tokens(ai_response)
+async def direct_answer(user_message: str, rephrase: Optional[bool] = None) -> Optional[tuple[str, str]]:
+    """(kind, reply) for messages answered without the LLM (fee, procedure, quick action); None otherwise."""
+    if QUICK_ANSWERS_ENABLED:
+        answer = await QUICK_ANSWERS.lookup(user_message)
+        if answer is not None:
+            return "quick_action", answer
+    answer = answer_fee_question(user_message)
+    if answer is not None:
+        return "fee", answer
+    answer = answer_procedure_question(user_message)
+    if answer is not None:
+        if PROCEDURE_REPHRASE if rephrase is None else rephrase:
+            answer = await rephrase_procedure(user_message, answer)
+        return "procedure", answer
+    return None
 
-            hist_chars, hist_words, hist_tokens = count_number_of_tokens(" ".join(history_plain_text_parts))
+def finish_direct_answer(kind: str) -> None:
+    metrics.DIRECT_ANSWERS.labels(kind).inc()
+    metrics.CHAT_REQUESTS.labels("success").inc()
+    logger.info("Finished request (direct answer)", extra={"kind": kind})
+    direct, total = metrics.DIRECT_ANSWERS.total(), metrics.CHAT_REQUESTS.total()
+    if DIRECT_SHARE_LOG_EVERY > 0 and direct % DIRECT_SHARE_LOG_EVERY == 0:
+        logger.info("📊 %d of %d chat requests answered without the LLM (%.1f%%)", direct, total, 100 * direct / total)
 
-            print("\n====================================== ")
-            print("Token counts summary:")
-            print(f"  INPUT  -> Characters: {input_chars} | Words: {input_words} | Tokens ({MODEL_FOR_TOKEN_COUNT}): {input_tokens}")
-            print(f"  OUTPUT -> Characters: {output_chars} | Words: {output_words} | Tokens ({MODEL_FOR_TOKEN_COUNT}): {output_tokens}")
-            print(f"  HISTORY-> Characters: {hist_chars} | Words: {hist_words} | Tokens ({MODEL_FOR_TOKEN_COUNT}): {hist_tokens}")
-            print("====================================== \n")
+def start_guest_chat(db: Session, request: ChatRequest) -> tuple[GuestUser, str, str]:
+    """
+    Ensures the guest user row exists, validates the incoming message and
+    resolves the chat session (a new id is issued unless the request sends one we issued).
+    """
+    logger.info("Starting request", extra={"user_id": GuestUser.id})
 
-            chat_log = models.ChatMessage(
-                user_id=current_user.id,
-                user_query=user_message,
-                ai_response=ai_response,
-            )
-            db.add(chat_log)
-            try:
-                db.commit()
-                db.refresh(chat_log)
-            except IntegrityError as e:
-                db.rollback()
-                ensure_guest_user(db, guest_id=current_user.id, guest_username=current_user.username)
-                db.add(chat_log)
+    current_user = GuestUser()
+    # Normally verified at startup, so no DB round trip here
+    if current_user.id not in VERIFIED_USER_IDS:
+        with metrics.STAGE_GUEST_CHECK.time():
+            ensure_guest_user(db, guest_id=current_user.id, guest_username=current_user.username, guest_email=current_user.email, guest_password=current_user.hashed_password)
+    
+    logger.info("Chat request from public user (ID: %s, Username: %s)",
+                current_user.id, current_user.username)
+
+    user_message = getattr(request, "message", None)
+    if not user_message or not isinstance(user_message, str):
+        raise HTTPException(
+            status_code=400,
+            detail="`message` must be a non-empty string in the request body."
+        )
+
+    session_id = request.session_id if is_issued_session_id(request.session_id) else new_session_id()
+    # Nothing else uses the request session: hand its connection back before the Azure wait
+    db.close()
+    return current_user, user_message, session_id
+
+class ClientDisconnected(Exception):
+    """The client hung up before its answer was ready."""
+
+async def wait_for_disconnect(http_request: Request) -> None:
+    # The body has been read, so the next ASGI message is the disconnect. Request.is_disconnected()
+    # cannot be polled instead: behind the @app.middleware("http") wrappers its message is lost.
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def until_disconnected(http_request: Request, awaitable):
+    """
+    Awaits `awaitable` unless the client goes away first (tab closed, proxy
+    timeout); the work is then cancelled, whether it is the Azure request in
+    flight, a backoff sleep or the wait for a semaphore slot. Raises ClientDisconnected.
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        raise ClientDisconnected()
+    finally:
+        for pending in (task, watcher):
+            if not pending.done():
+                pending.cancel()
+        # Let the cancelled call close its Azure connection and release its semaphore slot
+        await asyncio.gather(task, watcher, return_exceptions=True)
+
+def abandon_request(endpoint: str, stage: str, started: float) -> None:
+    """Accounts for a request whose client left before the answer; nothing is logged to the DB."""
+    logger.warning("🔌 Client disconnected during %s after %.1fs, %s request abandoned",
+                   stage, time.perf_counter() - started, endpoint)
+    metrics.ABANDONED_REQUESTS.labels(endpoint, stage).inc()
+    metrics.CHAT_REQUESTS.labels("abandoned").inc()
+
+# A resubmission waiting on a request whose client went away answers it itself
+IDEMPOTENCY = IdempotencyStore(retry_on=(ClientDisconnected,))
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_with_bot(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    """
+    Handles an incoming user message and returns a response from Azure OpenAI.
+    Injects relevant knowledge base data and maintains a short per-session chat
+    history for context. Supports guest users without breaking if the user is unauthenticated.
+
+    With an `Idempotency-Key` header, a resubmission of the same message gets the
+    answer of the first one (marked `Idempotent-Replayed: true`), see idempotency.py.
+    """
+    idempotency_key = http_request.headers.get("Idempotency-Key")
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters.")
+
+    try:
+        if not idempotency_key:
+            return await answer_chat(request, http_request, background_tasks, db)
+        chat_response, replayed = await IDEMPOTENCY.run(
+            idempotency_key,
+            request_fingerprint(request.message, request.session_id),
+            lambda: answer_chat(request, http_request, background_tasks, db),
+        )
+    except ClientDisconnected:
+        # Nobody reads it; nginx's "client closed request" status for the access logs
+        raise HTTPException(status_code=499, detail="Client closed request.")
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="This Idempotency-Key was already used for another message.")
+    if replayed:
+        logger.info("Replayed chat response for a duplicate submission")
+        response.headers["Idempotent-Replayed"] = "true"
+    return chat_response
+
+async def answer_chat(
+    request: ChatRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session,
+) -> ChatResponse:
+    current_user, user_message, session_id = start_guest_chat(db, request)
+
+    direct = await direct_answer(user_message, request.rephrase)
+    if direct is not None:
+        kind, ai_response = direct
+        await record_chat_turn(session_id, user_message, ai_response)
+        background_tasks.add_task(persist_chat_turn, current_user, user_message, ai_response)
+        finish_direct_answer(kind)
+        return ChatResponse(response=ai_response, source=kind, session_id=session_id)
+
+    messages, system_message_content, history_plain_text_parts, profile = await build_chat_prompt(
+        current_user, session_id, user_message
+    )
+
+    cache_key = response_cache_key(messages, profile)
+    # cache_key is only set with a shared cache: a blocking round trip, so in a thread
+    cached_response = await asyncio.to_thread(cache_get, "response", cache_key) if cache_key else None
+    if cached_response is not None:
+        await record_chat_turn(session_id, user_message, cached_response)
+        background_tasks.add_task(account_chat_turn, user_message, cached_response, system_message_content,
+                                  history_plain_text_parts)
+        background_tasks.add_task(persist_chat_turn, current_user, user_message, cached_response)
+        logger.info("Finished request (cached response)")
+        metrics.CHAT_REQUESTS.labels("success").inc()
+        return ChatResponse(response=cached_response, session_id=session_id)
+
+    started = time.perf_counter()
+    stage = "semaphore_wait"
+
+    async def generate() -> str:
+        nonlocal stage
+        async with AZURE_SEMAPHORE:
+            metrics.STAGE_SEMAPHORE_WAIT.observe(time.perf_counter() - started)
+            stage = "azure"
+            with metrics.STAGE_AZURE.time(), metrics.GENERATION_LATENCY.labels(profile.name).time():
+                return await asyncio.wait_for(
+                    call_azure_openai_with_backoff(messages, max_tokens=profile.max_tokens, deployment=profile.deployment),
+                    AZURE_TIMEOUT_SECONDS,
+                )
+
+    try:
+        ai_response = await until_disconnected(http_request, generate())
+        with metrics.STAGE_POSTPROCESS.time():
+            ai_response = format_response(ai_response)
+        logger.debug("Bot response", extra={"response": ai_response})
+        # Accounting, persistence and the response cache write run once the response has been sent
+        await record_chat_turn(session_id, user_message, ai_response)
+        if cache_key:
+            background_tasks.add_task(cache_set, "response", cache_key, ai_response, RESPONSE_CACHE_TTL_SECONDS)
+        background_tasks.add_task(account_chat_turn, user_message, ai_response, system_message_content,
+                                  history_plain_text_parts, profile.name)
+        background_tasks.add_task(persist_chat_turn, current_user, user_message, ai_response)
+
+        logger.info("Finished request")
+        metrics.CHAT_REQUESTS.labels("success").inc()
+
+        return ChatResponse(response=ai_response, session_id=session_id)
+
+    except ClientDisconnected:
+        abandon_request("chat", stage, started)
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Azure stage took over %.0fs, giving up", AZURE_TIMEOUT_SECONDS)
+        metrics.STAGE_TIMEOUTS.labels("azure").inc()
+        metrics.CHAT_REQUESTS.labels("http_error").inc()
+        raise HTTPException(status_code=504, detail="The assistant took too long to answer, please retry.")
+    except HTTPException as e:
+        logger.error("Chat failed with HTTP Error: %s", getattr(e, "detail", str(e)))
+        metrics.CHAT_REQUESTS.labels("http_error").inc()
+        raise e
+    except Exception as e:
+        logger.exception("Unexpected error while processing chat request: %s", e)
+        metrics.CHAT_REQUESTS.labels("error").inc()
+        raise HTTPException(
+            status_code=500,
+            detail="An unexpected error occurred while processing the request."
+        ) from e
+
+async def with_deadline(stream: AsyncIterator[str], seconds: float) -> AsyncIterator[str]:
+    """Re-yields `stream`; raises TimeoutError once `seconds` have passed since the start."""
+    deadline = asyncio.get_running_loop().time() + seconds
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            # Only the wait on the stream is under the timeout, never the consumer's code
+            async with asyncio.timeout_at(deadline):
+                item = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        yield item
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Encodes one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_with_bot_stream(
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Streaming variant of /chat (text/event-stream).
+    Emits `data: {"delta": ...}` events as formatted lines become available,
+    then `data: {"done": true, "session_id": ...}`; failures are sent as an `error` event.
+    """
+    current_user, user_message, session_id = start_guest_chat(db, request)
+
+    direct = await direct_answer(user_message, request.rephrase)
+    if direct is not None:
+        kind, ai_response = direct
+
+        async def direct_stream():
+            yield sse_event({"delta": ai_response})
+            await record_chat_turn(session_id, user_message, ai_response)
+            asyncio.get_running_loop().run_in_executor(None, persist_chat_turn, current_user, user_message, ai_response)
+            yield sse_event({"done": True, "session_id": session_id})
+            finish_direct_answer(kind)
+
+        return StreamingResponse(
+            direct_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    messages, system_message_content, history_plain_text_parts, profile = await build_chat_prompt(
+        current_user, session_id, user_message
+    )
+
+    cache_key = response_cache_key(messages, profile)
+
+    async def event_stream():
+        cached_response = await asyncio.to_thread(cache_get, "response", cache_key) if cache_key else None
+        if cached_response is not None:
+            yield sse_event({"delta": cached_response})
+            await record_chat_turn(session_id, user_message, cached_response)
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, account_chat_turn, user_message, cached_response, system_message_content,
+                                 history_plain_text_parts)
+            loop.run_in_executor(None, persist_chat_turn, current_user, user_message, cached_response)
+            yield sse_event({"done": True, "session_id": session_id})
+            logger.info("Finished request (cached response)")
+            metrics.CHAT_REQUESTS.labels("success").inc()
+            return
+
+        formatter = StreamingFormatter()
+        sent_parts = []
+        started = time.perf_counter()
+        stage = "semaphore_wait"
+        # StreamingResponse cancels this generator when the client disconnects (CancelledError),
+        # or drops it mid-send and it is closed later (GeneratorExit); either way the Azure
+        # stream is closed and the semaphore slot released on the way out.
+        try:
+            async with AZURE_SEMAPHORE:
+                metrics.STAGE_SEMAPHORE_WAIT.observe(time.perf_counter() - started)
+                stage = "azure"
                 try:
-                    db.commit()
-                    db.refresh(chat_log)
-                except Exception:
-                    db.rollback()
-                    logger.exception("Failed to save chat log even after creating guest user.")
-             
-            print(f"[{request_id}] Finished request.")
-             
-            return ChatResponse(response=ai_response)
-
-        except HTTPException as e:
-            logger.error("Chat failed with HTTP Error: %s", getattr(e, "detail", str(e)))
-            raise e
-        except Exception as e:
-            logger.exception("Unexpected error while processing chat request: %s", e)
-            raise HTTPException(
-                status_code=500,
-                detail="An unexpected error occurred while processing the request."
-            ) from e
+                    with metrics.STAGE_AZURE.time(), metrics.GENERATION_LATENCY.labels(profile.name).time():
+                        deltas = stream_azure_openai_with_backoff(
+                            messages, max_tokens=profile.max_tokens, deployment=profile.deployment
+                        )
+                        async for delta in with_deadline(deltas, AZURE_TIMEOUT_SECONDS):
+                            text = formatter.feed(delta)
+                            if text:
+                                sent_parts.append(text)
+                                yield sse_event({"delta": text})
+                        text = formatter.finish()
+                        if text:
+                            sent_parts.append(text)
+                            yield sse_event({"delta": text})
+
+                    # Same text as format_response() on the full reply
+                    ai_response = "".join(sent_parts)
+                    logger.debug("Bot response", extra={"response": ai_response})
+                    await record_chat_turn(session_id, user_message, ai_response)
+                    # Scheduled before the last event so they happen even if the client hangs up now
+                    loop = asyncio.get_running_loop()
+                    if cache_key:
+                        loop.run_in_executor(None, cache_set, "response", cache_key, ai_response,
+                                             RESPONSE_CACHE_TTL_SECONDS)
+                    loop.run_in_executor(None, account_chat_turn, user_message, ai_response, system_message_content,
+                                         history_plain_text_parts, profile.name)
+                    loop.run_in_executor(None, persist_chat_turn, current_user, user_message, ai_response)
+                    stage = "done"
+                    yield sse_event({"done": True, "session_id": session_id})
+                except asyncio.TimeoutError:
+                    logger.error("Azure stage took over %.0fs, giving up", AZURE_TIMEOUT_SECONDS)
+                    metrics.STAGE_TIMEOUTS.labels("azure").inc()
+                    metrics.CHAT_REQUESTS.labels("http_error").inc()
+                    yield sse_event({"status": 504, "detail": "The assistant took too long to answer, please retry."},
+                                    event="error")
+                    return
+                except HTTPException as e:
+                    logger.error("Chat stream failed with HTTP Error: %s", getattr(e, "detail", str(e)))
+                    metrics.CHAT_REQUESTS.labels("http_error").inc()
+                    yield sse_event({"status": e.status_code, "detail": str(e.detail)}, event="error")
+                    return
+                except Exception as e:
+                    logger.exception("Unexpected error while streaming chat response: %s", e)
+                    metrics.CHAT_REQUESTS.labels("error").inc()
+                    yield sse_event({"status": 500, "detail": "An unexpected error occurred."}, event="error")
+                    return
+        except (asyncio.CancelledError, GeneratorExit):
+            if stage != "done":
+                abandon_request("stream", stage, started)
+            raise
+
+        logger.info("Finished request")
+        metrics.CHAT_REQUESTS.labels("success").inc()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
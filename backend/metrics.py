@@ -0,0 +1,453 @@
+"""
+Minimal in-process Prometheus metrics (text exposition format 0.0.4).
+
+Kept dependency-free and cheap: an observation is a bisect plus a few integer
+increments under a lock (~1 µs), so instrumenting every /chat stage stays far
+below 50 µs per request.
+
+Under gunicorn every worker has its own registry, so a scrape would only see
+the worker that happened to serve it. With METRICS_MULTIPROC_DIR set
+(gunicorn.conf.py sets it), each process writes its values to <dir>/<pid>.json
+every METRICS_FLUSH_SECONDS and at exit, and /metrics sums the files of all
+workers, past and present, so counters never go backwards when one is
+recycled. A forked worker starts from zero: what the master counted before
+the fork is in the master's own file.
+"""
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds. Covers sub-millisecond CPU stages up to slow Azure attempts.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_REGISTRY: List["_Metric"] = []
+
+# Shared by all workers of one server; empty: this process's values only
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+_flush_lock = threading.Lock()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        """Returns the child for these label values; bind it once and reuse on hot paths."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}; use .labels()")
+        return self.labels()
+
+    def render(self, children=None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted((self._children if children is None else children).items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def state(self) -> float:
+        return self.value
+
+    def merge(self, state: float) -> None:
+        self.value += state
+
+    def reset(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def render(self, name, labelnames, key) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def total(self) -> float:
+        """Sum over all label values (this process only)."""
+        return sum(child.value for child in list(self._children.values()))
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "_Timer":
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self)
+
+    def state(self) -> list:
+        with self._lock:
+            return [list(self.counts), self.sum, self.count]
+
+    def merge(self, state: list) -> None:
+        counts, total, count = state
+        if len(counts) != len(self.counts):
+            return  # written with other buckets (a previous release)
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.counts)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def render(self, name, labelnames, key) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += n
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default().time()
+
+
+def render_metrics() -> str:
+    """Renders every registered metric in Prometheus text format, summed over all workers in multiprocess mode."""
+    lines: List[str] = []
+    if not METRICS_MULTIPROC_DIR:
+        for metric in _REGISTRY:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    flush()
+    merged: Dict[str, Dict[Tuple[str, ...], object]] = {metric.name: {} for metric in _REGISTRY}
+    metrics = {metric.name: metric for metric in _REGISTRY}
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # replaced or removed meanwhile
+        for name, series in snapshot.items():
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            children = merged[name]
+            for key, state in series:
+                key = tuple(key)
+                if key not in children:
+                    children[key] = metric._new_child()
+                children[key].merge(state)
+    for metric in _REGISTRY:
+        lines.extend(metric.render(merged[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+def flush() -> None:
+    """Writes this process's values to METRICS_MULTIPROC_DIR/<pid>.json (atomically)."""
+    snapshot = {
+        metric.name: [[list(key), child.state()] for key, child in list(metric._children.items())]
+        for metric in _REGISTRY
+    }
+    path = os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}.json")
+    with _flush_lock:
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except OSError as e:
+            logger.warning("⚠️ Could not write metrics to %s: %s", METRICS_MULTIPROC_DIR, e)
+
+
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except OSError:
+        pass  # the gunicorn master removes its temporary directory first
+
+
+def _start_flusher() -> None:
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _after_fork_in_child() -> None:
+    global _flush_lock
+    _flush_lock = threading.Lock()
+    # The inherited values are the master's, already in its own file. Fresh
+    # locks too: the master's flusher may have held one when it forked.
+    for metric in _REGISTRY:
+        metric._lock = threading.Lock()
+        for child in metric._children.values():
+            child.reset()
+    _start_flusher()
+
+
+if METRICS_MULTIPROC_DIR:
+    # Threads don't survive a fork: each worker starts its own flusher
+    _start_flusher()
+    os.register_at_fork(before=flush, after_in_child=_after_fork_in_child)
+    atexit.register(_flush_at_exit)
+
+
+# ---- Chatbot metrics ----
+STAGE_LATENCY = Histogram(
+    "momochat_stage_duration_seconds",
+    "Time spent in each stage of the /chat pipeline.",
+    labelnames=("stage",),
+)
+AZURE_ATTEMPT_LATENCY = Histogram(
+    "momochat_azure_attempt_duration_seconds",
+    "Duration of each individual Azure OpenAI HTTP attempt.",
+    labelnames=("outcome",),
+)
+AZURE_RETRIES = Counter(
+    "momochat_azure_retries_total",
+    "Azure OpenAI attempts that were retried, by cause.",
+    labelnames=("reason",),
+)
+GENERATION_PROFILES = Counter(
+    "momochat_generation_profiles_total",
+    "Generation profile (max_tokens / deployment tier) chosen per LLM prompt, see generation.py.",
+    labelnames=("profile",),
+)
+GENERATION_LATENCY = Histogram(
+    "momochat_generation_duration_seconds",
+    "Azure generation time (all attempts) per generation profile.",
+    labelnames=("profile",),
+)
+GENERATION_OUTPUT_TOKENS = Histogram(
+    "momochat_generation_output_tokens",
+    "Reply length in tokens per generation profile.",
+    labelnames=("profile",),
+    buckets=(25, 50, 100, 200, 300, 400, 600, 800, 1000, 1200, 1600),
+)
+STAGE_TIMEOUTS = Counter(
+    "momochat_stage_timeouts_total",
+    "Chat pipeline stages that ran over their time limit (retrieval, history, azure).",
+    labelnames=("stage",),
+)
+ABANDONED_REQUESTS = Counter(
+    "momochat_abandoned_requests_total",
+    "Chat requests cancelled because the client disconnected, by endpoint (chat, stream) and stage reached "
+    "(semaphore_wait, azure).",
+    labelnames=("endpoint", "stage"),
+)
+KB_CACHE_HITS = Counter("momochat_kb_cache_hits_total", "KB context lookups served from QUERY_CACHE.")
+KB_CACHE_MISSES = Counter("momochat_kb_cache_misses_total", "KB context lookups that missed QUERY_CACHE.")
+TOKENS = Counter(
+    "momochat_tokens_total",
+    "Tokens counted per /chat request, by kind (input, output, history).",
+    labelnames=("kind",),
+)
+SESSION_EVICTIONS = Counter(
+    "momochat_session_evictions_total",
+    "Chat sessions dropped from the in-process history store, by reason (lru, idle).",
+    labelnames=("reason",),
+)
+HISTORY_TRUNCATIONS = Counter(
+    "momochat_history_truncations_total",
+    "History turns that did not fit the token budget, by action (truncated, dropped).",
+    labelnames=("action",),
+)
+HISTORY_SUMMARIES = Counter(
+    "momochat_history_summaries_total",
+    "Background rolling-summary generations by outcome.",
+    labelnames=("outcome",),
+)
+RETENTION_ROWS = Counter(
+    "momochat_retention_rows_total",
+    "chat_messages rows handled by the retention job, by action (archived, deleted).",
+    labelnames=("action",),
+)
+EXPORT_ROWS = Counter("momochat_export_rows_total", "chat_messages rows streamed by the admin export.")
+PASSWORD_HASH_LATENCY = Histogram(
+    "momochat_password_hash_duration_seconds",
+    "bcrypt hash/verify time including the wait for a hashing worker.",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "momochat_password_hash_rejected_total",
+    "Hash/verify jobs refused because the hashing queue was full.",
+)
+AUTH_CACHE = Counter(
+    "momochat_auth_cache_total",
+    "Auth cache lookups by cache (token, user) and result (hit, miss).",
+    labelnames=("cache", "result"),
+)
+RATE_LIMITED = Counter(
+    "momochat_rate_limited_total",
+    "Chat requests rejected with 429 by the token-bucket limiter, by scope (ip, user, session).",
+    labelnames=("scope",),
+)
+RATE_LIMIT_STORE_ERRORS = Counter(
+    "momochat_rate_limit_store_errors_total",
+    "Rate limit checks let through because the bucket store failed.",
+)
+SHARED_CACHE = Counter(
+    "momochat_shared_cache_total",
+    "Cross-worker cache lookups by cache (kb, response, session) and result (hit, miss, error).",
+    labelnames=("cache", "result"),
+)
+FEE_INTENTS = Counter(
+    "momochat_fee_intents_total",
+    "Fee questions seen by the deterministic calculator, by outcome (answered, or why it fell back to the LLM).",
+    labelnames=("outcome",),
+)
+DIRECT_ANSWERS = Counter(
+    "momochat_direct_answers_total",
+    "Chat replies produced without an Azure call, by kind.",
+    labelnames=("kind",),
+)
+QUICK_ANSWERS = Counter(
+    "momochat_quick_answers_total",
+    "Quick-action messages by pre-generated answer state (fresh, stale: sent while refreshing, miss: LLM path).",
+    labelnames=("result",),
+)
+QUICK_ANSWER_REFRESHES = Counter(
+    "momochat_quick_answer_refreshes_total",
+    "Background (re)generations of quick-action answers by outcome.",
+    labelnames=("outcome",),
+)
+PROCEDURE_LOOKUPS = Counter(
+    "momochat_procedure_lookups_total",
+    "Code/procedure questions seen by the USSD index, by outcome (answered, or why it fell back to the LLM).",
+    labelnames=("outcome",),
+)
+IDEMPOTENCY_KEYS = Counter(
+    "momochat_idempotency_keys_total",
+    "/chat Idempotency-Key lookups and store events (new, joined: waited for the in-flight original, "
+    "replayed, conflict, expired, evicted).",
+    labelnames=("result",),
+)
+CHAT_REQUESTS = Counter(
+    "momochat_chat_requests_total",
+    "Completed /chat requests by outcome.",
+    labelnames=("outcome",),
+)
+
+# Pre-bound children for the hot path
+STAGE_GUEST_CHECK = STAGE_LATENCY.labels("guest_check")
+STAGE_INTENT = STAGE_LATENCY.labels("intent")
+STAGE_RETRIEVAL = STAGE_LATENCY.labels("retrieval")
+STAGE_HISTORY = STAGE_LATENCY.labels("history")
+STAGE_SEMAPHORE_WAIT = STAGE_LATENCY.labels("semaphore_wait")
+STAGE_AZURE = STAGE_LATENCY.labels("azure")
+STAGE_POSTPROCESS = STAGE_LATENCY.labels("postprocess")
+STAGE_TOKEN_COUNT = STAGE_LATENCY.labels("token_count")
+STAGE_PERSISTENCE = STAGE_LATENCY.labels("persistence")
+STAGE_ACCOUNTING = STAGE_LATENCY.labels("accounting")
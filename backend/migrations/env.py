@@ -0,0 +1,52 @@
+"""
+Alembic environment. Uses the application's DATABASE_URL and models, and
+serializes concurrent runs (several workers starting at once) with a
+Postgres advisory lock.
+
+Logging is left to logging_config: calling fileConfig() here would replace
+the application's handlers when migrations run at startup.
+"""
+from alembic import context
+from sqlalchemy import text
+
+from database import engine, Base
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+target_metadata = Base.metadata
+
+# Arbitrary constant shared by every process running migrations
+MIGRATION_LOCK_ID = 720_331
+
+
+def run_migrations_offline() -> None:
+    """Emits the SQL instead of executing it (`alembic upgrade head --sql`)."""
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        is_postgres = connection.dialect.name == "postgresql"
+        if is_postgres:
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+        try:
+            context.configure(connection=connection, target_metadata=target_metadata)
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if is_postgres:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                connection.commit()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
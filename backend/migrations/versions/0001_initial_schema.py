@@ -0,0 +1,55 @@
+"""initial schema (users, chat_messages)
+
+Databases created before migrations existed already have these tables
+(from Base.metadata.create_all), so they are only created when missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # `--sql` (offline) mode cannot inspect; emit the full schema
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.Text(), nullable=False),
+            sa.Column("email", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+
+    if "chat_messages" not in existing:
+        op.create_table(
+            "chat_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_query", sa.Text(), nullable=False),
+            sa.Column("ai_response", sa.Text(), nullable=False),
+            sa.Column("timestamp", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        )
+        op.create_index("ix_chat_messages_id", "chat_messages", ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("chat_messages")
+    op.drop_table("users")
@@ -0,0 +1,45 @@
+"""composite index for per-user history lookups
+
+`WHERE user_id = ? ORDER BY timestamp DESC LIMIT n` becomes an index range
+scan instead of scanning and sorting all of the user's rows.
+
+On Postgres the index is built CONCURRENTLY (outside the migration
+transaction) so chat_messages keeps accepting writes while it builds.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:05:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_chat_messages_user_id_timestamp"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX_NAME, "chat_messages", ["user_id", "timestamp"],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX_NAME, "chat_messages", ["user_id", "timestamp"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX_NAME, table_name="chat_messages",
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(INDEX_NAME, table_name="chat_messages", if_exists=True)
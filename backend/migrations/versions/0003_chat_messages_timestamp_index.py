@@ -0,0 +1,43 @@
+"""time-ordered index on chat_messages
+
+Lets the retention job find and remove one month at a time with short,
+index-bounded batches (`timestamp` range + keyset on (timestamp, id))
+instead of scanning the table.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_chat_messages_timestamp_id"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX_NAME, "chat_messages", ["timestamp", "id"],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX_NAME, "chat_messages", ["timestamp", "id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX_NAME, table_name="chat_messages",
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(INDEX_NAME, table_name="chat_messages", if_exists=True)
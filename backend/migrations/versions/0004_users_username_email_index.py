@@ -0,0 +1,41 @@
+"""index users.username and users.email
+
+Login, token resolution and the signup duplicate check all filter on these
+columns, which were unindexed. Not UNIQUE: existing rows are not guaranteed
+to be free of duplicates.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {"ix_users_username": "username", "ix_users_email": "email"}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES.items():
+            op.create_index(name, "users", [column], if_not_exists=True,
+                            postgresql_concurrently=concurrently)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name="users", if_exists=True,
+                          postgresql_concurrently=concurrently)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from database import Base
 from pydantic import BaseModel
@@ -15,14 +15,22 @@ class ChatMessage(Base):
     
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User")
+
+    # Per-user history (user_id = ? ORDER BY timestamp DESC) and time-ordered
+    # scans for retention; added by migrations 0002 and 0003
+    __table_args__ = (
+        Index("ix_chat_messages_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_chat_messages_timestamp_id", "timestamp", "id"),
+    )
     
     
 class User(Base):
     __tablename__ = "users"  
     
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(Text, nullable=False)
-    email = Column(Text, nullable=False)
+    # Indexed for login / token lookups (migration 0004)
+    username = Column(Text, nullable=False, index=True)
+    email = Column(Text, nullable=False, index=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     
     hashed_password = Column(String, nullable=False)
@@ -0,0 +1,239 @@
+"""
+USSD shortcut / procedure index: "what is the code for X?" answered without the LLM.
+
+At import the KB chunks are scanned for procedure blocks: a header ("How it
+works:", "❖ Repayment Process:", ...) followed by bullet steps, of which at
+least one contains a dial code such as *105# or *105*42#. Each block is stored
+with its service title (the nearest section heading), its steps and codes.
+
+ProcedureIndex.match() only answers questions that ask for a code or procedure
+("code", "composer", "how do I", ...) and whose service terms point at one
+block clearly ahead of the next best one; everything else goes to the LLM.
+"""
+import re
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from kb_config import INITIAL_KB_CHUNKS, STOP_WORDS, normalize_text
+from metrics import PROCEDURE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Best score needed, and how far ahead of the runner-up it must be
+PROCEDURE_MIN_SCORE = 1.0
+PROCEDURE_MIN_MARGIN = 1.3
+MAX_QUESTION_WORDS = 20
+# Longer block headers are sentences ("Dial *105#, then ... include:"), not titles. 8 still
+# names "For balances between 5,000 and 14,999 FCFA", so the PIN reset tiers stay apart.
+MAX_SUBHEADING_WORDS = 8
+
+DIAL_CODE_RE = re.compile(r"\*\d+(?:\*\d+)*#")
+BULLET_RE = re.compile(r"^\s*(?:•|-|→|\d+\))\s*")
+NUMBERED_HEADING_RE = re.compile(r"^\d+\.\s+[A-Z]")
+GENERIC_HEADER_RE = re.compile(
+    r"^(how (it|to) (works?|use)|how it works for|key features|menu option|transactions covered|to use the)",
+    re.IGNORECASE,
+)
+# Words that say nothing about which service is meant
+NOISE_WORDS = STOP_WORDS | {
+    "momo", "mtn", "mobile", "money", "service", "services", "option", "options", "select", "dial",
+    "works", "work", "use", "via", "customer", "customers", "user", "users", "your", "their", "with",
+    "wallet", "code", "codes", "ussd", "access", "how", "it", "process", "steps", "follow", "must", "these",
+}
+
+# Question words (folded) that ask for a code or a procedure
+PROCEDURE_INTENT_RE = re.compile(
+    r"\b(code|codes|ussd|composer|compose|tape|taper|dial|comment|how do|how can|how to|procedure|etapes?"
+    r"|steps?|menu|acceder|access|activer|activate|souscrire|subscribe|faire pour)\b"
+)
+# User vocabulary (French / English, folded) -> words used in the KB titles
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    "envoyer": ("transfer",), "envoi": ("transfer",), "transfert": ("transfer",), "transferer": ("transfer",),
+    "send": ("transfer",), "argent": ("momo",),
+    "retrait": ("withdrawal", "withdrawals"), "retirer": ("withdrawal", "withdrawals"),
+    "withdraw": ("withdrawal", "withdrawals"),
+    "acheter": ("purchase",), "achat": ("purchase",), "buy": ("purchase",),
+    "payer": ("payment",), "paiement": ("payment",), "pay": ("payment",),
+    "depot": ("deposit",), "deposer": ("deposit",),
+    "credit": ("airtime",), "unites": ("airtime",), "forfait": ("bundle",), "forfaits": ("bundle",),
+    "internet": ("bundle",), "data": ("bundle",),
+    "facture": ("bill",), "factures": ("bill",), "electricite": ("e2c", "electricity"),
+    "canal": ("canal",), "tv": ("canal",),
+    "xtracash": ("xtra",), "pret": ("loan",), "emprunt": ("loan",), "emprunter": ("loan",), "borrow": ("loan",),
+    "rembourser": ("repayment",), "remboursement": ("repayment",), "repay": ("repayment",),
+    "solde": ("balance",), "historique": ("history",),
+    "gab": ("atm",), "distributeur": ("atm",),
+    "banque": ("bank",), "bancaire": ("bank",),
+    "international": ("gimacpay",), "etranger": ("gimacpay",), "cemac": ("gimacpay",),
+    "marchand": ("merchant", "momopay"), "commercant": ("merchant", "momopay"), "merchant": ("momopay",),
+    "avance": ("advance",), "souscrire": ("subscribe",),
+    "assurance": ("insurance",), "coupon": ("voucher",), "bon": ("voucher",),
+    "reinitialiser": ("reset",), "oublie": ("reset",), "forgot": ("reset",),
+    "changer": ("reset",), "modifier": ("reset",), "change": ("reset",),
+}
+# Verbs that fit many services ("payer" a bill, a merchant, an insurance...): the terms they
+# stand for count for less than the words naming the service, so "payer chez un marchand" is Momopay
+GENERIC_ALIASES = frozenset({
+    "envoyer", "envoi", "transferer", "send", "retirer", "withdraw", "acheter", "buy",
+    "payer", "paiement", "pay", "changer", "modifier", "change",
+})
+GENERIC_ALIAS_WEIGHT = 0.5
+
+
+class Procedure(NamedTuple):
+    chunk_key: str
+    title: str
+    steps: Tuple[str, ...]
+    codes: Tuple[str, ...]
+    terms: frozenset
+    service_terms: frozenset  # from the section heading alone
+
+
+def terms_of(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", normalize_text(text).replace("²", "2"))
+    return [w for w in words if len(w) > 1 and w not in NOISE_WORDS]
+
+
+def _is_heading(line: str) -> bool:
+    """Service heading: "AIRTIME PURCHASE (Achat Credit)" or "2. P2C (Peer-to-Cash Transfer)"."""
+    text = line.strip()
+    if not text or BULLET_RE.match(line) or text.startswith("Keywords") or text.endswith(":"):
+        return False
+    if NUMBERED_HEADING_RE.match(text):
+        return True
+    # Judged on the part before the parenthesis, which is often in mixed case
+    letters = [c for c in text.split("(")[0] if c.isalpha()]
+    return len(letters) >= 4 and sum(c.isupper() for c in letters) / len(letters) > 0.6
+
+
+def _clean_header(text: str) -> str:
+    return re.sub(r"^\d+\.\s*", "", text.strip().lstrip("❖").strip()).rstrip(":").strip()
+
+
+def extract_procedures(chunk_key: str, text: str) -> List[Procedure]:
+    """
+    Procedure blocks of one chunk. The title is the section heading plus the
+    block header, or the nearest short sub-heading ("Coupon Solution:") when
+    the header is generic ("How It Works:"). Blocks with the same title are merged.
+    """
+    blocks: Dict[str, Tuple[str, List[str], List[str]]] = {}
+    lines = text.splitlines()
+    # top: last upper-case heading; section: that or a numbered heading below it
+    top = section = chunk_key.replace("_", " ").title()
+    sub = None
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if _is_heading(lines[i]):
+            section, sub = _clean_header(line), None
+            if not NUMBERED_HEADING_RE.match(line):
+                top = section
+            i += 1
+            continue
+        is_header = line and not BULLET_RE.match(lines[i]) and (
+            line.endswith(":") or line.startswith("❖") or line.lower().startswith("how")
+        )
+        if not is_header:
+            i += 1
+            continue
+        steps = []
+        j = i + 1
+        while j < len(lines) and (BULLET_RE.match(lines[j]) or (not lines[j].strip() and not steps)):
+            if lines[j].strip():
+                steps.append(BULLET_RE.sub("", lines[j]).strip())
+            j += 1
+        header = _clean_header(line)
+        generic = GENERIC_HEADER_RE.match(header) or len(header.split()) > MAX_SUBHEADING_WORDS
+        if not steps and line.endswith(":") and not generic:
+            sub = header
+            if line.startswith("❖"):
+                # "❖ USSD Code Access:" closes the numbered list above it ("3. Daily Loan")
+                section = top
+        codes = DIAL_CODE_RE.findall(" ".join([line] + steps))
+        if codes and steps:
+            label = sub if generic else header
+            title = f"{section} – {label}" if label else section
+            _, block_steps, block_codes = blocks.setdefault(title, (section, [], []))
+            block_steps.extend(steps)
+            block_codes.extend(codes)
+        i = j
+    return [
+        Procedure(chunk_key, title, tuple(steps), tuple(dict.fromkeys(codes)),
+                  frozenset(terms_of(title)), frozenset(terms_of(section)))
+        for title, (section, steps, codes) in blocks.items()
+    ]
+
+
+class ProcedureIndex:
+    def __init__(self, chunks: Dict[str, str]):
+        self.procedures: List[Procedure] = []
+        for key, text in chunks.items():
+            self.procedures.extend(extract_procedures(key, text))
+        df = Counter(term for p in self.procedures for term in p.terms)
+        n = len(self.procedures)
+        self.idf = {term: math.log(1 + n / count) for term, count in df.items()}
+
+    def rank(self, message: str) -> List[Tuple[float, Procedure]]:
+        # term -> weight: 1 for words of the message and their aliases, less for generic verbs'
+        weights: Dict[str, float] = {}
+        for word in terms_of(message):
+            weights[word] = 1.0
+            alias_weight = GENERIC_ALIAS_WEIGHT if word in GENERIC_ALIASES else 1.0
+            for term in ALIASES.get(word, ()):
+                weights[term] = max(weights.get(term, 0.0), alias_weight)
+        scored = []
+        for p in self.procedures:
+            matched = weights.keys() & p.terms
+            # "historique" alone must not pick "Xtra Cash – Loan History": the service has to be named
+            if matched & p.service_terms:
+                score = sum(self.idf[t] * weights[t] for t in matched) / math.sqrt(len(p.terms))
+                scored.append((score, p))
+        scored.sort(key=lambda x: -x[0])
+        return scored
+
+    def match(self, message: str) -> Tuple[Optional[Procedure], str]:
+        """(procedure, "answered") for a confident match, else (None, reason)."""
+        folded = normalize_text(message)
+        if not PROCEDURE_INTENT_RE.search(folded):
+            return None, "not_procedure"
+        if len(folded.split()) > MAX_QUESTION_WORDS:
+            return None, "too_long"
+        ranked = self.rank(message)
+        if not ranked or ranked[0][0] < PROCEDURE_MIN_SCORE:
+            return None, "no_match"
+        if len(ranked) > 1 and ranked[0][0] < PROCEDURE_MIN_MARGIN * ranked[1][0]:
+            return None, "ambiguous"
+        return ranked[0][1], "answered"
+
+    def __len__(self) -> int:
+        return len(self.procedures)
+
+
+PROCEDURE_INDEX = ProcedureIndex(INITIAL_KB_CHUNKS)
+logger.debug("Procedure index: %d procedures", len(PROCEDURE_INDEX))
+
+
+def is_french(message: str) -> bool:
+    folded = f" {normalize_text(message)} "
+    return any(f" {w} " in folded for w in ("comment", "quel", "quelle", "code pour", "je", "faire", "composer", "pour"))
+
+
+def render_procedure(procedure: Procedure, french: bool) -> str:
+    steps = "\n".join(f"{n}. {step}" for n, step in enumerate(procedure.steps, 1))
+    codes = ", ".join(procedure.codes)
+    # Plain text: direct answers skip format_response and the chat UI shows markdown as typed
+    if french:
+        return f"{procedure.title}\nCode USSD : {codes}\n\nÉtapes :\n{steps}"
+    return f"{procedure.title}\nUSSD code: {codes}\n\nSteps:\n{steps}"
+
+
+def answer_procedure_question(message: str) -> Optional[str]:
+    """Structured procedure for a clear "which code / how do I" question, or None for the LLM."""
+    procedure, outcome = PROCEDURE_INDEX.match(message)
+    if outcome != "not_procedure":
+        PROCEDURE_LOOKUPS.labels(outcome).inc()
+    if procedure is None:
+        return None
+    return render_procedure(procedure, is_french(message))
@@ -0,0 +1,256 @@
+"""
+Pre-generated answers for the quick-action prompts of the chat UI.
+
+The quick-action buttons (react/src/pages/ChatPage.jsx) send fixed prompts, and
+the overview one makes the LLM read the whole KB, the most expensive prompt we
+have. Their answers are generated ahead of time, in the background, once per KB
+version (kb_config.KB_VERSION) and per language, and kept in a local SQLite file
+(QUICK_ANSWERS_DB) shared by the workers on the host and across restarts.
+
+Serving is stale-while-revalidate: a message matching a quick action gets the
+stored answer straight away; if it was generated for an older KB version or is
+older than QUICK_ANSWERS_MAX_AGE_SECONDS it is still sent, and a refresh is
+started in the background. Only the worker that claims the lease regenerates
+an answer, and only when nothing is stored at all does the message take the
+normal LLM path.
+
+QUICK_ACTIONS_FILE may point to a JSON file replacing QUICK_ACTIONS, with the
+same shape: {"action": {"language": ["prompt sent to the LLM", "alias", ...]}}.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import kb_config
+from kb_config import normalize_text
+from metrics import QUICK_ANSWERS, QUICK_ANSWER_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+QUICK_ANSWERS_ENABLED = os.getenv("QUICK_ANSWERS_ENABLED", "true").lower() in ("1", "true", "yes")
+QUICK_ANSWERS_DB = os.getenv("QUICK_ANSWERS_DB", os.path.join(tempfile.gettempdir(), "momochat_quick_answers.db"))
+QUICK_ANSWERS_MAX_AGE_SECONDS = float(os.getenv("QUICK_ANSWERS_MAX_AGE_SECONDS", "86400"))
+# How often the background job looks for missing or stale answers
+QUICK_ANSWERS_CHECK_SECONDS = float(os.getenv("QUICK_ANSWERS_CHECK_SECONDS", "300"))
+# A worker that claimed a refresh and died releases it after this long
+QUICK_ANSWERS_LEASE_SECONDS = 120.0
+
+# The first prompt of each language is the one answered; the others only match
+QUICK_ACTIONS: Dict[str, Dict[str, List[str]]] = {
+    "overview": {
+        "fr": [
+            "Donne-moi un aperçu général des produits et services offerts par MTN MoMo.",
+            "aperçu général", "tous les services", "liste des produits", "que propose momo", "services offerts",
+        ],
+        "en": [
+            "Give me a general overview of the products and services offered by MTN MoMo.",
+            "overview of services", "what does momo offer", "all services",
+        ],
+    },
+    "momo_app": {
+        "fr": ["Comment télécharger et utiliser l’application MTN MoMo App pour payer mes factures et transférer de l’argent ?"],
+    },
+    "xtracash": {
+        "fr": ["Comment puis-je emprunter de l'argent avec MoMo XtraCash?"],
+    },
+    "momo_advance": {
+        "fr": ["Qu’est-ce que MoMo Advance (Avance avec MoMo) et comment l’utiliser?"],
+    },
+    "remittance": {
+        "fr": ["Comment envoyer de l’argent à l’étranger avec MoMo via GIMACPAY ?"],
+    },
+}
+
+
+def load_quick_actions() -> Dict[str, Dict[str, List[str]]]:
+    path = os.getenv("QUICK_ACTIONS_FILE")
+    if not path:
+        return QUICK_ACTIONS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def match_key(message: str) -> str:
+    """Folds case, accents, punctuation and apostrophe variants: "l’argent ?" == "l'argent"."""
+    return re.sub(r"[^a-z0-9]+", " ", normalize_text(message)).strip()
+
+
+class StoredAnswer(NamedTuple):
+    answer: str
+    kb_version: str
+    generated_at: float
+
+
+class QuickAnswerStore:
+    """SQLite table of (action, language) -> answer, with a refresh lease per row."""
+
+    def __init__(self, path: str = QUICK_ANSWERS_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quick_answers ("
+            "action TEXT NOT NULL, lang TEXT NOT NULL, answer TEXT, kb_version TEXT, "
+            "generated_at REAL NOT NULL DEFAULT 0, leased_until REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (action, lang))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process: a connection must not cross a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, action: str, lang: str) -> Optional[StoredAnswer]:
+        row = self._connect().execute(
+            "SELECT answer, kb_version, generated_at FROM quick_answers "
+            "WHERE action = ? AND lang = ? AND answer IS NOT NULL",
+            (action, lang),
+        ).fetchone()
+        return StoredAnswer(*row) if row else None
+
+    def claim(self, action: str, lang: str, lease: float = QUICK_ANSWERS_LEASE_SECONDS) -> bool:
+        """True if this process may regenerate the answer (no other refresh in progress)."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT OR IGNORE INTO quick_answers (action, lang) VALUES (?, ?)", (action, lang))
+        cursor = conn.execute(
+            "UPDATE quick_answers SET leased_until = ? WHERE action = ? AND lang = ? AND leased_until <= ?",
+            (now + lease, action, lang, now),
+        )
+        return cursor.rowcount == 1
+
+    def put(self, action: str, lang: str, answer: str, kb_version: str) -> None:
+        self._connect().execute(
+            "UPDATE quick_answers SET answer = ?, kb_version = ?, generated_at = ?, leased_until = 0 "
+            "WHERE action = ? AND lang = ?",
+            (answer, kb_version, time.time(), action, lang),
+        )
+
+    def release(self, action: str, lang: str) -> None:
+        self._connect().execute(
+            "UPDATE quick_answers SET leased_until = 0 WHERE action = ? AND lang = ?", (action, lang)
+        )
+
+
+class QuickAnswers:
+    """
+    `generate(prompt)` returns the answer to a quick-action prompt as the chat
+    endpoint would give it (main.generate_quick_answer).
+    """
+
+    def __init__(self, generate: Callable[[str], Awaitable[str]], store: Optional[QuickAnswerStore] = None,
+                 actions: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        self.generate = generate
+        self.actions = actions if actions is not None else load_quick_actions()
+        self._store = store
+        self._store_lock = threading.Lock()
+        self._matches: Dict[str, Tuple[str, str]] = {
+            match_key(prompt): (action, lang)
+            for action, languages in self.actions.items()
+            for lang, prompts in languages.items()
+            for prompt in prompts
+        }
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @property
+    def store(self) -> QuickAnswerStore:
+        # Opened on first use, so importing main does not create the file
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = QuickAnswerStore()
+        return self._store
+
+    async def _store_call(self, method: str, *args):
+        """Runs a store method in a thread: the SQLite I/O, and opening the file on first use, stay off the loop."""
+        return await asyncio.to_thread(lambda: getattr(self.store, method)(*args))
+
+    def match(self, message: str) -> Optional[Tuple[str, str]]:
+        return self._matches.get(match_key(message))
+
+    def is_fresh(self, stored: StoredAnswer) -> bool:
+        return (stored.kb_version == kb_config.KB_VERSION
+                and time.time() - stored.generated_at < QUICK_ANSWERS_MAX_AGE_SECONDS)
+
+    async def lookup(self, message: str) -> Optional[str]:
+        """Stored answer for a quick-action message (fresh or stale), or None."""
+        matched = self.match(message)
+        if matched is None:
+            return None
+        try:
+            stored = await self._store_call("get", *matched)
+        except sqlite3.Error as e:
+            logger.warning("Quick answer store read failed (%s)", e)
+            stored = None
+        if stored is None:
+            QUICK_ANSWERS.labels("miss").inc()
+            self.schedule_refresh(*matched)
+            return None
+        if self.is_fresh(stored):
+            QUICK_ANSWERS.labels("fresh").inc()
+        else:
+            QUICK_ANSWERS.labels("stale").inc()
+            self.schedule_refresh(*matched)
+        return stored.answer
+
+    def schedule_refresh(self, action: str, lang: str) -> None:
+        key = (action, lang)
+        if key in self._refreshing:
+            return
+        task = asyncio.get_running_loop().create_task(self.refresh(action, lang))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def refresh(self, action: str, lang: str) -> None:
+        """Regenerates one answer, unless another worker holds the lease or it is already fresh."""
+        try:
+            if not await self._store_call("claim", action, lang):
+                return
+            stored = await self._store_call("get", action, lang)
+            if stored is not None and self.is_fresh(stored):
+                await self._store_call("release", action, lang)
+                return
+        except sqlite3.Error as e:
+            logger.warning("Quick answer store unavailable (%s)", e)
+            return
+
+        kb_version = kb_config.KB_VERSION
+        start = time.perf_counter()
+        try:
+            answer = await self.generate(self.actions[action][lang][0])
+            await self._store_call("put", action, lang, answer, kb_version)
+        except Exception as e:
+            logger.warning("Quick answer %s/%s not refreshed: %s", action, lang, getattr(e, "detail", e))
+            QUICK_ANSWER_REFRESHES.labels("error").inc()
+            try:
+                await self._store_call("release", action, lang)
+            except sqlite3.Error:
+                pass
+            return
+        QUICK_ANSWER_REFRESHES.labels("success").inc()
+        logger.info("⚡ Quick answer %s/%s generated in %.1fs (KB %s)",
+                    action, lang, time.perf_counter() - start, kb_version)
+
+    async def refresh_all(self) -> None:
+        for action, languages in self.actions.items():
+            for lang in languages:
+                await self.refresh(action, lang)
+
+    async def run(self, interval: float = QUICK_ANSWERS_CHECK_SECONDS) -> None:
+        """Background task started by main.py when QUICK_ANSWERS_ENABLED."""
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception:
+                logger.exception("Quick answer refresh failed")
+            await asyncio.sleep(interval)
@@ -0,0 +1,316 @@
+"""
+Token-bucket rate limiting for the chat endpoints.
+
+Every /chat and /chat/stream request takes one token from up to three buckets:
+the client IP, the authenticated user (JWT `sub`, when a bearer token is sent)
+and the chat session. An empty bucket answers 429 with Retry-After before any
+work is done, so one client cannot drain AZURE_SEMAPHORE for everyone else.
+
+The session id comes from the client, so dropping it or making one up would
+give a fresh bucket every request. Requests without a session id we issued
+(session_store.is_issued_session_id) take from the "new_session" bucket of
+their client IP instead, or from one bucket shared by all of them when no
+trusted client IP is configured.
+
+Bucket state lives in a store selected by RATE_LIMIT_STORE:
+  - "memory" (default): sharded in-process dict, per worker
+  - "sqlite:///path/to/buckets.db": shared by all workers on one host
+  - "redis://host:6379/0": shared across hosts (any Redis-compatible server,
+    needs the `redis` package)
+A failing shared store lets requests through (logged and counted) rather than
+taking the chat down with it.
+
+Limits are "<requests per minute>:<burst>" per scope; "0" disables a scope:
+    RATE_LIMIT_IP=60:30  RATE_LIMIT_USER=30:15  RATE_LIMIT_SESSION=20:10
+    RATE_LIMIT_NEW_SESSION=10:5
+
+The IP scope only applies when the client IP comes from a trusted source. In
+production the socket peer is the hosting proxy, so keying on it would put
+every user in one bucket. The sources are:
+  - RATE_LIMIT_PROXY_SECRET: requests from chat-proxy.js (Netlify) carry the
+    browser IP in X-Client-IP, trusted only with this secret in X-Proxy-Secret;
+  - RATE_LIMIT_TRUST_FORWARDED=true: the last X-Forwarded-For hop, when the
+    backend sits behind a single reverse proxy that browsers reach directly
+    (Render's, for the React app calling the API; see render.yaml).
+With neither, only the user and session scopes are enforced, and the new
+session one becomes a single global bucket.
+"""
+import os
+import hmac
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+import auth
+import metrics
+from session_store import is_issued_session_id
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_PATHS = ("/chat", "/chat/stream")
+# Behind a single reverse proxy that browsers reach directly, the client is the last X-Forwarded-For hop
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+# Shared with react/netlify/functions/chat-proxy.js, which forwards the browser IP
+RATE_LIMIT_PROXY_SECRET = os.getenv("RATE_LIMIT_PROXY_SECRET", "")
+CLIENT_IP_HEADER = "X-Client-IP"
+PROXY_SECRET_HEADER = "X-Proxy-Secret"
+# Buckets kept by the memory store; the least recently used one is dropped (i.e. refilled) first
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+RATE_LIMIT_SHARDS = 16
+
+
+class Limit(NamedTuple):
+    rate: float   # tokens per second
+    burst: float  # bucket capacity
+
+
+def parse_limit(spec: str) -> Optional[Limit]:
+    """ "60:30" -> 60 requests/minute with bursts of 30; "60" -> burst 60; "0" -> no limit."""
+    per_minute, _, burst = spec.partition(":")
+    per_minute = float(per_minute)
+    if per_minute <= 0:
+        return None
+    return Limit(per_minute / 60, float(burst) if burst else per_minute)
+
+
+LIMITS: Dict[str, Optional[Limit]] = {
+    "ip": parse_limit(os.getenv("RATE_LIMIT_IP", "60:30")),
+    "user": parse_limit(os.getenv("RATE_LIMIT_USER", "30:15")),
+    "session": parse_limit(os.getenv("RATE_LIMIT_SESSION", "20:10")),
+    # Requests with no session id, or one we didn't issue: per client IP
+    "new_session": parse_limit(os.getenv("RATE_LIMIT_NEW_SESSION", "10:5")),
+}
+
+
+def refill(tokens: float, updated: float, now: float, limit: Limit) -> Tuple[float, float]:
+    """
+    Token-bucket step shared by all stores: returns (tokens left, seconds to wait).
+    A wait of 0 means the request took a token.
+    """
+    tokens = min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.rate
+
+
+class MemoryBucketStore:
+    """
+    In-process buckets, split over `shards` LRU dicts with their own lock so
+    concurrent requests rarely contend. Per worker: with N workers a client
+    effectively gets N times the limit.
+    """
+    blocking = False
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS, shards: int = RATE_LIMIT_SHARDS):
+        self._shards: List["OrderedDict[str, List[float]]"] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._max_per_shard = max(1, max_buckets // shards)
+
+    def take(self, key: str, limit: Limit) -> float:
+        i = hash(key) % len(self._shards)
+        shard = self._shards[i]
+        now = time.monotonic()
+        with self._locks[i]:
+            bucket = shard.get(key)
+            if bucket is None:
+                bucket = shard[key] = [limit.burst, now]
+                if len(shard) > self._max_per_shard:
+                    shard.popitem(last=False)
+            else:
+                shard.move_to_end(key)
+            bucket[0], wait = refill(bucket[0], bucket[1], now, limit)
+            bucket[1] = now
+            return wait
+
+    def clear(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+
+
+class SQLiteBucketStore:
+    """
+    Buckets in a local SQLite file (WAL), so every worker process on the host
+    shares one limit. Each take is a short BEGIN IMMEDIATE transaction.
+    """
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process: a connection must not cross a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def take(self, key: str, limit: Limit) -> float:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = refill(*(row or (limit.burst, now)), now, limit)
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM rate_limit_buckets")
+
+
+# Same step as refill(), atomically on the server; idle buckets expire once full again
+_REDIS_TAKE = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """Buckets on a Redis-compatible server (one Lua script call per take), shared by all hosts."""
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = "momochat:rl:"):
+        import redis  # optional dependency, only needed for this store
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self._script = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key: str, limit: Limit) -> float:
+        return float(self._script(keys=[self.prefix + key], args=[limit.rate, limit.burst, time.time()]))
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+def create_store(url: str = RATE_LIMIT_STORE):
+    if url == "memory":
+        return MemoryBucketStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteBucketStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketStore(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE: {url!r}")
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """The caller's IP from a trusted source, or None: the IP scope is skipped rather than shared by everyone."""
+    if RATE_LIMIT_PROXY_SECRET:
+        secret = request.headers.get(PROXY_SECRET_HEADER, "")
+        if secret and hmac.compare_digest(secret.encode(), RATE_LIMIT_PROXY_SECRET.encode()):
+            return request.headers.get(CLIENT_IP_HEADER, "").strip() or None
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip() or None
+    return None
+
+
+def bearer_subject(request: Request) -> Optional[str]:
+    """Username of a valid bearer token, without touching the database."""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    if not auth.SECRET_KEY:
+        return None
+    return auth.decode_token_username(token)
+
+
+async def session_key(request: Request) -> Optional[str]:
+    """Issued session_id from the JSON body (cached by Starlette, so the endpoint can still read it)."""
+    try:
+        session_id = json.loads(await request.body()).get("session_id")
+    except (ValueError, AttributeError):
+        return None
+    return session_id if is_issued_session_id(session_id) else None
+
+
+class RateLimiter:
+    def __init__(self, store=None, limits: Dict[str, Optional[Limit]] = LIMITS):
+        self.store = store if store is not None else create_store()
+        self.limits = limits
+        if limits.get("ip") and not (RATE_LIMIT_PROXY_SECRET or RATE_LIMIT_TRUST_FORWARDED):
+            logger.info("Rate limit IP scope off: no trusted client IP "
+                        "(set RATE_LIMIT_PROXY_SECRET and/or RATE_LIMIT_TRUST_FORWARDED)")
+
+    async def _take(self, key: str, limit: Limit) -> float:
+        try:
+            if self.store.blocking:
+                return await run_in_threadpool(self.store.take, key, limit)
+            return self.store.take(key, limit)
+        except Exception as e:
+            # Fail open: the limiter must not become the outage
+            logger.warning("Rate limit store error (%s); letting the request through", e)
+            metrics.RATE_LIMIT_STORE_ERRORS.inc()
+            return 0.0
+
+    async def check(self, request: Request) -> Optional[Tuple[str, float]]:
+        """Takes a token per scope; returns (scope, retry_after) for the first empty bucket."""
+        for scope in ("ip", "user", "session"):
+            if scope == "ip":
+                ident = client_ip(request)
+            elif scope == "user":
+                ident = bearer_subject(request)
+            else:
+                ident = await session_key(request)
+                if ident is None:
+                    scope, ident = "new_session", client_ip(request) or "*"
+            limit = self.limits.get(scope)
+            if limit is None or ident is None:
+                continue
+            wait = await self._take(f"{scope}:{ident}", limit)
+            if wait > 0:
+                return scope, wait
+        return None
+
+    async def __call__(self, request: Request, call_next):
+        if request.method != "POST" or request.url.path not in RATE_LIMIT_PATHS:
+            return await call_next(request)
+        throttled = await self.check(request)
+        if throttled is None:
+            return await call_next(request)
+
+        scope, wait = throttled
+        metrics.RATE_LIMITED.labels(scope).inc()
+        logger.warning("Rate limited", extra={"scope": scope, "retry_after_s": round(wait, 2)})
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests, please slow down."},
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
@@ -0,0 +1,288 @@
+"""
+Retention for chat_messages: rows older than RETENTION_DAYS are archived to
+gzip-compressed JSONL, one file per calendar month ("partition"), then removed.
+
+  - Native Postgres partitions named chat_messages_YYYY_MM (if the table has
+    been converted to RANGE partitioning on timestamp) are archived, detached
+    CONCURRENTLY and dropped; upcoming monthly partitions are pre-created.
+  - Otherwise (plain table, SQLite) each month is removed in small
+    index-bounded batches, each in its own short transaction, with a pause
+    in between and a Postgres lock_timeout, so writers are never blocked for long.
+
+A month is only removed once its archive file is complete and fsynced, and a
+re-run after a crash resumes where it stopped. Scheduled runs only happen
+inside RETENTION_WINDOW_HOURS (UTC) and, on Postgres, in one worker at a time.
+
+Usage (from backend/):
+    python -m retention --dry-run
+    python -m retention --days 90 --archive-dir /mnt/archive
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text, tuple_
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+import models
+from metrics import RETENTION_ROWS
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() in ("1", "true", "yes")
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "180"))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "2000"))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.2"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# Off-peak hours (UTC, "start-end", end exclusive) in which scheduled runs may start
+RETENTION_WINDOW_HOURS = os.getenv("RETENTION_WINDOW_HOURS", "1-5")
+# Postgres: give up on a batch rather than queue behind (and block) other writers
+RETENTION_LOCK_TIMEOUT_MS = int(os.getenv("RETENTION_LOCK_TIMEOUT_MS", "2000"))
+
+RETENTION_LOCK_ID = 720_332
+TABLE = models.ChatMessage.__table__
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(ts: datetime) -> datetime:
+    return (ts.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"chat_messages_{start:%Y_%m}"
+
+
+def in_window(now: datetime, window: str = RETENTION_WINDOW_HOURS) -> bool:
+    start, _, end = window.partition("-")
+    start, end = int(start), int(end)
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+def expired_months(conn: Connection, cutoff: datetime) -> List[Tuple[datetime, datetime]]:
+    """Whole calendar months that ended before `cutoff`, oldest first."""
+    oldest = conn.execute(select(func.min(TABLE.c.timestamp))).scalar()
+    months = []
+    if oldest is None:
+        return months
+    start = month_start(oldest)
+    while next_month(start) <= cutoff:
+        months.append((start, next_month(start)))
+        start = next_month(start)
+    return months
+
+
+def is_native_partition(conn: Connection, name: str) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'chat_messages'::regclass AND c.relname = :name"
+    ), {"name": name}).scalar())
+
+
+def ensure_future_partitions(engine: Engine, months_ahead: int = 2) -> None:
+    """Pre-creates the next monthly partitions when chat_messages is natively partitioned."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect() as conn:
+        partitioned = conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('chat_messages')"
+        )).scalar()
+        if not partitioned:
+            return
+        start = month_start(datetime.utcnow())
+        for _ in range(months_ahead + 1):
+            end = next_month(start)
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF chat_messages "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+            start = end
+        conn.commit()
+
+
+def export_month(engine: Engine, start: datetime, end: datetime, archive_dir: Path, batch_size: int) -> Tuple[Path, int]:
+    """
+    Writes the month's rows to chat_messages-YYYY-MM.jsonl.gz (keyset-paginated
+    reads, no long-running transaction). Skipped if the file already exists.
+    """
+    path = archive_dir / f"chat_messages-{start:%Y-%m}.jsonl.gz"
+    if path.exists():
+        return path, 0
+
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".part")
+    written = 0
+    last = None
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+        while True:
+            query = (
+                select(TABLE.c.id, TABLE.c.user_id, TABLE.c.timestamp, TABLE.c.user_query, TABLE.c.ai_response)
+                .where(TABLE.c.timestamp >= start, TABLE.c.timestamp < end)
+                .order_by(TABLE.c.timestamp, TABLE.c.id)
+                .limit(batch_size)
+            )
+            if last is not None:
+                query = query.where(tuple_(TABLE.c.timestamp, TABLE.c.id) > last)
+            with engine.connect() as conn:
+                rows = conn.execute(query).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                fh.write(json.dumps({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "timestamp": row.timestamp.isoformat(),
+                    "user_query": row.user_query,
+                    "ai_response": row.ai_response,
+                }, ensure_ascii=False) + "\n")
+            written += len(rows)
+            last = (rows[-1].timestamp, rows[-1].id)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+    RETENTION_ROWS.labels("archived").inc(written)
+    return path, written
+
+
+def delete_month_batched(engine: Engine, start: datetime, end: datetime, batch_size: int, pause: float) -> int:
+    """Removes the month's rows in short transactions of at most `batch_size` rows."""
+    deleted = 0
+    failures = 0
+    ids_in_batch = (
+        select(TABLE.c.id)
+        .where(TABLE.c.timestamp >= start, TABLE.c.timestamp < end)
+        .order_by(TABLE.c.timestamp, TABLE.c.id)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    while True:
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{RETENTION_LOCK_TIMEOUT_MS}ms'"))
+                count = conn.execute(delete(TABLE).where(TABLE.c.id.in_(ids_in_batch))).rowcount
+        except OperationalError as e:
+            # Lock timeout / busy database: back off instead of waiting in the lock queue
+            failures += 1
+            if failures >= 5:
+                raise
+            logger.warning("Retention batch skipped (%s); backing off", e.orig)
+            time.sleep(pause * 10 * failures)
+            continue
+        failures = 0
+        deleted += count
+        RETENTION_ROWS.labels("deleted").inc(count)
+        if count < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def drop_native_partition(engine: Engine, name: str) -> None:
+    """DETACH ... CONCURRENTLY (no ACCESS EXCLUSIVE lock on the parent), then drop."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"SET lock_timeout = '{RETENTION_LOCK_TIMEOUT_MS}ms'"))
+        conn.execute(text(f"ALTER TABLE chat_messages DETACH PARTITION {name} CONCURRENTLY"))
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def run_retention(engine: Engine, days: int = RETENTION_DAYS, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                  batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE_SECONDS,
+                  dry_run: bool = False) -> List[dict]:
+    """Archives and removes every whole month older than `days`. Returns one summary per month."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    with engine.connect() as conn:
+        months = expired_months(conn, cutoff)
+
+    summaries = []
+    for start, end in months:
+        name = partition_name(start)
+        with engine.connect() as conn:
+            native = is_native_partition(conn, name)
+            rows = conn.execute(
+                select(func.count()).select_from(TABLE).where(TABLE.c.timestamp >= start, TABLE.c.timestamp < end)
+            ).scalar()
+        summary = {"month": f"{start:%Y-%m}", "rows": rows, "native_partition": native}
+        if dry_run:
+            summaries.append(summary)
+            continue
+
+        path, archived = export_month(engine, start, end, Path(archive_dir), batch_size)
+        if native:
+            drop_native_partition(engine, name)
+            RETENTION_ROWS.labels("deleted").inc(rows)
+            deleted = rows
+        else:
+            deleted = delete_month_batched(engine, start, end, batch_size, pause)
+        summary.update({"archive": str(path), "archived": archived, "deleted": deleted})
+        logger.info("🗄️ Retention: archived and removed %s", summary["month"], extra=summary)
+        summaries.append(summary)
+
+    ensure_future_partitions(engine)
+    return summaries
+
+
+def _try_lock(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return True
+    return bool(conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": RETENTION_LOCK_ID}).scalar())
+
+
+def run_scheduled_retention(engine: Engine) -> Optional[List[dict]]:
+    """One scheduled pass: only inside the off-peak window and only in one process."""
+    if not in_window(datetime.utcnow()):
+        return None
+    with engine.connect() as lock_conn:
+        if not _try_lock(lock_conn):
+            return None
+        try:
+            return run_retention(engine)
+        finally:
+            if lock_conn.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": RETENTION_LOCK_ID})
+
+
+async def retention_loop(engine: Engine, interval: float = RETENTION_INTERVAL_SECONDS) -> None:
+    """Background task started by main.py when RETENTION_ENABLED; the work runs in a thread."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_scheduled_retention, engine)
+        except Exception:
+            logger.exception("Retention run failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS)
+    parser.add_argument("--dry-run", action="store_true", help="only list the months that would be archived")
+    args = parser.parse_args()
+
+    from database import engine
+    summaries = run_retention(engine, args.days, args.archive_dir, args.batch_size, args.pause, args.dry_run)
+    if not summaries:
+        print(f"Nothing older than {args.days} days.")
+    for s in summaries:
+        print(json.dumps(s, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
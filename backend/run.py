@@ -1,8 +1,15 @@
+import os
+import sys
 import uvicorn
 
+# Worker processes; >1 runs gunicorn with uvicorn workers and a preloaded KB (see gunicorn.conf.py)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
 if __name__ == "__main__":
+    if WEB_CONCURRENCY > 1:
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"])
     uvicorn.run(
         "main:app",
         host="0.0.0.0", 
-        port=8000,
-    )
\ No newline at end of file
+        port=int(os.getenv("PORT", "8000")),
+    )
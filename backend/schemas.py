@@ -19,8 +19,12 @@ class Token(BaseModel):
 class ChatRequest(BaseModel):
     """Schema for the incoming chat request from the frontend."""
     message: str
+    session_id: Optional[str] = None
+    # Procedure answers: have the LLM reword the structured steps (None: PROCEDURE_REPHRASE)
+    rephrase: Optional[bool] = None
 
 class ChatResponse(BaseModel):
     """Schema for the outgoing chat response to the frontend."""
     response: str
-    source: Optional[str] = None    
\ No newline at end of file
+    source: Optional[str] = None
+    session_id: Optional[str] = None    
\ No newline at end of file
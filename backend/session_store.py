@@ -0,0 +1,257 @@
+import os
+import re
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, List, NamedTuple, Optional, Tuple
+
+from metrics import SESSION_EVICTIONS, HISTORY_TRUNCATIONS
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+# Turns kept per session; which of them reach the prompt is decided by the token budget
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+# A truncated reply shorter than this carries no useful context; drop the turn instead
+MIN_TRUNCATED_REPLY_TOKENS = 40
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+# Signs the session ids we issue, so made-up ones are told apart (rate_limit.py counts them as new
+# sessions). Must be the same in every worker: the per-process fallback only holds under preload_app.
+SESSION_ID_SECRET = (os.getenv("SESSION_ID_SECRET") or os.getenv("SECRET_KEY") or secrets.token_hex(32)).encode()
+
+
+def _session_signature(nonce: str) -> str:
+    return hmac.new(SESSION_ID_SECRET, nonce.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def new_session_id() -> str:
+    """32 hex chars: a random half and its signature."""
+    nonce = secrets.token_hex(8)
+    return nonce + _session_signature(nonce)
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and _SESSION_ID_RE.match(session_id) is not None
+
+
+def is_issued_session_id(session_id: Optional[str]) -> bool:
+    """A session id this server handed out (signature checks), not one the client picked."""
+    return is_valid_session_id(session_id) and hmac.compare_digest(
+        session_id[16:], _session_signature(session_id[:16]))
+
+
+class HistoryTurn(NamedTuple):
+    user_query: str
+    ai_response: str
+    user_tokens: int
+    ai_tokens: int
+
+
+def truncate_to_tokens(text: str, tokens: int, max_tokens: int) -> str:
+    """
+    Cuts `text` (known to be `tokens` long) down to roughly `max_tokens`,
+    scaling by characters so no re-encoding is needed, and ends on a line or word.
+    """
+    if tokens <= max_tokens:
+        return text
+    cut = int(len(text) * max_tokens / tokens)
+    head = text[:cut]
+    boundary = max(head.rfind("\n"), head.rfind(" "))
+    if boundary > cut // 2:
+        head = head[:boundary]
+    return head.rstrip() + " …"
+
+
+class _Session:
+    __slots__ = ("last_seen", "version", "turns", "summary", "summary_tokens", "overflow", "summarizing")
+
+    def __init__(self, max_turns: int):
+        self.last_seen = 0.0
+        # Bumped on every change; tells a newer snapshot from another worker (see restore)
+        self.version = 0
+        self.turns: Deque[HistoryTurn] = deque(maxlen=max_turns)
+        self.summary: Optional[str] = None
+        self.summary_tokens = 0
+        # Turns that fell out of `turns` and are not yet folded into `summary`
+        self.overflow: List[HistoryTurn] = []
+        self.summarizing = False
+
+
+class SessionHistoryStore:
+    """
+    In-process conversation memory keyed by session id.
+    Keeps the last `max_turns` exchanges per session (with their token counts),
+    evicts the least recently used session past `max_sessions` and drops
+    sessions idle for longer than `idle_ttl` seconds.
+
+    With `keep_overflow`, turns pushed out of the window are queued so a
+    background job can fold them into a rolling summary (see take_overflow /
+    set_summary).
+    """
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS,
+                 idle_ttl: float = SESSION_IDLE_TTL_SECONDS,
+                 max_turns: int = SESSION_MAX_TURNS,
+                 keep_overflow: bool = False):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.keep_overflow = keep_overflow
+        # Ordered by last access, oldest first
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        """Drops idle sessions; they sit at the front since order follows last access."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            SESSION_EVICTIONS.labels("idle").inc()
+
+    def _touch(self, session_id: str, now: float) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if now - session.last_seen > self.idle_ttl:
+            del self._sessions[session_id]
+            SESSION_EVICTIONS.labels("idle").inc()
+            return None
+        session.last_seen = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get(self, session_id: str) -> List[HistoryTurn]:
+        """Returns all kept exchanges of the session, oldest first."""
+        with self._lock:
+            session = self._touch(session_id, time.monotonic())
+            return list(session.turns) if session else []
+
+    def get_context(self, session_id: str, token_budget: int = HISTORY_TOKEN_BUDGET) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        Returns (summary, [(user_query, ai_response), ...]) fitted into `token_budget`.
+        The newest turns win; the oldest turn that only partly fits gets its
+        reply truncated, anything older is left to the summary.
+        """
+        with self._lock:
+            session = self._touch(session_id, time.monotonic())
+            if session is None:
+                return None, []
+            turns = list(session.turns)
+            summary, summary_tokens = session.summary, session.summary_tokens
+
+        budget = token_budget
+        if summary and summary_tokens <= budget // 3:
+            budget -= summary_tokens
+        else:
+            summary = None
+
+        selected = []
+        for turn in reversed(turns):
+            cost = turn.user_tokens + turn.ai_tokens
+            if cost <= budget:
+                selected.append((turn.user_query, turn.ai_response))
+                budget -= cost
+                continue
+            reply_budget = budget - turn.user_tokens
+            if reply_budget >= MIN_TRUNCATED_REPLY_TOKENS:
+                selected.append((turn.user_query, truncate_to_tokens(turn.ai_response, turn.ai_tokens, reply_budget)))
+                HISTORY_TRUNCATIONS.labels("truncated").inc()
+            else:
+                HISTORY_TRUNCATIONS.labels("dropped").inc()
+            break
+        selected.reverse()
+        return summary, selected
+
+    def append(self, session_id: str, user_query: str, ai_response: str,
+               user_tokens: int = 0, ai_tokens: int = 0) -> bool:
+        """
+        Records a completed exchange. Returns True when older turns are
+        waiting to be summarized and no summary job is running for the session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or _Session(self.max_turns)
+            if self.keep_overflow and len(session.turns) == self.max_turns:
+                session.overflow.append(session.turns[0])
+                # Bounded even if summaries keep failing
+                del session.overflow[:-self.max_turns]
+            session.turns.append(HistoryTurn(user_query, ai_response, user_tokens, ai_tokens))
+            session.version += 1
+            session.last_seen = now
+            self._sessions[session_id] = session
+
+            self._expire(now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                SESSION_EVICTIONS.labels("lru").inc()
+            return bool(session.overflow) and not session.summarizing
+
+    def take_overflow(self, session_id: str) -> Optional[Tuple[Optional[str], List[HistoryTurn]]]:
+        """Claims the session's pending overflow for summarizing: (previous summary, turns)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.summarizing or not session.overflow:
+                return None
+            session.summarizing = True
+            turns, session.overflow = session.overflow, []
+            return session.summary, turns
+
+    def set_summary(self, session_id: str, summary: Optional[str], summary_tokens: int = 0,
+                    unsummarized: Optional[List[HistoryTurn]] = None) -> None:
+        """Stores a new rolling summary (None keeps the old one and re-queues `unsummarized`)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            session.summarizing = False
+            if summary is not None:
+                session.summary, session.summary_tokens = summary, summary_tokens
+                session.version += 1
+            elif unsummarized:
+                session.overflow = (unsummarized + session.overflow)[-self.max_turns:]
+
+    def snapshot(self, session_id: str) -> Optional[dict]:
+        """JSON-serializable copy of the session's turns and summary, for other workers."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return {
+                "version": session.version,
+                "summary": session.summary,
+                "summary_tokens": session.summary_tokens,
+                "turns": [list(turn) for turn in session.turns],
+            }
+
+    def restore(self, session_id: str, snapshot: dict) -> bool:
+        """Replaces the local copy with `snapshot` if it is newer (the session moved workers)."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.version >= snapshot["version"]:
+                return False
+            restored = _Session(self.max_turns)
+            restored.version = snapshot["version"]
+            restored.summary, restored.summary_tokens = snapshot["summary"], snapshot["summary_tokens"]
+            restored.turns.extend(HistoryTurn(*turn) for turn in snapshot["turns"])
+            restored.last_seen = now
+            if session is not None:
+                restored.overflow = session.overflow
+                del self._sessions[session_id]
+            self._sessions[session_id] = restored
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                SESSION_EVICTIONS.labels("lru").inc()
+            return True
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
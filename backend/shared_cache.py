@@ -0,0 +1,114 @@
+"""
+Optional cache shared by all workers (see gunicorn.conf.py), selected by SHARED_CACHE_URL:
+  - unset (default): no shared cache, every worker only has its in-process caches
+  - "sqlite:///path/to/cache.db": a local file (WAL), shared by the workers on one host
+  - "redis://host:6379/0": a local or remote Redis-compatible server (needs `redis`)
+
+Used as a second level behind QUERY_CACHE, for whole responses to identical
+prompts and for session history, so a conversation keeps its context whichever
+worker serves the next turn. Values are strings with a TTL. Every call is
+short-timeout and fail-soft: an error counts as a miss and is logged, never raised.
+Calls block (SQLite or network I/O): async code runs them in a thread.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+from metrics import SHARED_CACHE
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+SHARED_CACHE_TTL_SECONDS = float(os.getenv("SHARED_CACHE_TTL_SECONDS", "3600"))
+# Expired rows are purged by the SQLite cache every this many writes
+SQLITE_PURGE_EVERY = 1000
+
+
+class SQLiteSharedCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process: a connection must not cross a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=0.05, isolation_level=None)
+            self._local.conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM shared_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO shared_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, value, now + ttl))
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+
+
+class RedisSharedCache:
+    def __init__(self, url: str, prefix: str = "momochat:cache:"):
+        import redis  # optional dependency, only needed for this backend
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.1)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._client.set(self.prefix + key, value.encode("utf-8"), px=int(ttl * 1000))
+
+
+def create_shared_cache(url: str = SHARED_CACHE_URL):
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteSharedCache(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedCache(url)
+    raise ValueError(f"Unsupported SHARED_CACHE_URL: {url!r}")
+
+
+SHARED = create_shared_cache()
+
+
+def cache_get(cache: str, key: str) -> Optional[str]:
+    """Looks `key` up in the shared cache; `cache` only labels the metrics."""
+    if SHARED is None:
+        return None
+    try:
+        value = SHARED.get(f"{cache}:{key}")
+    except Exception as e:
+        logger.warning("Shared cache read failed (%s)", e)
+        SHARED_CACHE.labels(cache, "error").inc()
+        return None
+    SHARED_CACHE.labels(cache, "hit" if value is not None else "miss").inc()
+    return value
+
+
+def cache_set(cache: str, key: str, value: str, ttl: float = SHARED_CACHE_TTL_SECONDS) -> None:
+    if SHARED is None:
+        return
+    try:
+        SHARED.set(f"{cache}:{key}", value, ttl)
+    except Exception as e:
+        logger.warning("Shared cache write failed (%s)", e)
+        SHARED_CACHE.labels(cache, "error").inc()
@@ -5,6 +5,9 @@
 // We retrieve the external backend URL from Netlify's environment variables.
 
 const BACKEND_URL = process.env.VITE_BASE_API_URL; 
+// Same value as the backend's RATE_LIMIT_PROXY_SECRET: lets it rate limit on the browser IP
+// forwarded below instead of this function's IP, shared by every user
+const PROXY_SECRET = process.env.RATE_LIMIT_PROXY_SECRET;
 
 exports.handler = async (event, context) => {
     
@@ -32,6 +35,12 @@ exports.handler = async (event, context) => {
             // Forward the original request headers for content type
             headers: {
                 'Content-Type': 'application/json',
+                // Lets the backend answer a retried message once (Netlify lower-cases header names)
+                ...(event.headers['idempotency-key'] && { 'Idempotency-Key': event.headers['idempotency-key'] }),
+                ...(PROXY_SECRET && {
+                    'X-Proxy-Secret': PROXY_SECRET,
+                    'X-Client-IP': event.headers['x-nf-client-connection-ip'] || '',
+                }),
             },
             body: event.body, // The JSON payload (user message) from the React app
         });
@@ -123,6 +123,8 @@ function ChatPage() {
     const [showQuickActions, setShowQuickActions] = useState(true);
     const [isLoading, setIsLoading] = useState(false);
     const chatHistoryRef = useRef(null);
+    // Issued by the API on the first reply; keeps the backend history scoped to this conversation
+    const sessionIdRef = useRef(null);
 
     useEffect(() => {
         // Scroll to the latest message whenever messages change
@@ -143,16 +145,20 @@ function ChatPage() {
         setInputText("");
         setIsLoading(true);
 
+        // One key per message: a resubmission (proxy or browser retry) gets the first answer back
+        const idempotencyKey = crypto.randomUUID();
+
         try {
             const response = await fetch(CHAT_API_URL, {
                 method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ message: text }),
+                headers: { "Content-Type": "application/json", "Idempotency-Key": idempotencyKey },
+                body: JSON.stringify({ message: text, session_id: sessionIdRef.current }),
             });
 
             if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
 
             const data = await response.json();
+            if (data.session_id) sessionIdRef.current = data.session_id;
             const botResponseText = data.response || "Oops, I couldn't find an answer. Please, try rephrasing.";
 
             const newBotMessage = { id: Date.now() + 1, text: botResponseText, sender: "bot" };